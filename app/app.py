@@ -1,12 +1,45 @@
+import contextlib
+from collections.abc import AsyncIterator
+
 from fastapi import FastAPI
 
+from app.constants import APP_PATH, TEMPLATES
 from app.routes.api import api_router
 from app.routes.website import website_router
+from app.utils.dataset_mirror import public_dataset_urls
+from app.utils.http import build_fingerprint
+from app.utils.templates import precompile_templates
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    precompile_templates(TEMPLATES.env)
+    if app.state.repository_snapshot is not None:
+        await app.state.repository_snapshot.start()
+    await app.state.leaderboards.rebuild_all()
+    if app.state.dataset_mirror is not None:
+        for competition in await app.state.repos.data_repository.get_competitions():
+            app.state.dataset_mirror.mirror(public_dataset_urls(competition))
+    if app.state.scoring_workers is not None:
+        app.state.scoring_workers.start()
+    yield
+    if app.state.scoring_workers is not None:
+        await app.state.scoring_workers.stop()
+    if app.state.repository_snapshot is not None:
+        await app.state.repository_snapshot.stop()
+    await app.state.target_indexes.close()
+    if app.state.dataset_mirror is not None:
+        await app.state.dataset_mirror.close()
+    await app.state.dataset_fetcher.close()
+    await app.state.repos.data_repository.close()
+
 
 app = FastAPI(
     title="Data Hackathon API",
     version="0.0.1",
     description="API to serve and document Data Hackathons",
+    lifespan=lifespan,
 )
+app.state.build_fingerprint = build_fingerprint(APP_PATH)  # once, when the app starts
 app.include_router(website_router)
 app.include_router(api_router)
@@ -1,9 +1,42 @@
 from app.app import app
-from app.constants import ROOT_PATH
+from app.constants import ROOT_PATH, TEMPLATES
 from app.security.common import create_security_handler
 from app.settings import Settings
+from app.utils.dataset_cache import create_dataset_cache
+from app.utils.dataset_mirror import create_dataset_mirror
+from app.utils.fetcher import create_dataset_fetcher
+from app.utils.job_queue import ScoringWorkers, create_scoring_queue
+from app.utils.leaderboard import Leaderboards
 from app.utils.repositories import create_repositories
+from app.utils.snapshot import create_repository_snapshot
+from app.utils.target_index import TargetIndexCache
+from app.utils.templates import FragmentCache, create_bytecode_cache
 
 settings = Settings(_env_file=ROOT_PATH / ".env", _env_file_encoding="utf-8")  # typing: ignore
+app.state.settings = settings
+TEMPLATES.env.bytecode_cache = create_bytecode_cache(settings)
+TEMPLATES.env.auto_reload = settings.TEMPLATES_AUTO_RELOAD
 app.state.security_handler = create_security_handler(settings)
 app.state.repos = create_repositories(settings)
+app.state.repository_snapshot = create_repository_snapshot(settings, repository=app.state.repos.data_repository)
+app.state.dataset_fetcher = create_dataset_fetcher(settings)
+app.state.dataset_cache = create_dataset_cache(settings, fetcher=app.state.dataset_fetcher)
+app.state.dataset_mirror = create_dataset_mirror(settings, fetcher=app.state.dataset_fetcher)
+app.state.target_indexes = TargetIndexCache(app.state.dataset_cache)
+app.state.leaderboards = Leaderboards(
+    data_repository=app.state.repos.data_repository, max_age_seconds=settings.LEADERBOARD_MAX_AGE_SECONDS
+)
+app.state.fragments = FragmentCache()
+app.state.scoring_queue = create_scoring_queue(settings)
+app.state.scoring_workers = (
+    None
+    if app.state.scoring_queue is None
+    else ScoringWorkers(
+        queue=app.state.scoring_queue,
+        data_repository=app.state.repos.data_repository,
+        target_indexes=app.state.target_indexes,
+        leaderboards=app.state.leaderboards,
+        n_processes=settings.SCORING_WORKERS,
+        poll_seconds=settings.SCORING_POLL_SECONDS,
+    )
+)
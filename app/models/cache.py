@@ -0,0 +1,16 @@
+from pydantic import BaseModel, computed_field
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
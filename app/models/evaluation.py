@@ -1,33 +1,155 @@
 import dataclasses
 from collections.abc import Callable
 from enum import Enum
+from functools import cached_property
 
-import pandas as pd
-from pydantic import BaseModel
+import numpy as np
+from pydantic import BaseModel, Field
+
+ScoreType = float | np.ndarray  # one score per row of predictions
 
 
 class EvaluationMetric(str, Enum):
     RMSE = "rmse"
+    MAE = "mae"
+    MAPE = "mape"
+    R2 = "r2"
+    LOG_LOSS = "log_loss"
+    ACCURACY = "accuracy"
+    F1 = "f1"
+    ROC_AUC = "roc_auc"
 
 
 class EvaluationConfig(BaseModel):
     metric: EvaluationMetric
+    secondary_metrics: list[EvaluationMetric] = Field(default=[])
     feature_dataset_url: str
     target_dataset_url: str
 
+    @property
+    def metrics(self) -> list[EvaluationMetric]:
+        """Primary metric first, followed by the secondary ones"""
+        return list(dict.fromkeys([self.metric, *self.secondary_metrics]))
+
+
+class MetricInputs:
+    """
+    Predictions and actual values as float arrays, along with the intermediate results needed
+    by the metrics. Intermediates are computed lazily and only once, so scoring several related
+    metrics (e.g. rmse, mae and r2 all need the residuals) costs a single pass over the data.
+
+    Predictions can be a single vector, or a 2D array with a vector per row, in which case
+    every metric returns a score per row.
+    Classification metrics expect binary (0/1) actual values and predicted probabilities of 1.
+    """
+
+    def __init__(self, pred: np.ndarray, actual: np.ndarray) -> None:
+        self.pred = np.asarray(pred, dtype=np.float64)
+        self.actual = np.asarray(actual, dtype=np.float64)
+
+    @cached_property
+    def residuals(self) -> np.ndarray:
+        return self.pred - self.actual
+
+    @cached_property
+    def abs_residuals(self) -> np.ndarray:
+        return np.abs(self.residuals)
+
+    @cached_property
+    def sum_squared_residuals(self) -> ScoreType:
+        return np.einsum("...i,...i->...", self.residuals, self.residuals)
+
+    @cached_property
+    def total_sum_of_squares(self) -> float:
+        centered = self.actual - self.actual.mean()
+        return float(centered @ centered)
+
+    @cached_property
+    def actual_labels(self) -> np.ndarray:
+        return self.actual >= 0.5
+
+    @cached_property
+    def pred_labels(self) -> np.ndarray:
+        return self.pred >= 0.5
+
+    @cached_property
+    def true_positives(self) -> ScoreType:
+        return (self.pred_labels & self.actual_labels).sum(axis=-1)
+
+    @cached_property
+    def n_correct(self) -> ScoreType:
+        return (self.pred_labels == self.actual_labels).sum(axis=-1)
+
 
 @dataclasses.dataclass
 class EvaluationMetricLogic:
     sort_multiplier: int  # -1: lower=better, +1: higher=better
-    func: Callable[[pd.Series, pd.Series], float]
+    func: Callable[[MetricInputs], ScoreType]
+
+
+def _rmse_func(x: MetricInputs) -> ScoreType:
+    return np.sqrt(x.sum_squared_residuals / x.actual.size)
+
+
+def _mae_func(x: MetricInputs) -> ScoreType:
+    return x.abs_residuals.mean(axis=-1)
+
+
+def _mape_func(x: MetricInputs) -> ScoreType:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (x.abs_residuals / np.abs(x.actual)).mean(axis=-1)
+
+
+def _r2_func(x: MetricInputs) -> ScoreType:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - x.sum_squared_residuals / x.total_sum_of_squares
+
+
+def _log_loss_func(x: MetricInputs) -> ScoreType:
+    eps = np.finfo(np.float64).eps
+    proba = np.clip(x.pred, eps, 1 - eps)
+    return -np.where(x.actual_labels, np.log(proba), np.log1p(-proba)).mean(axis=-1)
+
+
+def _accuracy_func(x: MetricInputs) -> ScoreType:
+    return x.n_correct / x.actual.size
+
+
+def _f1_func(x: MetricInputs) -> ScoreType:
+    # 2TP / (2TP + FP + FN) where FP + FN = n - correct
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 2 * x.true_positives / (2 * x.true_positives + x.actual.size - x.n_correct)
+
+
+def _average_ranks(values: np.ndarray) -> np.ndarray:
+    """1-based ranks, ties get the average of the ranks they span"""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    return (ends - (counts - 1) / 2)[inverse]
+
 
+def _roc_auc_func(x: MetricInputs) -> ScoreType:
+    # Mann-Whitney U statistic, normalised
+    n_pos = int(x.actual_labels.sum())
+    n_neg = x.actual.size - n_pos
+    if not n_pos or not n_neg:
+        return np.full(x.pred.shape[:-1], np.nan) if x.pred.ndim > 1 else np.nan
 
-def _rmse_func(pred: pd.Series, actual: pd.Series) -> float:
-    return ((pred - actual) ** 2).mean() ** 0.5
+    pred_2d = x.pred.reshape(-1, x.actual.size)
+    pos_rank_sums = np.array([_average_ranks(row)[x.actual_labels].sum() for row in pred_2d])
+    auc = (pos_rank_sums - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+    return auc.reshape(x.pred.shape[:-1]) if x.pred.ndim > 1 else auc[0]
 
 
 METRIC_LOGIC_MAP: dict[EvaluationMetric, EvaluationMetricLogic] = {
     EvaluationMetric.RMSE: EvaluationMetricLogic(func=_rmse_func, sort_multiplier=-1),
+    EvaluationMetric.MAE: EvaluationMetricLogic(func=_mae_func, sort_multiplier=-1),
+    EvaluationMetric.MAPE: EvaluationMetricLogic(func=_mape_func, sort_multiplier=-1),
+    EvaluationMetric.R2: EvaluationMetricLogic(func=_r2_func, sort_multiplier=1),
+    EvaluationMetric.LOG_LOSS: EvaluationMetricLogic(func=_log_loss_func, sort_multiplier=-1),
+    EvaluationMetric.ACCURACY: EvaluationMetricLogic(func=_accuracy_func, sort_multiplier=1),
+    EvaluationMetric.F1: EvaluationMetricLogic(func=_f1_func, sort_multiplier=1),
+    EvaluationMetric.ROC_AUC: EvaluationMetricLogic(func=_roc_auc_func, sort_multiplier=1),
 }
 
 # check no missing mappings
@@ -0,0 +1,24 @@
+from enum import Enum
+from typing import TypeAlias
+
+from pydantic import BaseModel
+
+ScoringJobId: TypeAlias = str
+
+
+class ScoringJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ScoringJob(BaseModel):
+    id: ScoringJobId
+    competition_id: str
+    participant_id: str
+    submission_name: str
+    status: ScoringJobStatus
+    attempts: int = 0
+    score: float | None = None
+    error: str | None = None
@@ -1,13 +1,17 @@
 from pydantic import BaseModel, Field
 
+from app.models.evaluation import EvaluationMetric
+
 
 class LeaderBoardRow(BaseModel):
     position: int
     participant_name: str
     best_submission_name: str
     best_submission_score: float
+    best_submission_secondary_scores: dict[EvaluationMetric, float] = Field(default={})
     n_entries: int
 
 
 class LeaderBoard(BaseModel):
     rows: list[LeaderBoardRow] = Field(default=[])
+    n_participants: int = 0
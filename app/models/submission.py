@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.models.evaluation import EvaluationMetric
 
 
 class Submission(BaseModel):
@@ -8,8 +10,25 @@ class Submission(BaseModel):
     predictions: dict
 
 
+class BatchSubmissionEntry(BaseModel):
+    name: str
+    predictions: dict
+
+
+class BatchSubmission(BaseModel):
+    competition_id: str
+    participant_id: str
+    submissions: list[BatchSubmissionEntry] = Field(min_length=1)
+
+
 class SubmissionResult(BaseModel):
     competition_id: str
     participant_id: str
     submission_name: str
     score: float
+    secondary_scores: dict[EvaluationMetric, float] = Field(default={})
+
+
+class SubmissionResultPage(BaseModel):
+    results: list[SubmissionResult]
+    continuation_token: str | None = None
@@ -1,26 +1,110 @@
+import asyncio
+import base64
 import contextlib
 import datetime as dt
-from collections.abc import Callable
+import json
+import logging
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable, Coroutine
 from typing import Any, TypeAlias
 
-from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.core.async_paging import AsyncItemPaged
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceNotFoundError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
 from azure.data.tables.aio import TableClient, TableServiceClient
 
 from app.models.competiton import Competition, CompetitionId
 from app.models.participant import Participant, ParticipantId
-from app.models.submission import SubmissionResult
-from app.repositories.common import CompetitionExists
+from app.models.submission import SubmissionResult, SubmissionResultPage
+from app.repositories.common import INITIAL_VERSION, CompetitionExists, InvalidContinuationToken, new_version
 
 TableServiceClientFactoryType: TypeAlias = Callable[[], TableServiceClient]
+PendingWrite: TypeAlias = tuple[list[dict], "asyncio.Future[None] | None", int]  # entities, written, attempts
 
+logger = logging.getLogger(__name__)
 
 ALL = "all"
+MAX_TRANSACTION_SIZE = 100  # limit of entities in an Azure Table transaction
+MAX_WRITE_ATTEMPTS = 5  # of buffered results that are not waited for
 
 
 class TableNames:
     PARTICIPANT = "participant"
     COMPETITION = "competition"
     SUBMISSION_RESULT = "submissionresult"
+    VERSION = "version"
+
+
+# Submission results are stored with a time based row key, so they are listed in the order they were
+# stored and can be queried by time range. Each is also stored, in the same partition, under a key
+# prefixed by its participant id, so a participant's history can be queried as a range as well.
+# The index keys sort after all the time based ones.
+RESULTS_ROW_KEY_PREFIX = ""
+PARTICIPANT_ROW_KEY_PREFIX = "~participant|"
+ROW_KEY_PREFIX_END = "~"
+
+
+def submission_row_key(at: dt.datetime, seq: int = 0, unique: bool = True) -> str:
+    """
+    Sorts as the `isoformat()` row keys of results stored before the key scheme was introduced.
+    Results stored at the same time (e.g. in a batch) are ordered by `seq`, the random suffix only
+    keeps the keys of different writers apart.
+    """
+    key = at.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return f"{key}_{seq:06d}_{uuid.uuid4().hex[:12]}" if unique else key
+
+
+def submission_row_key_time(row_key: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(row_key.removeprefix(RESULTS_ROW_KEY_PREFIX).split("_")[0])
+
+
+def participant_row_key(participant_id: ParticipantId, row_key: str) -> str:
+    # encoded, so that the id can neither contain the separator nor characters not allowed in row keys
+    encoded_id = base64.urlsafe_b64encode(participant_id.encode()).decode()
+    return f"{PARTICIPANT_ROW_KEY_PREFIX}{encoded_id}|{row_key}"
+
+
+def submission_result_entities(submission_result: SubmissionResult, row_key: str) -> list[dict]:
+    data = submission_result.model_dump_json()
+    return [
+        {"PartitionKey": submission_result.competition_id, "RowKey": RESULTS_ROW_KEY_PREFIX + row_key, "Data": data},
+        {
+            "PartitionKey": submission_result.competition_id,
+            "RowKey": participant_row_key(submission_result.participant_id, row_key),
+            "Data": data,
+        },
+    ]
+
+
+def encode_continuation_token(token: dict | None) -> str | None:
+    return None if token is None else base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def decode_continuation_token(token: str | None) -> dict | None:
+    if token is None:
+        return None
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(token))
+    except ValueError:  # including base64 and unicode errors
+        raise InvalidContinuationToken()
+    if not isinstance(decoded, dict):
+        raise InvalidContinuationToken()
+    return decoded
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether writing again may succeed: connection errors, timeouts, throttling and server errors"""
+    if isinstance(error, ServiceRequestError | ServiceResponseError | TimeoutError):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code is None or error.status_code in (408, 429) or error.status_code >= 500
+    return False
 
 
 async def ensure_table(table_service_client: TableServiceClient, table_name: str) -> TableClient:
@@ -30,34 +114,96 @@ async def ensure_table(table_service_client: TableServiceClient, table_name: str
     return table_service_client.get_table_client(table_name=table_name)
 
 
+def _log_dropped(entities: list[dict], attempts: int, error: BaseException | None = None) -> None:
+    logger.error("Gave up writing a submission result after %d attempts (%r): %s", attempts, error, entities[0]["Data"])
+
+
 class AzureStorageDataRepository:
+    """
+    Stores the data in Azure Tables.
+
+    A single service client (and so a single pool of connections) is kept for the lifetime of the
+    repository, and each table is provisioned only once, the first time it's used.
+    `close` releases the connections.
+
+    If `flush_seconds` is positive, submission results are buffered and written behind in transactions
+    (per competition, of up to `MAX_TRANSACTION_SIZE` results), once `flush_size` results are waiting or
+    `flush_seconds` after the first one was buffered. With `wait_for_flush`, storing a result only returns
+    once it has been written (and raises if writing failed), otherwise it returns straight away and
+    results that failed to be written for a transient reason are retried with the next flushes, up to
+    `MAX_WRITE_ATTEMPTS` times. Results given up on are logged.
+    Buffered results of a competition are written (and the writes of its results in progress waited for)
+    before reading them back, and all of them on `close`.
+    """
+
     _table_service_client_factory: TableServiceClientFactoryType
+    _table_service: TableServiceClient | None
+    _tables: dict[str, TableClient]
+    _pending: list[PendingWrite]
+    _flush_timer: "asyncio.Task[None] | None"
+    _flush_tasks: set["asyncio.Task[None]"]
+    _writing: defaultdict[CompetitionId, set["asyncio.Future[None]"]]
 
     def __init__(
         self,
         table_client_service_factory: TableServiceClientFactoryType,
+        flush_seconds: float = 0,
+        flush_size: int = MAX_TRANSACTION_SIZE,
+        wait_for_flush: bool = True,
     ) -> None:
         self._table_service_client_factory = table_client_service_factory
+        self._table_service = None
+        self._tables = {}
+        self._provisioning_lock = asyncio.Lock()
+        self.flush_seconds = flush_seconds
+        self.flush_size = flush_size
+        self.wait_for_flush = wait_for_flush
+        self._pending = []
+        self._flush_timer = None
+        self._flush_tasks = set()
+        self._writing = defaultdict(set)
+
+    async def _table(self, table_name: str) -> TableClient:
+        if table_name in self._tables:
+            return self._tables[table_name]
+
+        async with self._provisioning_lock:
+            if table_name not in self._tables:
+                if self._table_service is None:
+                    self._table_service = self._table_service_client_factory()
+                self._tables[table_name] = await ensure_table(self._table_service, table_name=table_name)
+        return self._tables[table_name]
+
+    async def close(self) -> None:
+        await self._drain()
+        if self._flush_timer is not None:  # results failing to be written even now are given up on
+            self._flush_timer.cancel()
+            self._flush_timer = None
+            for entities, _, attempts in self._pending:
+                _log_dropped(entities, attempts)
+            self._pending = []
+        if self._table_service is not None:
+            await self._table_service.close()
+        self._table_service = None
+        self._tables = {}
 
     async def _simple_set_in_table(self, entity: Any, table_name: str, overwrite: bool = False) -> None:
-        async with self._table_service_client_factory() as _table_service:
-            tbl = await ensure_table(_table_service, table_name=table_name)
-            _load = {"PartitionKey": ALL, "RowKey": entity.id, "Data": entity.model_dump_json()}
-            if overwrite:
-                await tbl.upsert_entity(_load)
-            else:
-                try:
-                    await tbl.create_entity(_load)
-                except ResourceExistsError:
-                    raise CompetitionExists()
+        tbl = await self._table(table_name)
+        _load = {"PartitionKey": ALL, "RowKey": entity.id, "Data": entity.model_dump_json()}
+        if overwrite:
+            await tbl.upsert_entity(_load)
+        else:
+            try:
+                await tbl.create_entity(_load)
+            except ResourceExistsError:
+                raise CompetitionExists()
 
     async def _simple_get_from_table(self, entity_id: str, table_name: str) -> str | None:
-        async with self._table_service_client_factory() as _table_service:
-            tbl = await ensure_table(_table_service, table_name=table_name)
-            try:
-                entity = await tbl.get_entity(partition_key=ALL, row_key=entity_id)
-            except ResourceNotFoundError:
-                return None
+        tbl = await self._table(table_name)
+        try:
+            entity = await tbl.get_entity(partition_key=ALL, row_key=entity_id)
+        except ResourceNotFoundError:
+            return None
         return entity["Data"]
 
     async def set_participant(self, participant: Participant) -> None:
@@ -67,32 +213,286 @@ class AzureStorageDataRepository:
         data = await self._simple_get_from_table(entity_id=participant_id, table_name=TableNames.PARTICIPANT)
         return None if data is None else Participant.model_validate_json(data)
 
+    async def get_participants(self) -> list[Participant]:
+        tbl = await self._table(TableNames.PARTICIPANT)
+        entity_iterator = tbl.query_entities("PartitionKey eq @pk", parameters={"pk": ALL}, select=["Data"])
+        return [Participant.model_validate_json(i["Data"]) async for i in entity_iterator]
+
     async def set_competition(self, competition: Competition) -> None:
         await self._simple_set_in_table(entity=competition, table_name=TableNames.COMPETITION)
+        await self._bump_version(TableNames.COMPETITION, ALL)
 
     async def get_competition(self, competition_id: CompetitionId) -> Competition | None:
         data = await self._simple_get_from_table(entity_id=competition_id, table_name=TableNames.COMPETITION)
         return None if data is None else Competition.model_validate_json(data)
 
     async def get_competitions(self) -> list[Competition]:
-        async with self._table_service_client_factory() as _table_service:
-            tbl = await ensure_table(_table_service, table_name=TableNames.COMPETITION)
-            entity_iterator = tbl.query_entities("PartitionKey eq @pk", parameters={"pk": ALL})
-            return [Competition.model_validate_json(i["Data"]) async for i in entity_iterator]
+        tbl = await self._table(TableNames.COMPETITION)
+        entity_iterator = tbl.query_entities("PartitionKey eq @pk", parameters={"pk": ALL})
+        return [Competition.model_validate_json(i["Data"]) async for i in entity_iterator]
+
+    async def _bump_version(self, table_name: str, key: str) -> None:
+        """
+        Versions are stored under the name of the table they are the version of: the one of the
+        competitions (as a whole) under `ALL`, the ones of the submission results under the competition id.
+        """
+        tbl = await self._table(TableNames.VERSION)
+        await tbl.upsert_entity({"PartitionKey": table_name, "RowKey": key, "Version": new_version()})
+
+    async def get_version(self, competition_id: CompetitionId | None = None) -> str:
+        """
+        Version of the submission results of a competition or, without one, of the competitions.
+        Only read: buffered results bump the version of their competition once they are written.
+        """
+        if competition_id is None:
+            table_name, key = TableNames.COMPETITION, ALL
+        else:
+            table_name, key = TableNames.SUBMISSION_RESULT, competition_id
+        tbl = await self._table(TableNames.VERSION)
+        try:
+            entity = await tbl.get_entity(partition_key=table_name, row_key=key)
+        except ResourceNotFoundError:
+            return INITIAL_VERSION
+        return entity["Version"]
 
     async def set_submission_result(self, submission_result: SubmissionResult) -> None:
-        async with self._table_service_client_factory() as _table_service:
-            tbl = await ensure_table(_table_service, table_name=TableNames.SUBMISSION_RESULT)
-            await tbl.upsert_entity(
-                {
-                    "PartitionKey": submission_result.competition_id,
-                    "RowKey": dt.datetime.utcnow().isoformat(),
-                    "Data": submission_result.model_dump_json(),
-                }
-            )
+        entities = submission_result_entities(submission_result, row_key=submission_row_key(dt.datetime.utcnow()))
+        if self.flush_seconds <= 0:
+            (error,) = await self._write([entities])
+            if error is not None:
+                raise error
+            return
+
+        written = asyncio.get_running_loop().create_future() if self.wait_for_flush else None
+        self._pending.append((entities, written, 0))
+        if len(self._pending) >= self.flush_size:
+            self._start_flush_task(self.flush())
+        elif self._flush_timer is None:
+            self._flush_timer = self._start_flush_task(self._flush_later())
+
+        if written is not None:
+            await written
+
+    def _start_flush_task(self, flush: Coroutine[Any, Any, None]) -> "asyncio.Task[None]":
+        task = asyncio.create_task(flush)
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+        return task
+
+    async def _drain(self) -> None:
+        """Writes the buffered results and waits for the writes already in progress"""
+        await self.flush()
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    async def _drain_competition(self, competition_id: CompetitionId) -> None:
+        """Writes the buffered results of the competition and waits for the writes of its results in progress"""
+        if any(entities[0]["PartitionKey"] == competition_id for entities, _, _ in self._pending):
+            await self.flush(competition_id)
+        await asyncio.gather(*self._writing.get(competition_id, ()))
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_seconds)
+        self._flush_timer = None
+        await self.flush()
+
+    def _settle(self, pending_write: PendingWrite, error: BaseException | None) -> None:
+        entities, written, attempts = pending_write
+        if written is None:
+            if error is None:
+                return
+            if is_transient(error) and attempts + 1 < MAX_WRITE_ATTEMPTS:
+                self._pending.append((entities, None, attempts + 1))
+            else:
+                _log_dropped(entities, attempts + 1, error)
+        elif not written.done():
+            if error is not None:
+                written.set_exception(error)
+            else:
+                written.set_result(None)
+
+    async def flush(self, competition_id: CompetitionId | None = None) -> None:
+        """Writes the buffered submission results, only the ones of a competition if given"""
+        pending = [i for i in self._pending if competition_id in (None, i[0][0]["PartitionKey"])]
+        self._pending = [i for i in self._pending if competition_id not in (None, i[0][0]["PartitionKey"])]
+        if not self._pending and self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not pending:
+            return
+
+        # the reads of the competitions written to wait for the write to complete
+        written = asyncio.get_running_loop().create_future()
+        competition_ids = {entities[0]["PartitionKey"] for entities, _, _ in pending}
+        for i in competition_ids:
+            self._writing[i].add(written)
+        try:
+            errors = await self._write([entities for entities, _, _ in pending])
+        finally:
+            for i in competition_ids:
+                self._writing[i].discard(written)
+                if not self._writing[i]:
+                    del self._writing[i]
+            written.set_result(None)
+        for pending_write, error in zip(pending, errors, strict=True):
+            self._settle(pending_write, error)
+
+        if self._pending and self._flush_timer is None:
+            self._flush_timer = self._start_flush_task(self._flush_later())
+
+    async def _write(self, entity_groups: list[list[dict]]) -> list[BaseException | None]:
+        """
+        Upserts groups of entities in as few transactions as possible (a transaction is limited to
+        a partition and `MAX_TRANSACTION_SIZE` entities, groups are never split across transactions),
+        then bumps the version of the competitions written to.
+        Returns, for each group, the error it failed with, if any.
+        """
+        by_partition: dict[str, list[int]] = defaultdict(list)
+        for i, entities in enumerate(entity_groups):
+            by_partition[entities[0]["PartitionKey"]].append(i)
+
+        transactions: list[list[int]] = []
+        for group_ids in by_partition.values():
+            transactions.append([])
+            n_entities = 0
+            for i in group_ids:
+                if n_entities + len(entity_groups[i]) > MAX_TRANSACTION_SIZE:
+                    transactions.append([])
+                    n_entities = 0
+                transactions[-1].append(i)
+                n_entities += len(entity_groups[i])
+
+        errors: list[BaseException | None] = [None] * len(entity_groups)
+        await self._submit_transactions(entity_groups, transactions, errors)
+        # a transaction fails as a whole: groups that failed for good alongside others are written on their
+        # own, so that only the ones at fault fail
+        isolated = [
+            [i]
+            for group_ids in transactions
+            if len(group_ids) > 1
+            for i in group_ids
+            if (error := errors[i]) is not None and not is_transient(error)
+        ]
+        await self._submit_transactions(entity_groups, isolated, errors)
+
+        await self._bump_written_versions(by_partition, errors)
+        return errors
+
+    async def _submit_transactions(
+        self, entity_groups: list[list[dict]], transactions: list[list[int]], errors: list[BaseException | None]
+    ) -> None:
+        """Upserts the groups of each transaction, setting (or clearing) the error of each group"""
+        tbl = await self._table(TableNames.SUBMISSION_RESULT)
+        outcomes = await asyncio.gather(
+            *(
+                tbl.submit_transaction([("upsert", e) for i in group_ids for e in entity_groups[i]])
+                for group_ids in transactions
+            ),
+            return_exceptions=True,
+        )
+        for group_ids, outcome in zip(transactions, outcomes, strict=True):
+            for i in group_ids:
+                errors[i] = outcome if isinstance(outcome, BaseException) else None
+
+    async def _bump_written_versions(
+        self, by_partition: dict[str, list[int]], errors: list[BaseException | None]
+    ) -> None:
+        """
+        Bumps the version of the competitions some results were written to. A version that fails to be
+        bumped fails the results of its competition, so that they are written again.
+        """
+        written = [pk for pk, group_ids in by_partition.items() if any(errors[i] is None for i in group_ids)]
+        bumps = await asyncio.gather(
+            *(self._bump_version(TableNames.SUBMISSION_RESULT, pk) for pk in written), return_exceptions=True
+        )
+        for pk, bump in zip(written, bumps, strict=True):
+            if isinstance(bump, BaseException):
+                for i in by_partition[pk]:
+                    errors[i] = errors[i] or bump
+
+    async def set_submission_results(
+        self, submission_results: list[SubmissionResult], stored_at: list[dt.datetime] | None = None
+    ) -> None:
+        """
+        Stores the results in as few round trips as possible, grouped in transactions per competition.
+        `stored_at` is when each result was stored, if not now (e.g. restoring results stored elsewhere).
+        """
+        at = stored_at or [dt.datetime.utcnow()] * len(submission_results)
+        errors = await self._write(
+            [
+                submission_result_entities(submission_result, row_key=submission_row_key(at[i], seq=i))
+                for i, submission_result in enumerate(submission_results)
+            ]
+        )
+        for error in errors:
+            if error is not None:
+                raise error
+
+    async def _query_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None,
+        since: dt.datetime | None,
+        until: dt.datetime | None,
+        **kwargs: Any,
+    ) -> AsyncItemPaged:
+        await self._drain_competition(competition_id)
+
+        prefix = RESULTS_ROW_KEY_PREFIX if participant_id is None else participant_row_key(participant_id, "")
+        lowest = prefix + ("" if since is None else submission_row_key(since, unique=False))
+        highest = prefix + (ROW_KEY_PREFIX_END if until is None else submission_row_key(until, unique=False))
+        tbl = await self._table(TableNames.SUBMISSION_RESULT)
+        return tbl.query_entities(
+            "PartitionKey eq @pk and RowKey ge @lowest and RowKey lt @highest",
+            parameters={"pk": competition_id, "lowest": lowest, "highest": highest},
+            select=["RowKey", "Data"],
+            **kwargs,
+        )
+
+    async def iter_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+    ) -> AsyncIterator[SubmissionResult]:
+        """Results in the order they were stored, optionally only the ones of a participant and/or in a time range"""
+        entity_iterator = await self._query_submission_results(competition_id, participant_id, since, until)
+        async for entity in entity_iterator:
+            yield SubmissionResult.model_validate_json(entity["Data"])
+
+    async def iter_stored_submission_results(
+        self, competition_id: CompetitionId
+    ) -> AsyncIterator[tuple[dt.datetime, SubmissionResult]]:
+        """All the results of a competition, in order, with when they were stored"""
+        entity_iterator = await self._query_submission_results(competition_id, None, None, None)
+        async for entity in entity_iterator:
+            yield submission_row_key_time(entity["RowKey"]), SubmissionResult.model_validate_json(entity["Data"])
 
     async def get_submission_results(self, competition_id: CompetitionId) -> list[SubmissionResult]:
-        async with self._table_service_client_factory() as _table_service:
-            tbl = await ensure_table(_table_service, table_name=TableNames.SUBMISSION_RESULT)
-            entity_iterator = tbl.query_entities("PartitionKey eq @pk", parameters={"pk": competition_id})
-            return [SubmissionResult.model_validate_json(i["Data"]) async for i in entity_iterator]
+        return [i async for i in self.iter_submission_results(competition_id)]
+
+    async def get_submission_results_page(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+        page_size: int = 100,
+        continuation_token: str | None = None,
+    ) -> SubmissionResultPage:
+        """
+        A page of the results `iter_submission_results` would return. The page's `continuation_token`,
+        if any, is used to get the next page.
+        """
+        entity_iterator = await self._query_submission_results(
+            competition_id, participant_id, since, until, results_per_page=page_size
+        )
+        # tables' continuation tokens are dicts, despite the annotations
+        token = decode_continuation_token(continuation_token)
+        pages = entity_iterator.by_page(continuation_token=token)  # type: ignore[arg-type]
+        results = []
+        async for page in pages:
+            results = [SubmissionResult.model_validate_json(i["Data"]) async for i in page]
+            break
+        next_token = encode_continuation_token(pages.continuation_token)  # type: ignore[attr-defined]
+        return SubmissionResultPage(results=results, continuation_token=next_token)
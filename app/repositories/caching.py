@@ -0,0 +1,159 @@
+import datetime as dt
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, TypeAlias
+
+from app.models.cache import CacheStats
+from app.models.competiton import Competition, CompetitionId
+from app.models.participant import Participant, ParticipantId
+from app.models.submission import SubmissionResult, SubmissionResultPage
+from app.repositories.azure_storage import AzureStorageDataRepository
+from app.repositories.in_memory import InMemoryDataRepository
+from app.repositories.sqlite import SqliteDataRepository
+from app.utils.fetcher import SingleFlight
+
+CachedRepositoryType: TypeAlias = InMemoryDataRepository | AzureStorageDataRepository | SqliteDataRepository
+
+_ALL_COMPETITIONS = ("competitions",)
+
+
+class CachingDataRepository:
+    """
+    Read-through cache in front of another repository, for the data that is read far more often than
+    it's written: competitions and participants. Submission results are not cached.
+
+    Entries expire after the TTL of their entity and the cache is an LRU bounded by `max_entries`.
+    Writes go through to the wrapped repository and update the cache, so the changes made by this
+    process are visible straight away (the ones made by other processes once the entries expire, or as
+    soon as a new version of the competitions is seen). Concurrent misses on the same entry share a single read.
+    """
+
+    _entries: OrderedDict[tuple, tuple[Any, float]]  # key -> (value, expires at)
+    _competitions_version: str | None
+    _single_flight: SingleFlight[Any]
+
+    def __init__(
+        self,
+        repository: CachedRepositoryType,
+        max_entries: int,
+        competition_ttl_seconds: float,
+        participant_ttl_seconds: float,
+    ) -> None:
+        self.repository = repository
+        self.max_entries = max_entries
+        self.competition_ttl_seconds = competition_ttl_seconds
+        self.participant_ttl_seconds = participant_ttl_seconds
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._single_flight = SingleFlight()
+        self._competitions_version = None
+
+    async def _get(self, key: tuple, ttl_seconds: float, read: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[0]
+
+        self.stats.misses += 1
+        return await self._single_flight.run(key, lambda: self._read(key, ttl_seconds, read))
+
+    async def _read(self, key: tuple, ttl_seconds: float, read: Callable[[], Awaitable[Any]]) -> Any:
+        value = await read()
+        self._put(key, value, ttl_seconds)
+        return value
+
+    def _put(self, key: tuple, value: Any, ttl_seconds: float) -> None:
+        self._entries[key] = (value, time.monotonic() + ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        self.stats.entries = len(self._entries)
+
+    def _invalidate(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        self.stats.entries = len(self._entries)
+
+    async def close(self) -> None:
+        await self.repository.close()
+
+    async def set_participant(self, participant: Participant) -> None:
+        await self.repository.set_participant(participant)
+        self._put(("participant", participant.id), participant, self.participant_ttl_seconds)
+
+    async def get_participant(self, participant_id: ParticipantId) -> Participant | None:
+        return await self._get(
+            ("participant", participant_id),
+            ttl_seconds=self.participant_ttl_seconds,
+            read=lambda: self.repository.get_participant(participant_id),
+        )
+
+    async def get_participants(self) -> list[Participant]:
+        return await self.repository.get_participants()
+
+    async def set_competition(self, competition: Competition) -> None:
+        await self.repository.set_competition(competition)
+        self._put(("competition", competition.id), competition, self.competition_ttl_seconds)
+        self._invalidate(_ALL_COMPETITIONS)
+
+    async def get_competition(self, competition_id: CompetitionId) -> Competition | None:
+        return await self._get(
+            ("competition", competition_id),
+            ttl_seconds=self.competition_ttl_seconds,
+            read=lambda: self.repository.get_competition(competition_id),
+        )
+
+    async def get_competitions(self) -> list[Competition]:
+        competitions = await self._get(
+            _ALL_COMPETITIONS, ttl_seconds=self.competition_ttl_seconds, read=self.repository.get_competitions
+        )
+        return list(competitions)
+
+    async def get_version(self, competition_id: CompetitionId | None = None) -> str:
+        """Versions are never cached, a version of the competitions not seen before invalidates them instead"""
+        version = await self.repository.get_version(competition_id)
+        if competition_id is None and version != self._competitions_version:
+            for key in [i for i in self._entries if i[0] == "competition" or i == _ALL_COMPETITIONS]:
+                self._invalidate(key)
+            self._competitions_version = version
+        return version
+
+    async def set_submission_result(self, submission_result: SubmissionResult) -> None:
+        await self.repository.set_submission_result(submission_result)
+
+    async def set_submission_results(
+        self, submission_results: list[SubmissionResult], stored_at: list[dt.datetime] | None = None
+    ) -> None:
+        await self.repository.set_submission_results(submission_results, stored_at)
+
+    def iter_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+    ) -> AsyncIterator[SubmissionResult]:
+        return self.repository.iter_submission_results(competition_id, participant_id, since, until)
+
+    def iter_stored_submission_results(
+        self, competition_id: CompetitionId
+    ) -> AsyncIterator[tuple[dt.datetime, SubmissionResult]]:
+        return self.repository.iter_stored_submission_results(competition_id)
+
+    async def get_submission_results(self, competition_id: CompetitionId) -> list[SubmissionResult]:
+        return await self.repository.get_submission_results(competition_id)
+
+    async def get_submission_results_page(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+        page_size: int = 100,
+        continuation_token: str | None = None,
+    ) -> SubmissionResultPage:
+        return await self.repository.get_submission_results_page(
+            competition_id, participant_id, since, until, page_size, continuation_token
+        )
@@ -1,2 +1,30 @@
+import uuid
+
+# version of data that was never written
+INITIAL_VERSION = "0"
+
+
 class CompetitionExists(Exception):
     ...
+
+
+class InvalidContinuationToken(Exception):
+    ...
+
+
+def parse_position_token(continuation_token: str | None) -> int | None:
+    """Continuation tokens holding the position of the last row of the previous page"""
+    if continuation_token is None:
+        return None
+    try:
+        return int(continuation_token)
+    except ValueError:
+        raise InvalidContinuationToken()
+
+
+def new_version() -> str:
+    """
+    Versions identify the state of the data, to tell clients whether what they have is still current.
+    They are random rather than incremented, so they never repeat, even across restarts.
+    """
+    return uuid.uuid4().hex
@@ -1,20 +1,193 @@
-from collections import defaultdict
+import datetime as dt
+from array import array
+from collections.abc import AsyncIterator
+
+import numpy as np
 
 from app.models.competiton import Competition, CompetitionId
+from app.models.evaluation import EvaluationMetric
 from app.models.participant import Participant, ParticipantId
-from app.models.submission import SubmissionResult
-from app.repositories.common import CompetitionExists
+from app.models.submission import SubmissionResult, SubmissionResultPage
+from app.repositories.common import INITIAL_VERSION, CompetitionExists, new_version, parse_position_token
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def _to_microseconds(at: dt.datetime) -> int:
+    return (at - EPOCH) // dt.timedelta(microseconds=1)
+
+
+class Interner:
+    """Stores each distinct string once, referring to it by an integer code"""
+
+    values: list[str]
+    _codes: dict[str, int]
+
+    def __init__(self) -> None:
+        self.values = []
+        self._codes = {}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get_code(self, value: str) -> int | None:
+        return self._codes.get(value)
+
+
+class SubmissionResultColumns:
+    """
+    Submission results of a competition stored column by column in numpy arrays (grown by doubling),
+    with participant ids and submission names interned, rather than as one object per result.
+
+    Rows are in the order they were stored, so the timestamps are sorted and time ranges are found with
+    a binary search. The rows of each participant are indexed. `SubmissionResult` objects are only
+    built when reading rows back, the columns can be accessed directly (as views, without copies).
+    """
+
+    _secondary_scores: dict[EvaluationMetric, np.ndarray]
+    _participant_rows: dict[int, array]
+
+    def __init__(
+        self, competition_id: CompetitionId, participant_ids: Interner, submission_names: Interner, capacity: int = 64
+    ) -> None:
+        self.competition_id = competition_id
+        self._participant_ids = participant_ids
+        self._submission_names = submission_names
+        self._len = 0
+        self._participant_codes = np.empty(capacity, dtype=np.int32)
+        self._name_codes = np.empty(capacity, dtype=np.int32)
+        self._scores = np.empty(capacity, dtype=np.float64)
+        self._timestamps = np.empty(capacity, dtype=np.int64)  # microseconds since the epoch
+        self._secondary_scores = {}  # NaN where a result doesn't have the metric
+        self._participant_rows = {}
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def participant_codes(self) -> np.ndarray:
+        return self._participant_codes[: self._len]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self._scores[: self._len]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[: self._len]
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._scores)
+        self._participant_codes = np.resize(self._participant_codes, capacity)
+        self._name_codes = np.resize(self._name_codes, capacity)
+        self._scores = np.resize(self._scores, capacity)
+        self._timestamps = np.resize(self._timestamps, capacity)
+        for metric, scores in self._secondary_scores.items():
+            self._secondary_scores[metric] = np.resize(scores, capacity)
+
+    def append(self, submission_result: SubmissionResult, at: dt.datetime) -> None:
+        if self._len == len(self._scores):
+            self._grow()
+
+        i = self._len
+        participant_code = self._participant_ids.code(submission_result.participant_id)
+        self._participant_codes[i] = participant_code
+        self._name_codes[i] = self._submission_names.code(submission_result.submission_name)
+        self._scores[i] = submission_result.score
+        # keeps the timestamps sorted, even if the clock goes back
+        self._timestamps[i] = max(_to_microseconds(at), self._timestamps[i - 1] if i else 0)
+        for metric, score in submission_result.secondary_scores.items():
+            if metric not in self._secondary_scores:
+                self._secondary_scores[metric] = np.full(len(self._scores), np.nan)
+            self._secondary_scores[metric][i] = score
+        for metric, scores in self._secondary_scores.items():
+            if metric not in submission_result.secondary_scores:
+                scores[i] = np.nan
+        self._participant_rows.setdefault(participant_code, array("q")).append(i)
+        self._len += 1
+
+    def rows(
+        self,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+    ) -> np.ndarray:
+        """Positions of the rows matching the filters, in order"""
+        start = 0 if since is None else int(np.searchsorted(self.timestamps, _to_microseconds(since), side="left"))
+        stop = (
+            self._len if until is None else int(np.searchsorted(self.timestamps, _to_microseconds(until), side="left"))
+        )
+        if participant_id is None:
+            return np.arange(start, stop)
+
+        code = self._participant_ids.get_code(participant_id)
+        if code is None or code not in self._participant_rows:
+            return np.empty(0, dtype=np.int64)
+        rows = np.array(self._participant_rows[code], dtype=np.int64)
+        return rows[(rows >= start) & (rows < stop)]
+
+    def records(self, start: int, stop: int) -> list[dict]:
+        """
+        The rows from `start` to `stop` as plain (json serialisable) dicts, shaped as `SubmissionResult`,
+        converted a column slice at a time rather than a row at a time.
+        """
+        participant_ids, names = self._participant_ids.values, self._submission_names.values
+        secondary_scores = {
+            metric.value: scores[start:stop].tolist() for metric, scores in self._secondary_scores.items()
+        }
+        rows = zip(
+            self._participant_codes[start:stop].tolist(),
+            self._name_codes[start:stop].tolist(),
+            self._scores[start:stop].tolist(),
+            strict=True,
+        )
+        return [
+            {
+                "competition_id": self.competition_id,
+                "participant_id": participant_ids[participant_code],
+                "submission_name": names[name_code],
+                "score": score,
+                # NaN (not equal to itself) where the result doesn't have the metric
+                "secondary_scores": {m: v[j] for m, v in secondary_scores.items() if v[j] == v[j]},
+            }
+            for j, (participant_code, name_code, score) in enumerate(rows)
+        ]
+
+    def stored_at(self, i: int) -> dt.datetime:
+        return EPOCH + dt.timedelta(microseconds=int(self._timestamps[i]))
+
+    def result(self, i: int) -> SubmissionResult:
+        return SubmissionResult.model_construct(
+            competition_id=self.competition_id,
+            participant_id=self._participant_ids.values[self._participant_codes[i]],
+            submission_name=self._submission_names.values[self._name_codes[i]],
+            score=float(self._scores[i]),
+            secondary_scores={
+                metric: float(scores[i]) for metric, scores in self._secondary_scores.items() if not np.isnan(scores[i])
+            },
+        )
 
 
 class InMemoryDataRepository:
     _participants: dict[ParticipantId, Participant]
     _competitions: dict[CompetitionId, Competition]
-    _submission_results: dict[CompetitionId, list[SubmissionResult]]
+    _submission_results: dict[CompetitionId, SubmissionResultColumns]
+    _versions: dict[CompetitionId | None, str]
 
     def __init__(self) -> None:
         self._participants = {}
         self._competitions = {}
-        self._submission_results = defaultdict(list)
+        self._submission_results = {}
+        self._versions = {}
+        self._participant_ids = Interner()
+        self._submission_names = Interner()
+
+    async def close(self) -> None:
+        pass
 
     async def set_participant(self, participant: Participant | dict) -> None:
         obj = Participant.model_validate(participant)
@@ -23,20 +196,93 @@ class InMemoryDataRepository:
     async def get_participant(self, participant_id: ParticipantId) -> Participant | None:
         return self._participants.get(participant_id)
 
+    async def get_participants(self) -> list[Participant]:
+        return list(self._participants.values())
+
     async def set_competition(self, competition: Competition | dict) -> None:
         obj = Competition.model_validate(competition)
         if obj.id in self._competitions:
             raise CompetitionExists()
         self._competitions[obj.id] = obj
+        self._versions[None] = new_version()
 
     async def get_competition(self, competition_id: CompetitionId) -> Competition | None:
         return self._competitions.get(competition_id)
 
+    async def get_version(self, competition_id: CompetitionId | None = None) -> str:
+        """Version of the submission results of a competition or, without one, of the competitions"""
+        return self._versions.get(competition_id, INITIAL_VERSION)
+
     async def get_competitions(self) -> list[Competition]:
         return list(self._competitions.values())
 
+    def submission_result_columns(self, competition_id: CompetitionId) -> SubmissionResultColumns | None:
+        return self._submission_results.get(competition_id)
+
     async def set_submission_result(self, submission_result: SubmissionResult) -> None:
-        self._submission_results[submission_result.competition_id].append(submission_result)
+        await self.set_submission_results([submission_result])
+
+    async def set_submission_results(
+        self, submission_results: list[SubmissionResult], stored_at: list[dt.datetime] | None = None
+    ) -> None:
+        """`stored_at` is when each result was stored, if not now (e.g. restoring results stored elsewhere)"""
+        now = dt.datetime.utcnow()
+        for i, submission_result in enumerate(submission_results):
+            columns = self._submission_results.get(submission_result.competition_id)
+            if columns is None:
+                columns = self._submission_results[submission_result.competition_id] = SubmissionResultColumns(
+                    competition_id=submission_result.competition_id,
+                    participant_ids=self._participant_ids,
+                    submission_names=self._submission_names,
+                )
+            columns.append(submission_result, at=now if stored_at is None else stored_at[i])
+            self._versions[submission_result.competition_id] = new_version()
+
+    async def iter_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+    ) -> AsyncIterator[SubmissionResult]:
+        columns = self._submission_results.get(competition_id)
+        if columns is None:
+            return
+        for i in columns.rows(participant_id=participant_id, since=since, until=until).tolist():
+            yield columns.result(i)
+
+    async def iter_stored_submission_results(
+        self, competition_id: CompetitionId
+    ) -> AsyncIterator[tuple[dt.datetime, SubmissionResult]]:
+        """All the results of a competition, in order, with when they were stored"""
+        columns = self._submission_results.get(competition_id)
+        if columns is None:
+            return
+        for i in range(len(columns)):
+            yield columns.stored_at(i), columns.result(i)
 
     async def get_submission_results(self, competition_id: CompetitionId) -> list[SubmissionResult]:
-        return self._submission_results[competition_id]
+        return [i async for i in self.iter_submission_results(competition_id)]
+
+    async def get_submission_results_page(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+        page_size: int = 100,
+        continuation_token: str | None = None,
+    ) -> SubmissionResultPage:
+        after = parse_position_token(continuation_token)
+        columns = self._submission_results.get(competition_id)
+        if columns is None:
+            return SubmissionResultPage(results=[])
+
+        rows = columns.rows(participant_id=participant_id, since=since, until=until)
+        if after is not None:
+            rows = rows[rows > after]
+        page = rows[:page_size].tolist()
+        return SubmissionResultPage(
+            results=[columns.result(i) for i in page],
+            continuation_token=str(page[-1]) if len(rows) > page_size else None,
+        )
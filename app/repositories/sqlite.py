@@ -0,0 +1,263 @@
+import asyncio
+import contextlib
+import datetime as dt
+import functools
+import sqlite3
+import threading
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, TypeVar
+
+from app.models.competiton import Competition, CompetitionId
+from app.models.participant import Participant, ParticipantId
+from app.models.submission import SubmissionResult, SubmissionResultPage
+from app.repositories.common import INITIAL_VERSION, CompetitionExists, new_version, parse_position_token
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS participant (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS competition (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submission_result (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    competition_id TEXT NOT NULL,
+    participant_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submission_result_competition ON submission_result (competition_id, seq);
+CREATE INDEX IF NOT EXISTS submission_result_competition_created_at ON submission_result (competition_id, created_at);
+CREATE INDEX IF NOT EXISTS submission_result_participant ON submission_result (competition_id, participant_id, seq);
+CREATE INDEX IF NOT EXISTS submission_result_score ON submission_result (competition_id, score);
+CREATE TABLE IF NOT EXISTS version (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+ITER_CHUNK_SIZE = 1000
+COMPETITIONS_VERSION_KEY = ""  # the other keys are the competition ids
+
+
+def _timestamp(at: dt.datetime) -> str:
+    return at.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+@contextlib.contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _bump_versions(conn: sqlite3.Connection, keys: Iterable[str]) -> None:
+    conn.executemany("INSERT OR REPLACE INTO version (key, value) VALUES (?, ?)", [(i, new_version()) for i in keys])
+
+
+class SqliteDataRepository:
+    """
+    Stores the data in a local SQLite database, in WAL mode so it can be shared by all the worker
+    processes of a host (readers don't block the writer).
+
+    Queries run on a small pool of threads, each with its own connection, so they don't block the event loop.
+    """
+
+    _connections: list[sqlite3.Connection]
+
+    def __init__(self, path: Path, max_threads: int = 4) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_threads = max_threads
+        self._executor: ThreadPoolExecutor | None = None
+        self._local = threading.local()
+        self._connections = []
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._connections.append(conn)
+        return conn
+
+    async def _run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="sqlite-repository")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(self._connection()))
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._local = threading.local()
+
+    async def set_participant(self, participant: Participant) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO participant (id, data) VALUES (?, ?)",
+                (participant.id, participant.model_dump_json()),
+            )
+        )
+
+    async def get_participant(self, participant_id: ParticipantId) -> Participant | None:
+        row = await self._run(
+            lambda conn: conn.execute("SELECT data FROM participant WHERE id = ?", (participant_id,)).fetchone()
+        )
+        return None if row is None else Participant.model_validate_json(row[0])
+
+    async def get_participants(self) -> list[Participant]:
+        rows = await self._run(lambda conn: conn.execute("SELECT data FROM participant").fetchall())
+        return [Participant.model_validate_json(row[0]) for row in rows]
+
+    async def set_competition(self, competition: Competition) -> None:
+        def _insert(conn: sqlite3.Connection) -> None:
+            try:
+                with _transaction(conn):
+                    conn.execute(
+                        "INSERT INTO competition (id, data) VALUES (?, ?)",
+                        (competition.id, competition.model_dump_json()),
+                    )
+                    _bump_versions(conn, [COMPETITIONS_VERSION_KEY])
+            except sqlite3.IntegrityError:
+                raise CompetitionExists()
+
+        await self._run(_insert)
+
+    async def get_competition(self, competition_id: CompetitionId) -> Competition | None:
+        row = await self._run(
+            lambda conn: conn.execute("SELECT data FROM competition WHERE id = ?", (competition_id,)).fetchone()
+        )
+        return None if row is None else Competition.model_validate_json(row[0])
+
+    async def get_competitions(self) -> list[Competition]:
+        rows = await self._run(lambda conn: conn.execute("SELECT data FROM competition").fetchall())
+        return [Competition.model_validate_json(row[0]) for row in rows]
+
+    async def get_version(self, competition_id: CompetitionId | None = None) -> str:
+        """Version of the submission results of a competition or, without one, of the competitions"""
+        key = COMPETITIONS_VERSION_KEY if competition_id is None else competition_id
+        row = await self._run(lambda conn: conn.execute("SELECT value FROM version WHERE key = ?", (key,)).fetchone())
+        return INITIAL_VERSION if row is None else row[0]
+
+    async def set_submission_result(self, submission_result: SubmissionResult) -> None:
+        await self.set_submission_results([submission_result])
+
+    async def set_submission_results(
+        self, submission_results: list[SubmissionResult], stored_at: list[dt.datetime] | None = None
+    ) -> None:
+        """`stored_at` is when each result was stored, if not now (e.g. restoring results stored elsewhere)"""
+        created_at = [_timestamp(i) for i in stored_at or [dt.datetime.utcnow()] * len(submission_results)]
+        rows = [
+            (i.competition_id, i.participant_id, i.score, at, i.model_dump_json())
+            for i, at in zip(submission_results, created_at, strict=True)
+        ]
+
+        def _insert(conn: sqlite3.Connection) -> None:
+            with _transaction(conn):
+                conn.executemany(
+                    "INSERT INTO submission_result (competition_id, participant_id, score, created_at, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                _bump_versions(conn, {i.competition_id for i in submission_results})
+
+        await self._run(_insert)
+
+    async def _select_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None,
+        since: dt.datetime | None,
+        until: dt.datetime | None,
+        after_seq: int,
+        limit: int,
+    ) -> list[tuple[int, str, str]]:
+        conditions = ["competition_id = ?", "seq > ?"]
+        parameters: list[Any] = [competition_id, after_seq]
+        if participant_id is not None:
+            conditions.append("participant_id = ?")
+            parameters.append(participant_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            parameters.append(_timestamp(since))
+        if until is not None:
+            conditions.append("created_at < ?")
+            parameters.append(_timestamp(until))
+        sql = (
+            f"SELECT seq, created_at, data FROM submission_result WHERE {' AND '.join(conditions)} ORDER BY seq LIMIT ?"
+        )
+        return await self._run(lambda conn: conn.execute(sql, (*parameters, limit)).fetchall())
+
+    async def iter_submission_results(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+    ) -> AsyncIterator[SubmissionResult]:
+        """Results in the order they were stored, optionally only the ones of a participant and/or in a time range"""
+        select = functools.partial(self._select_submission_results, competition_id, participant_id, since, until)
+        after_seq = 0
+        while rows := await select(after_seq=after_seq, limit=ITER_CHUNK_SIZE):
+            for _, _, data in rows:
+                yield SubmissionResult.model_validate_json(data)
+            after_seq = rows[-1][0]
+
+    async def iter_stored_submission_results(
+        self, competition_id: CompetitionId
+    ) -> AsyncIterator[tuple[dt.datetime, SubmissionResult]]:
+        """All the results of a competition, in order, with when they were stored"""
+        after_seq = 0
+        while rows := await self._select_submission_results(
+            competition_id, None, None, None, after_seq=after_seq, limit=ITER_CHUNK_SIZE
+        ):
+            for _, created_at, data in rows:
+                yield dt.datetime.fromisoformat(created_at), SubmissionResult.model_validate_json(data)
+            after_seq = rows[-1][0]
+
+    async def get_submission_results(self, competition_id: CompetitionId) -> list[SubmissionResult]:
+        return [i async for i in self.iter_submission_results(competition_id)]
+
+    async def get_submission_results_page(
+        self,
+        competition_id: CompetitionId,
+        participant_id: ParticipantId | None = None,
+        since: dt.datetime | None = None,
+        until: dt.datetime | None = None,
+        page_size: int = 100,
+        continuation_token: str | None = None,
+    ) -> SubmissionResultPage:
+        rows = await self._select_submission_results(
+            competition_id,
+            participant_id,
+            since,
+            until,
+            after_seq=parse_position_token(continuation_token) or 0,
+            limit=page_size + 1,
+        )
+        return SubmissionResultPage(
+            results=[SubmissionResult.model_validate_json(data) for _, _, data in rows[:page_size]],
+            continuation_token=str(rows[page_size - 1][0]) if len(rows) > page_size else None,
+        )
@@ -1,23 +1,56 @@
+import base64
+import contextlib
+import functools
+from collections.abc import Iterator
 from http import HTTPStatus
+from pathlib import PurePosixPath
 from typing import Annotated, Any
+from urllib.parse import urlsplit
 
-import pandas as pd
-import requests
-from fastapi import APIRouter, Depends, HTTPException, Response
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 import app.routes.paths as p
+from app.models.cache import CacheStats
 from app.models.competiton import Competition, CompetitionInbound
-from app.models.evaluation import METRIC_LOGIC_MAP
-from app.models.participant import Participant, Permission
-from app.models.submission import Submission, SubmissionResult
-from app.repositories.common import CompetitionExists
-from app.routes.common import AppState, get_appstate
-from app.utils.parse_csv import series_from_bytes
+from app.models.job import ScoringJob, ScoringJobId
+from app.models.leaderboard import LeaderBoard, LeaderBoardRow
+from app.models.participant import Participant, ParticipantId, Permission
+from app.models.submission import BatchSubmission, Submission, SubmissionResult
+from app.repositories.caching import CachingDataRepository
+from app.repositories.common import CompetitionExists, InvalidContinuationToken
+from app.routes.common import AppState, ensure_modified, get_appstate
+from app.utils.dataset_mirror import TRANSFER_RETRY_AFTER_SECONDS, public_dataset_urls
+from app.utils.export import (
+    CSV_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    ExportFormat,
+    csv_chunks,
+    ndjson_chunks,
+    submission_result_records,
+)
+from app.utils.http import accepts_gzip, content_response, ranged_response, strong_etag
+from app.utils.ingestion import (
+    ARROW_STREAM_MEDIA_TYPE,
+    NPZ_MEDIA_TYPES,
+    InvalidSubmissionData,
+    NullPredictions,
+    SubmissionTooLarge,
+    UnsupportedFormat,
+    columns_from_bytes,
+    read_limited,
+)
+from app.utils.leaderboard import LeaderboardEntry
 from app.utils.repositories import DataRepositoryType
-from app.utils.scoring import score_submission
+from app.utils.scoring import UndefinedScore, score_submission, score_submissions
+from app.utils.target_index import KeyMismatch, TargetIndex
 
 api_router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 100
+
 
 def raise_404_if_null(obj: Any, entity: str = "entity") -> None:
     if obj is None:
@@ -31,6 +64,51 @@ def ensure_scope(participant: Participant, permission: Permission) -> None:
         )
 
 
+def ensure_own_submission(participant: Participant, participant_id: str) -> None:
+    if participant.id != participant_id:
+        raise HTTPException(
+            detail="Participant can not submit for other participants", status_code=HTTPStatus.FORBIDDEN
+        )
+
+
+@contextlib.contextmanager
+def raise_http_on_invalid_submission() -> Iterator[None]:
+    try:
+        yield
+    except InvalidSubmissionData:
+        raise HTTPException(
+            detail="Could not load and parse the data. Check it is formatted according to the submission template.",
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+        )
+    except NullPredictions as e:
+        raise HTTPException(
+            detail=f"Found {e.n_nulls} null values in the submitted data. "
+            f"Please fill the NaN with whichever logic you think is fit.",
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+        )
+    except SubmissionTooLarge as e:
+        raise HTTPException(detail=str(e), status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    except UnsupportedFormat:
+        raise HTTPException(
+            detail=f"Unsupported content type, use one of: {', '.join([*NPZ_MEDIA_TYPES, ARROW_STREAM_MEDIA_TYPE])}",
+            status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+        )
+    except KeyMismatch as e:
+        raise HTTPException(detail=str(e), status_code=HTTPStatus.BAD_REQUEST)
+    except UndefinedScore as e:
+        raise HTTPException(detail=str(e), status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+
+
+async def competitions_not_modified(appstate: Annotated[AppState, Depends(get_appstate)], response: Response) -> None:
+    response.headers["ETag"] = ensure_modified(appstate, [await appstate.data_repo.get_version()])
+
+
+async def submission_results_not_modified(
+    appstate: Annotated[AppState, Depends(get_appstate)], response: Response, competition_id: str
+) -> None:
+    response.headers["ETag"] = ensure_modified(appstate, [await appstate.data_repo.get_version(competition_id)])
+
+
 @api_router.post(p.API_COMPETITION_SET, tags=["Competition"], response_model=Competition)
 async def set_competition(
     appstate: Annotated[AppState, Depends(get_appstate)], competition: CompetitionInbound
@@ -48,15 +126,20 @@ async def set_competition(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
         )
 
+    # ready for the rush of participants at launch
+    if appstate.settings.SUBMISSION_TEMPLATE_PREPARE:
+        appstate.target_indexes.prepare(comp.evaluation.target_dataset_url)
+    if appstate.dataset_mirror is not None:
+        appstate.dataset_mirror.mirror(public_dataset_urls(comp))
     return comp
 
 
-@api_router.get(p.API_COMPETITIONS_LIST, tags=["Competition"])
+@api_router.get(p.API_COMPETITIONS_LIST, tags=["Competition"], dependencies=[Depends(competitions_not_modified)])
 async def get_competitions(appstate: Annotated[AppState, Depends(get_appstate)]) -> list[Competition]:
     return sorted(await appstate.data_repo.get_competitions(), key=lambda x: x.name)
 
 
-@api_router.get(p.API_COMPETITION_GET, tags=["Competition"])
+@api_router.get(p.API_COMPETITION_GET, tags=["Competition"], dependencies=[Depends(competitions_not_modified)])
 async def get_competition(appstate: Annotated[AppState, Depends(get_appstate)], competition_id: str) -> Competition:
     competition = await appstate.data_repo.get_competition(competition_id)
     raise_404_if_null(competition, entity="Competition")
@@ -64,53 +147,315 @@ async def get_competition(appstate: Annotated[AppState, Depends(get_appstate)],
     return competition
 
 
+@api_router.get(p.API_COMPETITION_DATASET_GET, tags=["Competition"], response_model=None)
+async def get_competition_dataset(
+    appstate: Annotated[AppState, Depends(get_appstate)], competition_id: str, url: str
+) -> Response:
+    """
+    One of the datasets of the competition, from the local mirror if it's been mirrored already, otherwise
+    redirects to its origin. Range requests are supported, to download in parts or resume a download.
+    `Repr-Digest` has the sha256 of the whole dataset, to check its integrity.
+    Refused with a 503 (and `Retry-After`) while the mirror is serving as many downloads as it can.
+    """
+    competition = await get_competition(appstate=appstate, competition_id=competition_id)
+    if url not in public_dataset_urls(competition):
+        raise_404_if_null(None, entity="Dataset")
+
+    mirror = appstate.dataset_mirror
+    dataset = None if mirror is None else await mirror.get(url)
+    if mirror is None or dataset is None:
+        return RedirectResponse(url, status_code=HTTPStatus.TEMPORARY_REDIRECT)
+
+    filename = PurePosixPath(urlsplit(url).path).name or "dataset"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Repr-Digest": f"sha-256=:{base64.b64encode(bytes.fromhex(dataset.sha256)).decode()}:",
+    }
+    response = ranged_response(
+        appstate.request,
+        size=dataset.size,
+        etag=strong_etag(dataset.sha256),
+        media_type="application/octet-stream",
+        headers=headers,
+        body=functools.partial(mirror.read, dataset),
+    )
+    if isinstance(response, StreamingResponse):
+        # refused before anything is sent, rather than stalling once the headers are out
+        if not mirror.reserve_transfer():
+            return Response(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(TRANSFER_RETRY_AFTER_SECONDS)},
+            )
+        response.background = BackgroundTask(mirror.release_transfer)  # run even if the client disconnects
+    return response
+
+
 @api_router.get(p.API_SUBMISSION_TEMPLATE_GET, tags=["Competition"])
 async def get_submission_template(
     appstate: Annotated[AppState, Depends(get_appstate)], competition_id: str
 ) -> Response:
+    """Served compressed if the client accepts it, and in parts if it asks for a range"""
     competition = await get_competition(appstate=appstate, competition_id=competition_id)
-    actual_bytes: bytes = requests.get(competition.evaluation.target_dataset_url).content
-    actual_ser = series_from_bytes(actual_bytes)
-    template_ser = pd.Series(index=actual_ser.index, name=actual_ser.name)
-    return Response(content=template_ser.to_csv())
+    template = await appstate.target_indexes.get_template(competition.evaluation.target_dataset_url)
+    headers = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(appstate.request.headers.get("accept-encoding")):
+        content, etag = template.gzipped, strong_etag(template.digest, "gzip")
+        headers["Content-Encoding"] = "gzip"
+    else:
+        content, etag = template.content, strong_etag(template.digest)
+    return content_response(appstate.request, content=content, etag=etag, media_type="text/csv", headers=headers)
 
 
-@api_router.post(p.API_SUBMISSION_SET, tags=["Submission"], status_code=HTTPStatus.NO_CONTENT)
-async def set_submission(appstate: Annotated[AppState, Depends(get_appstate)], submission: Submission) -> None:
-    if appstate.participant.id != submission.participant_id:
-        raise HTTPException(
-            detail="Participant can not submit for other participants", status_code=HTTPStatus.FORBIDDEN
-        )
+@api_router.post(p.API_SUBMISSION_SET, tags=["Submission"], status_code=HTTPStatus.NO_CONTENT, response_model=None)
+async def set_submission(
+    appstate: Annotated[AppState, Depends(get_appstate)], submission: Submission, asynchronous: bool = False
+) -> Response | None:
+    """
+    Scores and stores the submission. With `asynchronous=true` the submission is only validated and queued
+    for scoring: the response (202) contains the scoring job, whose status can be polled.
+    """
+    ensure_own_submission(participant=appstate.participant, participant_id=submission.participant_id)
 
     repo: DataRepositoryType = appstate.data_repo
     competition = await repo.get_competition(competition_id=submission.competition_id)
     raise_404_if_null(competition, entity="Competition")
     assert isinstance(competition, Competition)
 
-    predicted_ser = pd.Series(submission.predictions)
-    actual_bytes: bytes = requests.get(competition.evaluation.target_dataset_url).content
-    actual_ser = series_from_bytes(actual_bytes)
-    if not actual_ser.index.equals(predicted_ser.index):
-        _missing = set(actual_ser.keys()).difference(predicted_ser.keys())
-        _extra = set(predicted_ser.keys()).difference(actual_ser.keys())
-        err_msg = f"Submission prediction keys don't match the expected ones.\nMissing {_missing}\nExtra: {_extra}"
-        raise HTTPException(detail=err_msg, status_code=HTTPStatus.BAD_REQUEST)
+    target = await appstate.target_indexes.get(competition.evaluation.target_dataset_url)
+    with raise_http_on_invalid_submission():
+        predicted = target.align(
+            keys=np.array(list(submission.predictions.keys()), dtype=str),
+            values=np.array(list(submission.predictions.values()), dtype=np.float64),
+        )
+
+    if asynchronous:
+        job = await enqueue_submission(
+            appstate=appstate,
+            competition=competition,
+            submission_name=submission.name,
+            predicted=predicted,
+            target=target,
+        )
+        return JSONResponse(content=job.model_dump(mode="json"), status_code=HTTPStatus.ACCEPTED)
+
+    await score_and_store_submission(
+        appstate=appstate, competition=competition, submission_name=submission.name, predicted=predicted, target=target
+    )
+    return None
+
+
+@api_router.post(p.API_SUBMISSION_BINARY_SET, tags=["Submission"], status_code=HTTPStatus.NO_CONTENT)
+async def set_binary_submission(
+    appstate: Annotated[AppState, Depends(get_appstate)], name: str, competition_id: str, participant_id: str
+) -> None:
+    """
+    Alternative to the json submission for large targets: the body is a columnar payload with a `keys`
+    and a `values` (float32/float64) array, either as a `.npz` file (`np.savez`) or, if pyarrow is
+    installed on the server, as an Arrow IPC stream (content type `application/vnd.apache.arrow.stream`).
+    """
+    ensure_own_submission(participant=appstate.participant, participant_id=participant_id)
+    competition = await get_competition(appstate=appstate, competition_id=competition_id)
+    target = await appstate.target_indexes.get(competition.evaluation.target_dataset_url)
+
+    request = appstate.request
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    with raise_http_on_invalid_submission():
+        content = await read_limited(request.stream(), max_bytes=appstate.settings.SUBMISSION_MAX_BYTES)
+        keys, values = columns_from_bytes(content, media_type=media_type)
+        predicted = target.align(keys=keys, values=values)
+
+    await score_and_store_submission(
+        appstate=appstate, competition=competition, submission_name=name, predicted=predicted, target=target
+    )
+
 
-    metric = METRIC_LOGIC_MAP[competition.evaluation.metric]
-    score = score_submission(pred=predicted_ser, actual=actual_ser, metric=metric)
+async def score_and_store_submission(
+    appstate: AppState, competition: Competition, submission_name: str, predicted: np.ndarray, target: TargetIndex
+) -> SubmissionResult:
+    """Scores predictions already aligned to the target and stores the result for the current participant"""
+    with raise_http_on_invalid_submission():
+        score, secondary_scores = score_submission(
+            pred=predicted, actual=target.values, evaluation=competition.evaluation
+        )
 
     submission_result = SubmissionResult(
-        competition_id=submission.competition_id,
-        participant_id=submission.participant_id,
-        submission_name=submission.name,
+        competition_id=competition.id,
+        participant_id=appstate.participant.id,
+        submission_name=submission_name,
         score=score,
+        secondary_scores=secondary_scores,
     )
 
-    await repo.set_submission_result(submission_result=submission_result)
+    await appstate.data_repo.set_submission_result(submission_result=submission_result)
+    appstate.leaderboards.add([submission_result])
+    return submission_result
 
 
-@api_router.get(p.API_SUBMISSION_RESULT_LIST, tags=["Submission"])
-async def get_submission_results(
-    appstate: Annotated[AppState, Depends(get_appstate)], competition_id: str
+async def enqueue_submission(
+    appstate: AppState, competition: Competition, submission_name: str, predicted: np.ndarray, target: TargetIndex
+) -> ScoringJob:
+    queue = appstate.scoring_queue
+    if queue is None:
+        raise HTTPException(
+            detail="Asynchronous scoring is not enabled on this server", status_code=HTTPStatus.BAD_REQUEST
+        )
+    return await queue.enqueue(
+        competition_id=competition.id,
+        participant_id=appstate.participant.id,
+        submission_name=submission_name,
+        target_digest=target.digest,
+        predicted=predicted,
+    )
+
+
+@api_router.get(p.API_SUBMISSION_JOB_GET, tags=["Submission"])
+async def get_submission_job(appstate: Annotated[AppState, Depends(get_appstate)], job_id: ScoringJobId) -> ScoringJob:
+    queue = appstate.scoring_queue
+    job = None if queue is None else await queue.get(job_id)
+    if job is None or job.participant_id != appstate.participant.id:
+        raise_404_if_null(None, entity="Scoring job")
+    assert isinstance(job, ScoringJob)
+    return job
+
+
+@api_router.post(p.API_SUBMISSION_BATCH_SET, tags=["Submission"])
+async def set_batch_submission(
+    appstate: Annotated[AppState, Depends(get_appstate)], batch: BatchSubmission
 ) -> list[SubmissionResult]:
-    return await appstate.data_repo.get_submission_results(competition_id=competition_id)
+    """
+    Scores many candidate predictions for the same competition at once: the target is loaded once,
+    all predictions are scored together as a matrix and the results stored in a single write.
+    """
+    ensure_own_submission(participant=appstate.participant, participant_id=batch.participant_id)
+    max_size = appstate.settings.SUBMISSION_BATCH_MAX_SIZE
+    if len(batch.submissions) > max_size:
+        raise HTTPException(
+            detail=f"At most {max_size} submissions can be sent in a batch", status_code=HTTPStatus.BAD_REQUEST
+        )
+
+    competition = await get_competition(appstate=appstate, competition_id=batch.competition_id)
+    target = await appstate.target_indexes.get(competition.evaluation.target_dataset_url)
+
+    predicted = np.empty((len(batch.submissions), len(target)), dtype=np.float64)
+    for i, entry in enumerate(batch.submissions):
+        try:
+            predicted[i] = target.align(
+                keys=np.array(list(entry.predictions.keys()), dtype=str),
+                values=np.array(list(entry.predictions.values()), dtype=np.float64),
+            )
+        except KeyMismatch as e:
+            raise HTTPException(detail=f"Submission '{entry.name}': {e}", status_code=HTTPStatus.BAD_REQUEST)
+
+    with raise_http_on_invalid_submission():
+        scores = score_submissions(preds=predicted, actual=target.values, evaluation=competition.evaluation)
+
+    submission_results = [
+        SubmissionResult(
+            competition_id=competition.id,
+            participant_id=appstate.participant.id,
+            submission_name=entry.name,
+            score=score,
+            secondary_scores=secondary_scores,
+        )
+        for entry, (score, secondary_scores) in zip(batch.submissions, scores, strict=True)
+    ]
+    await appstate.data_repo.set_submission_results(submission_results=submission_results)
+    appstate.leaderboards.add(submission_results)
+    return submission_results
+
+
+@api_router.get(
+    p.API_SUBMISSION_RESULT_LIST,
+    tags=["Submission"],
+    response_model=list[SubmissionResult],
+    dependencies=[Depends(submission_results_not_modified)],
+)
+async def get_submission_results(
+    appstate: Annotated[AppState, Depends(get_appstate)],
+    response: Response,
+    competition_id: str,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.JSON,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    cursor: str | None = None,
+) -> Response | list[SubmissionResult]:
+    """
+    Results of the competition, in the order they were stored. The `ndjson` and `csv` formats are streamed
+    (to export large competitions). The `json` one can be paginated by passing a `limit`: the `X-Next-Cursor`
+    header of the response, if there are more results, is the `cursor` to pass to get the next page.
+    """
+    repo: DataRepositoryType = appstate.data_repo
+    if export_format == ExportFormat.NDJSON:
+        chunks = ndjson_chunks(submission_result_records(repo, competition_id))
+        return StreamingResponse(chunks, media_type=NDJSON_MEDIA_TYPE, headers=dict(response.headers))
+    if export_format == ExportFormat.CSV:
+        competition = await repo.get_competition(competition_id)
+        secondary_metrics = [] if competition is None else competition.evaluation.secondary_metrics
+        chunks = csv_chunks(submission_result_records(repo, competition_id), secondary_metrics=secondary_metrics)
+        return StreamingResponse(chunks, media_type=CSV_MEDIA_TYPE, headers=dict(response.headers))
+
+    if limit is None and cursor is None:
+        return await repo.get_submission_results(competition_id=competition_id)
+
+    try:
+        page = await repo.get_submission_results_page(
+            competition_id, page_size=limit or DEFAULT_PAGE_SIZE, continuation_token=cursor
+        )
+    except InvalidContinuationToken:
+        raise HTTPException(detail="Invalid cursor", status_code=HTTPStatus.BAD_REQUEST)
+    if page.continuation_token is not None:
+        response.headers["X-Next-Cursor"] = page.continuation_token
+    return page.results
+
+
+async def leaderboard_rows(appstate: AppState, entries: list[tuple[int, LeaderboardEntry]]) -> list[LeaderBoardRow]:
+    participants = await appstate.security_handler.get_participants(entry.participant_id for _, entry in entries)
+    return [
+        LeaderBoardRow(
+            position=position,
+            participant_name=participants[entry.participant_id].name,
+            best_submission_name=entry.best_submission_name,
+            best_submission_score=entry.best_submission_score,
+            best_submission_secondary_scores=entry.best_submission_secondary_scores,
+            n_entries=entry.n_entries,
+        )
+        for position, entry in entries
+    ]
+
+
+@api_router.get(p.API_LEADERBOARD_GET, tags=["Leaderboard"])
+async def get_leaderboard(
+    appstate: Annotated[AppState, Depends(get_appstate)],
+    competition_id: str,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    offset: Annotated[int, Query(ge=0)] = 0,
+) -> LeaderBoard:
+    competition = await get_competition(appstate=appstate, competition_id=competition_id)
+    competition_leaderboard = await appstate.leaderboards.get(competition)
+    return LeaderBoard(
+        rows=await leaderboard_rows(appstate, competition_leaderboard.rows(offset=offset, limit=limit)),
+        n_participants=len(competition_leaderboard),
+    )
+
+
+@api_router.get(p.API_LEADERBOARD_PARTICIPANT_GET, tags=["Leaderboard"])
+async def get_participant_leaderboard(
+    appstate: Annotated[AppState, Depends(get_appstate)],
+    competition_id: str,
+    participant_id: ParticipantId,
+    neighbours: Annotated[int, Query(ge=0, le=100)] = 5,
+) -> LeaderBoard:
+    """Rank of the participant, along with the `neighbours` participants right above and below them"""
+    competition = await get_competition(appstate=appstate, competition_id=competition_id)
+    competition_leaderboard = await appstate.leaderboards.get(competition)
+    entries = competition_leaderboard.around(participant_id=participant_id, neighbours=neighbours)
+    raise_404_if_null(entries, entity="Participant submission")
+    assert entries is not None
+    return LeaderBoard(rows=await leaderboard_rows(appstate, entries), n_participants=len(competition_leaderboard))
+
+
+@api_router.get(p.API_CACHE_STATS_GET, tags=["Monitoring"])
+async def get_cache_stats(appstate: Annotated[AppState, Depends(get_appstate)]) -> dict[str, CacheStats]:
+    stats = {"dataset": appstate.dataset_cache.stats, "fragments": appstate.fragments.stats}
+    if isinstance(appstate.data_repo, CachingDataRepository):
+        stats["repository"] = appstate.data_repo.stats
+    return stats
@@ -1,9 +1,20 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
 from pydantic import BaseModel, ConfigDict
 from starlette.requests import Request
 
 from app.models.participant import Participant
 from app.security.protocol import SecurityHandler
+from app.settings import Settings
+from app.utils.dataset_cache import DatasetCache
+from app.utils.dataset_mirror import DatasetMirror
+from app.utils.http import etag_matches, strong_etag
+from app.utils.job_queue import ScoringJobQueue
+from app.utils.leaderboard import Leaderboards
 from app.utils.repositories import DataRepositoryType
+from app.utils.target_index import TargetIndexCache
+from app.utils.templates import FragmentCache
 
 
 class AppState(BaseModel):
@@ -12,6 +23,10 @@ class AppState(BaseModel):
     request: Request
     participant: Participant
 
+    @property
+    def settings(self) -> Settings:
+        return self.request.app.state.settings
+
     @property
     def data_repo(self) -> DataRepositoryType:
         return self.request.app.state.repos.data_repository
@@ -20,6 +35,30 @@ class AppState(BaseModel):
     def security_handler(self) -> SecurityHandler:
         return self.request.app.state.security_handler
 
+    @property
+    def dataset_cache(self) -> DatasetCache:
+        return self.request.app.state.dataset_cache
+
+    @property
+    def dataset_mirror(self) -> DatasetMirror | None:
+        return self.request.app.state.dataset_mirror
+
+    @property
+    def target_indexes(self) -> TargetIndexCache:
+        return self.request.app.state.target_indexes
+
+    @property
+    def leaderboards(self) -> Leaderboards:
+        return self.request.app.state.leaderboards
+
+    @property
+    def scoring_queue(self) -> ScoringJobQueue | None:
+        return self.request.app.state.scoring_queue
+
+    @property
+    def fragments(self) -> FragmentCache:
+        return self.request.app.state.fragments
+
     @property
     def base_content(self) -> dict:
         return {"request": self.request, "participant": self.participant}
@@ -29,3 +68,19 @@ async def get_appstate(request: Request) -> AppState:
     security_handler: SecurityHandler = request.app.state.security_handler
     participant = await security_handler.authorize_participant(request=request)
     return AppState(request=request, participant=participant)
+
+
+def ensure_modified(appstate: AppState, versions: list[str], per_participant: bool = False) -> str:
+    """
+    Strong ETag of the response to the request, given the build of the app and the versions of the data
+    it's built from (and, for responses that differ by participant, the participant). Raises a 304 if the client already
+    has the response, so that the data doesn't even need reading.
+    """
+    request = appstate.request
+    parts = [request.app.state.build_fingerprint, request.url.path, request.url.query, *versions]
+    if per_participant:
+        parts.append(appstate.participant.id)
+    etag = strong_etag(*parts)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+    return etag
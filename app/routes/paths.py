@@ -10,6 +10,13 @@ API_PARTICIPANT_SET = "/api/participant"
 API_COMPETITIONS_LIST = "/api/competitions"
 API_COMPETITION_SET = "/api/competition"
 API_COMPETITION_GET = "/api/competition/{competition_id}"
+API_COMPETITION_DATASET_GET = "/api/competition/{competition_id}/dataset"
 API_SUBMISSION_SET = "/api/submission"
+API_SUBMISSION_BINARY_SET = "/api/submission/binary"
+API_SUBMISSION_BATCH_SET = "/api/submission/batch"
 API_SUBMISSION_TEMPLATE_GET = "/api/submission-template/{competition_id}"
+API_SUBMISSION_JOB_GET = "/api/submission-job/{job_id}"
 API_SUBMISSION_RESULT_LIST = "/api/submission-results/{competition_id}"
+API_LEADERBOARD_GET = "/api/leaderboard/{competition_id}"
+API_LEADERBOARD_PARTICIPANT_GET = "/api/leaderboard/{competition_id}/participant/{participant_id}"
+API_CACHE_STATS_GET = "/api/cache-stats"
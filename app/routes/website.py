@@ -1,81 +1,133 @@
-from http import HTTPStatus
+from collections.abc import Callable
 from typing import Annotated, Any
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Response, UploadFile
 
 import app.routes.paths as p
 from app.constants import TEMPLATES
 from app.models.competiton import Competition
-from app.models.evaluation import METRIC_LOGIC_MAP
-from app.models.leaderboard import LeaderBoard, LeaderBoardRow
-from app.models.participant import ParticipantId
-from app.models.submission import Submission
-from app.routes.api import get_competition, get_competitions, get_submission_results, set_submission
-from app.routes.common import AppState, get_appstate
-from app.security.protocol import SecurityHandler
-from app.utils.parse_csv import series_from_bytes
+from app.routes.api import (
+    get_competition,
+    get_competitions,
+    leaderboard_rows,
+    raise_http_on_invalid_submission,
+    score_and_store_submission,
+)
+from app.routes.common import AppState, ensure_modified, get_appstate
+from app.utils.ingestion import read_aligned_predictions
 
 website_router = APIRouter(include_in_schema=False)
 
 
+async def page_etag(appstate: Annotated[AppState, Depends(get_appstate)]) -> str:
+    return ensure_modified(appstate, [], per_participant=True)
+
+
+async def competitions_page_etag(appstate: Annotated[AppState, Depends(get_appstate)]) -> str:
+    return ensure_modified(appstate, [await appstate.data_repo.get_version()], per_participant=True)
+
+
+async def leaderboard_version(appstate: AppState, competition_id: str) -> str:
+    return f"{await appstate.data_repo.get_version(competition_id)}|{appstate.leaderboards.built_at(competition_id)}"
+
+
+async def competition_page_etag(appstate: Annotated[AppState, Depends(get_appstate)], competition_id: str) -> str:
+    # the leaderboard only picks up the results stored by other processes when it's rebuilt, which
+    # happens first if it's due (it's otherwise already in memory)
+    competition = await appstate.data_repo.get_competition(competition_id)
+    if competition is not None:
+        await appstate.leaderboards.get(competition)
+    versions = [await appstate.data_repo.get_version(), await leaderboard_version(appstate, competition_id)]
+    return ensure_modified(appstate, versions, per_participant=True)
+
+
 @website_router.get(p.WEB_ROOT)
-async def home(appstate: Annotated[AppState, Depends(get_appstate)]) -> Any:
-    return TEMPLATES.TemplateResponse("home.html", appstate.base_content)
+async def home(appstate: Annotated[AppState, Depends(get_appstate)], etag: Annotated[str, Depends(page_etag)]) -> Any:
+    return TEMPLATES.TemplateResponse("home.html", appstate.base_content, headers={"ETag": etag})
 
 
 @website_router.get(p.WEB_COMPETITIONS_LIST)
-async def competition_list(appstate: Annotated[AppState, Depends(get_appstate)]) -> Any:
+async def competition_list(
+    appstate: Annotated[AppState, Depends(get_appstate)], etag: Annotated[str, Depends(competitions_page_etag)]
+) -> Any:
     competitions = await get_competitions(appstate=appstate)
-    return TEMPLATES.TemplateResponse("competitions.html", appstate.base_content | {"competitions": competitions})
+    return TEMPLATES.TemplateResponse(
+        "competitions.html", appstate.base_content | {"competitions": competitions}, headers={"ETag": etag}
+    )
 
 
 @website_router.get(p.WEB_COMPETITION_GET)
-async def competition_detail(competition_id: str, appstate: Annotated[AppState, Depends(get_appstate)]) -> Any:
+async def competition_detail(
+    competition_id: str,
+    appstate: Annotated[AppState, Depends(get_appstate)],
+    etag: Annotated[str, Depends(competition_page_etag)],
+) -> Any:
+    response = await render_competition(competition_id=competition_id, appstate=appstate)
+    response.headers["ETag"] = etag
+    return response
+
+
+async def render_competition(competition_id: str, appstate: AppState) -> Response:
+    """
+    The description and the top of the leaderboard are the same for every participant, they are rendered
+    once per version of the data they show (the competition, its leaderboard) and the fragments reused.
+    The rest of the page, including the current participant's row if they are further down, is rendered each time.
+    """
     try:
         competition = await get_competition(appstate=appstate, competition_id=competition_id)
     except HTTPException:
         return TEMPLATES.TemplateResponse("competition.html", appstate.base_content | {"competition": None})
 
     assert isinstance(competition, Competition)
-    leaderboard = await _build_leaderboard(competition=competition, appstate=appstate)
+    competition_leaderboard = await appstate.leaderboards.get(competition)
+    top_entries = competition_leaderboard.rows(limit=appstate.settings.LEADERBOARD_PAGE_SIZE)
+
+    async def _render_description() -> str:
+        return _render_fragment(
+            "_competition_description.html", competition=competition, dataset_link=_dataset_link(appstate, competition)
+        )
+
+    async def _render_top_rows() -> str:
+        rows = await leaderboard_rows(appstate, top_entries)
+        return _render_fragment("_leaderboard_rows.html", rows=rows, competition=competition)
+
+    description = await appstate.fragments.get(
+        ("description", competition.id), version="", render=_render_description  # competitions don't change
+    )
+    top_rows = await appstate.fragments.get(
+        ("leaderboard", competition.id, appstate.settings.LEADERBOARD_PAGE_SIZE),
+        version=await leaderboard_version(appstate, competition.id),
+        render=_render_top_rows,
+    )
+    participant_entries = competition_leaderboard.around(participant_id=appstate.participant.id, neighbours=0) or []
+    if participant_entries and participant_entries[0][0] <= len(top_entries):
+        participant_entries = []
+
     return TEMPLATES.TemplateResponse(
-        "competition.html", appstate.base_content | {"competition": competition, "leaderboard": leaderboard}
+        "competition.html",
+        appstate.base_content
+        | {
+            "competition": competition,
+            "description": description,
+            "leaderboard_rows": top_rows,
+            "participant_rows": await leaderboard_rows(appstate, participant_entries),
+            "n_top_rows": len(top_entries),
+            "n_participants": len(competition_leaderboard),
+        },
     )
 
 
-async def _build_leaderboard(competition: Competition, appstate: AppState) -> LeaderBoard | None:
-    submission_results = await get_submission_results(appstate=appstate, competition_id=competition.id)
-    if not submission_results:
-        return None
-
-    metric = METRIC_LOGIC_MAP[competition.evaluation.metric]
-    participant_rows: dict[ParticipantId, LeaderBoardRow] = {}
-    security_handler: SecurityHandler = appstate.security_handler
-    for sr in submission_results:
-        if sr.participant_id not in participant_rows:
-            _participant = await security_handler.get_participant(participant_id=sr.participant_id)
-
-            participant_rows[sr.participant_id] = LeaderBoardRow(
-                position=-1,
-                participant_name=_participant.name,
-                best_submission_name=sr.submission_name,
-                best_submission_score=sr.score,
-                n_entries=1,
-            )
-        else:
-            _row = participant_rows[sr.participant_id]
-            _row.n_entries += 1
-            if metric.sort_multiplier * sr.score > metric.sort_multiplier * _row.best_submission_score:
-                _row.best_submission_name = sr.submission_name
-                _row.best_submission_score = sr.score
-
-    sorted_rows = sorted(participant_rows.values(), key=lambda x: -metric.sort_multiplier * x.best_submission_score)
-    positioned_rows = []
-    for i, row in enumerate(sorted_rows):
-        row.position = i + 1
-        positioned_rows.append(row)
-
-    return LeaderBoard(rows=positioned_rows)
+def _dataset_link(appstate: AppState, competition: Competition) -> Callable[[str], str]:
+    """Datasets are downloaded through the app when they are mirrored"""
+    if appstate.dataset_mirror is None:
+        return lambda url: url
+    path = p.API_COMPETITION_DATASET_GET.format(competition_id=competition.id)
+    return lambda url: f"{path}?{urlencode({'url': url})}"
+
+
+def _render_fragment(template_name: str, **context: Any) -> str:
+    return TEMPLATES.get_template(template_name).render(**context)
 
 
 @website_router.post(p.WEB_COMPETITION_SUBMIT)
@@ -85,26 +137,18 @@ async def competition_submit(
     predictions: Annotated[UploadFile, File()],
     appstate: Annotated[AppState, Depends(get_appstate)],
 ) -> Any:
-    try:
-        pred_ser = series_from_bytes(await predictions.read())
-    except Exception:
-        raise HTTPException(
-            detail="Could not load and parse the data. Check it is formatted according to the submission template.",
-            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
-        )
-
-    if nulls := pred_ser.isna().sum():
-        raise HTTPException(
-            detail=f"Found {nulls} null values in the submitted data. "
-            f"Please fill the NaN with whichever logic you think is fit.",
-            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+    competition = await get_competition(appstate=appstate, competition_id=competition_id)
+    target = await appstate.target_indexes.get(competition.evaluation.target_dataset_url)
+    settings = appstate.settings
+    with raise_http_on_invalid_submission():
+        predicted = await read_aligned_predictions(
+            predictions,
+            target=target,
+            chunk_size=settings.SUBMISSION_CHUNK_BYTES,
+            max_bytes=settings.SUBMISSION_MAX_BYTES,
         )
 
-    submission = Submission(
-        name=name,
-        competition_id=competition_id,
-        participant_id=appstate.participant.id,
-        predictions=pred_ser.to_dict(),
+    await score_and_store_submission(
+        appstate=appstate, competition=competition, submission_name=name, predicted=predicted, target=target
     )
-    await set_submission(appstate=appstate, submission=submission)
-    return await competition_detail(competition_id=competition_id, appstate=appstate)
+    return await render_competition(competition_id=competition_id, appstate=appstate)
@@ -1,8 +1,10 @@
 import datetime as dt
+from collections.abc import Iterable
 
 from fastapi import Request
 
 from app.models.participant import Participant, ParticipantId, Permission
+from app.security.cache import ParticipantCache
 from app.settings import Settings
 
 
@@ -19,6 +21,7 @@ class BasicHeaderSecurity:
     the environment variable ADMIN_PARTICIPANT_IDS.
 
     Participant are entirely based on the email in the injected header key.
+    Resolved participants are cached (see `ParticipantCache`).
     """
 
     _header_key = "x-ms-client-principal-name"
@@ -26,12 +29,24 @@ class BasicHeaderSecurity:
 
     def __init__(self, settings: Settings) -> None:
         self._admin_ids = settings.ADMIN_PARTICIPANT_IDS.split(",")
+        self._cache = ParticipantCache(
+            max_entries=settings.PARTICIPANT_CACHE_MAX_ENTRIES, ttl_seconds=settings.PARTICIPANT_CACHE_TTL_SECONDS
+        )
 
     async def authorize_participant(self, request: Request) -> Participant:
         participant_id = request.headers.get(self._header_key, "unknown.guest@_")
         return await self.get_participant(participant_id=participant_id)
 
     async def get_participant(self, participant_id: ParticipantId) -> Participant:
+        return (await self.get_participants([participant_id]))[participant_id]
+
+    async def get_participants(self, participant_ids: Iterable[ParticipantId]) -> dict[ParticipantId, Participant]:
+        return await self._cache.get_many(participant_ids, resolve=self._resolve_participants)
+
+    async def _resolve_participants(self, participant_ids: list[ParticipantId]) -> dict[ParticipantId, Participant]:
+        return {participant_id: self._participant_from_id(participant_id) for participant_id in participant_ids}
+
+    def _participant_from_id(self, participant_id: ParticipantId) -> Participant:
         name, *_, lastname = participant_id.split("@")[0].split(".")
         return Participant(
             id=participant_id,
@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+
+from app.models.participant import Participant, ParticipantId
+
+ResolveParticipantsType = Callable[[list[ParticipantId]], Awaitable[dict[ParticipantId, Participant]]]
+
+
+class ParticipantCache:
+    """
+    LRU of the participants resolved by a security handler, bounded by `max_entries`.
+    Entries expire after `ttl_seconds`, so changes to a participant (e.g. their permissions) are picked up.
+    """
+
+    _entries: OrderedDict[ParticipantId, tuple[Participant, float]]  # id -> (participant, expires at)
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    async def get_many(
+        self, participant_ids: Iterable[ParticipantId], resolve: ResolveParticipantsType
+    ) -> dict[ParticipantId, Participant]:
+        """Participants from the cache, the missing ones are resolved with a single call to `resolve`"""
+        now = time.monotonic()
+        found: dict[ParticipantId, Participant] = {}
+        missing: list[ParticipantId] = []
+        for participant_id in dict.fromkeys(participant_ids):
+            entry = self._entries.get(participant_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(participant_id)
+                found[participant_id] = entry[0]
+            else:
+                missing.append(participant_id)
+
+        if missing:
+            resolved = await resolve(missing)
+            for participant_id, participant in resolved.items():
+                self._entries[participant_id] = (participant, now + self.ttl_seconds)
+                self._entries.move_to_end(participant_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            found.update(resolved)
+
+        return found
@@ -1,3 +1,4 @@
+from collections.abc import Iterable
 from typing import Protocol
 
 from fastapi import Request
@@ -16,3 +17,7 @@ class SecurityHandler(Protocol):
     async def get_participant(self, participant_id: ParticipantId) -> Participant:
         """Retrieves the information of a participant given the id"""
         ...  # pragma: no cover
+
+    async def get_participants(self, participant_ids: Iterable[ParticipantId]) -> dict[ParticipantId, Participant]:
+        """Retrieves the information of many participants at once, by id"""
+        ...  # pragma: no cover
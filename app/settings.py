@@ -5,5 +5,37 @@ from app.constants import AZURE_WEBAPP_HEADER, IN_MEMORY
 
 class Settings(BaseSettings):
     DATA_REPOSITORY_CONNECTION_STRING: str = IN_MEMORY
+    DATA_REPOSITORY_CACHE_MAX_ENTRIES: int = 0  # 0 disables the cache
+    DATA_REPOSITORY_CACHE_COMPETITION_TTL_SECONDS: float = 60
+    DATA_REPOSITORY_CACHE_PARTICIPANT_TTL_SECONDS: float = 300
+    DATA_REPOSITORY_SNAPSHOT_PATH: str = ""  # in-memory repository only, see `RepositorySnapshot`
     PARTICIPANT_HANDLER: str = AZURE_WEBAPP_HEADER
     ADMIN_PARTICIPANT_IDS: str = ""
+    PARTICIPANT_CACHE_MAX_ENTRIES: int = 10_000
+    PARTICIPANT_CACHE_TTL_SECONDS: float = 300
+    DATASET_CACHE_DIR: str = ""
+    DATASET_CACHE_MAX_BYTES: int = 256 * 1024**2
+    DATASET_CACHE_TTL_SECONDS: float = 60
+    DATASET_FETCH_MAX_CONNECTIONS: int = 100
+    DATASET_FETCH_MAX_CONNECTIONS_PER_HOST: int = 8
+    DATASET_FETCH_TIMEOUT_SECONDS: float = 60
+    DATASET_MIRROR_DIR: str = ""  # not mirrored if not set
+    DATASET_MIRROR_MAX_DOWNLOADS: int = 2
+    DATASET_MIRROR_MAX_TRANSFERS: int = 32
+    DATASET_MIRROR_CHUNK_BYTES: int = 1024**2
+    SUBMISSION_CHUNK_BYTES: int = 4 * 1024**2
+    SUBMISSION_MAX_BYTES: int = 1024**3
+    SUBMISSION_BATCH_MAX_SIZE: int = 100
+    SUBMISSION_TEMPLATE_PREPARE: bool = True  # whether to prepare the template when a competition is created
+    SUBMISSION_RESULT_FLUSH_SECONDS: float = 0
+    SUBMISSION_RESULT_FLUSH_SIZE: int = 100
+    SUBMISSION_RESULT_WAIT_FOR_FLUSH: bool = True
+    LEADERBOARD_MAX_AGE_SECONDS: float = 60
+    LEADERBOARD_PAGE_SIZE: int = 100
+    SCORING_QUEUE_PATH: str = ""
+    SCORING_WORKERS: int = 2  # scoring processes per queue (i.e. per host), not per app worker
+    SCORING_MAX_ATTEMPTS: int = 3
+    SCORING_POLL_SECONDS: float = 1
+    SCORING_LEASE_SECONDS: float = 600
+    TEMPLATES_BYTECODE_CACHE_DIR: str = ""  # a temporary directory if not set
+    TEMPLATES_AUTO_RELOAD: bool = False  # whether changes to the templates are picked up without a restart
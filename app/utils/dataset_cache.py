@@ -0,0 +1,196 @@
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from pathlib import Path
+
+from app.models.cache import CacheStats
+from app.settings import Settings
+from app.utils.fetcher import DatasetFetcher, SingleFlight
+
+
+@dataclasses.dataclass
+class CachedDataset:
+    url: str
+    content: bytes
+    digest: str  # sha256 of the content, identifies the version of the dataset
+    etag: str | None = None
+    last_modified: str | None = None
+    validated_at: float = 0.0  # time.time() of the last download or successful revalidation
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    def metadata(self) -> dict:
+        return {
+            "url": self.url,
+            "digest": self.digest,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "validated_at": self.validated_at,
+        }
+
+
+class DatasetCache:
+    """
+    Two tier (memory + disk) cache of remote datasets, keyed by url.
+
+    The memory tier is an LRU bounded by the total size in bytes of the cached content.
+    The optional disk tier (enabled by passing `cache_dir`) survives restarts and is shared
+    across the processes of the same host.
+
+    Entries younger than `ttl_seconds` are served without contacting the origin, older ones
+    are revalidated with a conditional request (`If-None-Match`/`If-Modified-Since`) and only
+    downloaded again if the origin reports a change.
+    Concurrent requests for the same url share a single lookup, and so a single download.
+    """
+
+    _memory: OrderedDict[str, CachedDataset]
+    _memory_size: int
+    _single_flight: SingleFlight[CachedDataset]
+
+    def __init__(
+        self, fetcher: DatasetFetcher, max_bytes: int, ttl_seconds: float, cache_dir: Path | None = None
+    ) -> None:
+        self.fetcher = fetcher
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self.stats = CacheStats()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._single_flight = SingleFlight()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    async def get(self, url: str) -> CachedDataset:
+        entry = self._memory.get(url)
+        if entry is not None and self._is_fresh(entry):
+            self._memory.move_to_end(url)
+            self.stats.hits += 1
+            return entry
+
+        return await self._single_flight.run(url, lambda: self._get_or_fetch(url))
+
+    def _is_fresh(self, entry: CachedDataset) -> bool:
+        return time.time() - entry.validated_at < self.ttl_seconds
+
+    async def _get_or_fetch(self, url: str) -> CachedDataset:
+        entry = await self._get_cached(url)
+        if entry is not None and self._is_fresh(entry):
+            self.stats.hits += 1
+            return entry
+
+        if entry is not None:
+            self.stats.revalidations += 1
+            response = await self.fetcher.fetch(url, headers=_conditional_headers(entry))
+            if response.status == HTTPStatus.NOT_MODIFIED:
+                self.stats.hits += 1
+                entry.validated_at = time.time()
+                await self._store(entry)
+                return entry
+        else:
+            response = await self.fetcher.fetch(url)
+
+        self.stats.misses += 1
+        entry = CachedDataset(
+            url=url,
+            content=response.content,
+            digest=hashlib.sha256(response.content).hexdigest(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            validated_at=time.time(),
+        )
+        await self._store(entry, content_changed=True)
+        return entry
+
+    async def _get_cached(self, url: str) -> CachedDataset | None:
+        if url in self._memory:
+            self._memory.move_to_end(url)
+            return self._memory[url]
+
+        entry = await asyncio.to_thread(self._read_from_disk, url)
+        if entry is not None:
+            self._add_to_memory(entry)
+        return entry
+
+    async def _store(self, entry: CachedDataset, content_changed: bool = False) -> None:
+        self._add_to_memory(entry)
+        if self.cache_dir is not None:
+            await asyncio.to_thread(self._write_to_disk, entry, content_changed)
+
+    def _add_to_memory(self, entry: CachedDataset) -> None:
+        if (previous := self._memory.pop(entry.url, None)) is not None:
+            self._memory_size -= previous.size
+
+        if entry.size <= self.max_bytes:
+            self._memory[entry.url] = entry
+            self._memory_size += entry.size
+
+        while self._memory_size > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= evicted.size
+            self.stats.evictions += 1
+
+        self.stats.entries = len(self._memory)
+        self.stats.size_bytes = self._memory_size
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        assert self.cache_dir is not None
+        stem = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{stem}.data", self.cache_dir / f"{stem}.json"
+
+    def _read_from_disk(self, url: str) -> CachedDataset | None:
+        if self.cache_dir is None:
+            return None
+
+        data_path, meta_path = self._paths(url)
+        try:
+            metadata = json.loads(meta_path.read_text())
+            content = data_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+
+        if metadata.get("url") != url or hashlib.sha256(content).hexdigest() != metadata.get("digest"):
+            return None
+        return CachedDataset(content=content, **metadata)
+
+    def _write_to_disk(self, entry: CachedDataset, content_changed: bool) -> None:
+        data_path, meta_path = self._paths(entry.url)
+        if content_changed:
+            atomic_write(data_path, entry.content)
+        atomic_write(meta_path, json.dumps(entry.metadata()).encode())
+
+
+def _conditional_headers(entry: CachedDataset) -> dict[str, str]:
+    headers = {}
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def atomic_write(path: Path, content: bytes) -> None:
+    tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            tmp_path.unlink()
+
+
+def create_dataset_cache(settings: Settings, fetcher: DatasetFetcher) -> DatasetCache:
+    return DatasetCache(
+        fetcher=fetcher,
+        max_bytes=settings.DATASET_CACHE_MAX_BYTES,
+        ttl_seconds=settings.DATASET_CACHE_TTL_SECONDS,
+        cache_dir=Path(settings.DATASET_CACHE_DIR) if settings.DATASET_CACHE_DIR else None,
+    )
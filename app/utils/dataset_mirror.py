@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import dataclasses
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections.abc import AsyncIterator, Iterable
+from pathlib import Path
+
+from app.models.competiton import Competition
+from app.settings import Settings
+from app.utils.dataset_cache import atomic_write
+from app.utils.fetcher import DatasetFetcher
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_RETRY_AFTER_SECONDS = 5  # suggested to the clients refused a transfer
+
+
+@dataclasses.dataclass(frozen=True)
+class MirroredDataset:
+    url: str
+    path: Path
+    size: int
+    sha256: str  # hex digest of the content
+
+    def metadata(self) -> dict:
+        return {"url": self.url, "size": self.size, "sha256": self.sha256}
+
+
+def public_dataset_urls(competition: Competition) -> list[str]:
+    """Urls of the datasets given to the participants (the evaluation target is not one of them)"""
+    return [i.url for i in competition.data] + [competition.evaluation.feature_dataset_url]
+
+
+class DatasetMirror:
+    """
+    Copies of the competition datasets on local disk, so that participants download them from the app
+    rather than all at once from their origin.
+
+    Datasets are mirrored in the background, at most `max_downloads` at once, streamed to disk and
+    checksummed on the way. They are only visible once complete. The mirror directory survives restarts and
+    can be shared by the processes of a host: a lock file per dataset makes sure only one of them downloads
+    it, the others wait for it to be mirrored. Reading them back is also streamed, and at most
+    `max_transfers` are read at once: a transfer is only started once `reserve_transfer` got it a slot,
+    which is given back with `release_transfer` when it ends.
+    """
+
+    _datasets: dict[str, MirroredDataset]
+    _mirroring: dict[str, "asyncio.Task[None]"]
+
+    def __init__(
+        self,
+        fetcher: DatasetFetcher,
+        mirror_dir: Path,
+        max_downloads: int,
+        max_transfers: int,
+        chunk_bytes: int,
+        lock_poll_seconds: float = 1,
+    ) -> None:
+        self.fetcher = fetcher
+        self.mirror_dir = mirror_dir
+        self.mirror_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_bytes = chunk_bytes
+        self.lock_poll_seconds = lock_poll_seconds
+        self.max_transfers = max_transfers
+        self._downloads = asyncio.Semaphore(max_downloads)
+        self._n_transfers = 0
+        self._datasets = {}
+        self._mirroring = {}
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        stem = hashlib.sha256(url.encode()).hexdigest()
+        return self.mirror_dir / f"{stem}.data", self.mirror_dir / f"{stem}.json"
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, url: str) -> AsyncIterator[None]:
+        """Exclusive lock on a dataset across the processes sharing the mirror directory, waits for it if taken"""
+        lock_path = self._paths(url)[0].with_suffix(".lock")
+        fd = await asyncio.to_thread(os.open, lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.lock_poll_seconds)
+            yield
+        finally:
+            os.close(fd)  # which releases the lock
+
+    async def get(self, url: str) -> MirroredDataset | None:
+        """The dataset if it's been mirrored, by this process or another"""
+        if url not in self._datasets and (dataset := await asyncio.to_thread(self._read_metadata, url)) is not None:
+            self._datasets[url] = dataset
+        return self._datasets.get(url)
+
+    def _read_metadata(self, url: str) -> MirroredDataset | None:
+        data_path, metadata_path = self._paths(url)
+        try:
+            metadata = json.loads(metadata_path.read_text())
+            size = data_path.stat().st_size
+        except (OSError, ValueError):
+            return None
+
+        if metadata.get("url") != url or metadata.get("size") != size:
+            return None
+        return MirroredDataset(path=data_path, **metadata)
+
+    def mirror(self, urls: Iterable[str]) -> None:
+        """Mirrors the datasets not mirrored yet, in the background"""
+        for url in urls:
+            if url not in self._mirroring:
+                self._start_mirroring(url)
+
+    def _start_mirroring(self, url: str) -> None:
+        task = self._mirroring[url] = asyncio.create_task(self._mirror(url))
+        task.add_done_callback(lambda _: self._mirroring.pop(url, None))
+
+    async def _mirror(self, url: str) -> None:
+        # if it fails, the dataset keeps being served from its origin until it's mirrored again (on restart)
+        try:
+            if await self.get(url) is not None:
+                return
+            async with self._lock(url):
+                # it may have been mirrored by another process while waiting for the lock
+                if await self.get(url) is None:
+                    async with self._downloads:
+                        self._datasets[url] = await self._download(url)
+        except Exception:
+            logger.warning("Failed to mirror %s, it keeps being served from its origin", url, exc_info=True)
+
+    async def _download(self, url: str) -> MirroredDataset:
+        data_path, metadata_path = self._paths(url)
+        partial_path = data_path.with_suffix(f".{uuid.uuid4().hex}.part")
+        try:
+            size, sha256 = await self.fetcher.download(url, partial_path, chunk_bytes=self.chunk_bytes)
+            dataset = MirroredDataset(url=url, path=data_path, size=size, sha256=sha256)
+            await asyncio.to_thread(os.replace, partial_path, data_path)
+            await asyncio.to_thread(atomic_write, metadata_path, json.dumps(dataset.metadata()).encode())
+        finally:
+            partial_path.unlink(missing_ok=True)
+        return dataset
+
+    def reserve_transfer(self) -> bool:
+        """Takes a transfer slot, if there's a free one"""
+        if self._n_transfers >= self.max_transfers:
+            return False
+        self._n_transfers += 1
+        return True
+
+    def release_transfer(self) -> None:
+        self._n_transfers -= 1
+
+    async def read(self, dataset: MirroredDataset, start: int, stop: int) -> AsyncIterator[bytes]:
+        """Streams the bytes from `start` to `stop` of the dataset"""
+        with dataset.path.open("rb") as f:
+            f.seek(start)
+            while start < stop:
+                chunk = await asyncio.to_thread(f.read, min(self.chunk_bytes, stop - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                yield chunk
+
+    async def close(self) -> None:
+        tasks = list(self._mirroring.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def create_dataset_mirror(settings: Settings, fetcher: DatasetFetcher) -> DatasetMirror | None:
+    if not settings.DATASET_MIRROR_DIR:
+        return None
+    return DatasetMirror(
+        fetcher=fetcher,
+        mirror_dir=Path(settings.DATASET_MIRROR_DIR),
+        max_downloads=settings.DATASET_MIRROR_MAX_DOWNLOADS,
+        max_transfers=settings.DATASET_MIRROR_MAX_TRANSFERS,
+        chunk_bytes=settings.DATASET_MIRROR_CHUNK_BYTES,
+    )
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from enum import Enum
+
+from app.models.competiton import CompetitionId
+from app.models.evaluation import EvaluationMetric
+from app.utils.repositories import DataRepositoryType, submission_result_columns
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+EXPORT_CHUNK_SIZE = 1000  # results per chunk of the streamed response
+
+
+class ExportFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+async def submission_result_records(
+    repository: DataRepositoryType, competition_id: CompetitionId, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[list[dict]]:
+    """
+    The results of the competition as json serialisable dicts (shaped as `SubmissionResult`), `chunk_size` at
+    a time. Results kept in memory are converted from their columns, without building a `SubmissionResult`.
+    """
+    columns = submission_result_columns(repository, competition_id)
+    if columns is not None:
+        n_rows = len(columns)  # results stored while exporting are left out, as with the other repositories
+        for start in range(0, n_rows, chunk_size):
+            yield columns.records(start, min(start + chunk_size, n_rows))
+        return
+
+    records = []
+    async for submission_result in repository.iter_submission_results(competition_id):
+        records.append(submission_result.model_dump(mode="json"))
+        if len(records) == chunk_size:
+            yield records
+            records = []
+    if records:
+        yield records
+
+
+async def ndjson_chunks(records: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    """One json object per line, sent a chunk of records at a time"""
+    async for chunk in records:
+        yield "".join(json.dumps(i, separators=(",", ":"), ensure_ascii=False) + "\n" for i in chunk).encode()
+
+
+async def csv_chunks(
+    records: AsyncIterator[list[dict]], secondary_metrics: list[EvaluationMetric]
+) -> AsyncIterator[bytes]:
+    """
+    A row per result, with a column per secondary metric (as the columns have to be known before the
+    first row, they are the metrics of the competition), sent a chunk of records at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(
+        ["competition_id", "participant_id", "submission_name", "score", *(i.value for i in secondary_metrics)]
+    )
+    async for chunk in records:
+        writer.writerows(
+            [
+                i["competition_id"],
+                i["participant_id"],
+                i["submission_name"],
+                i["score"],
+                *(i["secondary_scores"].get(metric.value, "") for metric in secondary_metrics),
+            ]
+            for i in chunk
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # only the header, if there are no results
+        yield buffer.getvalue().encode()
@@ -0,0 +1,130 @@
+import asyncio
+import dataclasses
+import hashlib
+from collections.abc import Awaitable, Callable, Hashable, Mapping
+from http import HTTPStatus
+from pathlib import Path
+from typing import IO, Any, Generic, TypeVar
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from app.settings import Settings
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls sharing the same key into a single execution.
+
+    The first caller starts the work as a task, any caller arriving while it is still running
+    awaits the same result (or exception). Cancelling one of the waiters does not cancel the
+    work for the others.
+    """
+
+    _in_flight: dict[Hashable, "asyncio.Task[T]"]
+
+    def __init__(self) -> None:
+        self._in_flight = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+@dataclasses.dataclass
+class FetchResult:
+    status: int
+    content: bytes
+    headers: Mapping[str, str]  # case insensitive
+
+
+class DatasetFetcher:
+    """
+    Non-blocking http client used to download datasets.
+
+    A single `aiohttp.ClientSession` (and so a single connection pool) is shared by all requests
+    for the lifetime of the app, it is created lazily as it must be bound to the running loop.
+    The number of concurrent requests towards the same host is capped and every request
+    (including the time waiting for a free slot) must complete within `timeout_seconds`.
+    """
+
+    _session: aiohttp.ClientSession | None
+    _host_semaphores: dict[str, asyncio.Semaphore]
+
+    def __init__(self, max_connections: int, max_connections_per_host: int, timeout_seconds: float) -> None:
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout_seconds = timeout_seconds
+        self._session = None
+        self._host_semaphores = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_semaphores[host]
+
+    async def fetch(self, url: str, headers: dict[str, str] | None = None) -> FetchResult:
+        """Downloads the whole body, raises `aiohttp.ClientResponseError` for error statuses"""
+        async with (
+            asyncio.timeout(self.timeout_seconds),
+            self._host_semaphore(url),
+            self.session.get(url, headers=headers) as response,
+        ):
+            if response.status != HTTPStatus.NOT_MODIFIED:
+                response.raise_for_status()
+            content = await response.read()
+            return FetchResult(status=response.status, content=content, headers=response.headers.copy())
+
+    async def download(self, url: str, path: Path, chunk_bytes: int) -> tuple[int, str]:
+        """
+        Streams the body to a file, rather than holding it in memory, and returns its size and sha256.
+        As downloads of large files take a while, the timeout applies to each read rather than to the whole.
+        """
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout_seconds, sock_read=self.timeout_seconds)
+        digest = hashlib.sha256()
+        size = 0
+        async with self._host_semaphore(url), self.session.get(url, timeout=timeout) as response:
+            response.raise_for_status()
+            with path.open("wb") as f:
+                async for chunk in response.content.iter_chunked(chunk_bytes):
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+                    size += len(chunk)
+        return size, digest.hexdigest()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "DatasetFetcher":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.close()
+
+
+def _write_chunk(f: IO[bytes], digest: "hashlib._Hash", chunk: bytes) -> None:
+    f.write(chunk)
+    digest.update(chunk)
+
+
+def create_dataset_fetcher(settings: Settings) -> DatasetFetcher:
+    return DatasetFetcher(
+        max_connections=settings.DATASET_FETCH_MAX_CONNECTIONS,
+        max_connections_per_host=settings.DATASET_FETCH_MAX_CONNECTIONS_PER_HOST,
+        timeout_seconds=settings.DATASET_FETCH_TIMEOUT_SECONDS,
+    )
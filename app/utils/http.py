@@ -0,0 +1,127 @@
+import hashlib
+import re
+from collections.abc import AsyncIterator, Callable
+from http import HTTPStatus
+from pathlib import Path
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+_BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeNotSatisfiable(Exception):
+    ...
+
+
+def strong_etag(*parts: str) -> str:
+    """ETag identifying a response by what it was built from, rather than by hashing its content"""
+    digest = hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def build_fingerprint(root: Path) -> str:
+    """
+    Hash of the files of the app (code, templates...), part of the ETags so that responses cached
+    by clients are not reused once a new build, that may render them differently, is deployed.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and "__pycache__" not in path.parts:
+            digest.update(path.relative_to(root).as_posix().encode() + b"\0" + path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an `If-None-Match` header matches the ETag (with the weak comparison the header calls for)"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def parse_byte_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    The (start, stop) bytes requested by a `Range` header, None to send the whole content: if there's
+    no header, if it's invalid or if it asks for several ranges (which servers are free to ignore).
+    Raises `RangeNotSatisfiable` if the range is entirely past the end of the content.
+    """
+    match = None if range_header is None else _BYTE_RANGE.fullmatch(range_header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if first == "":  # the last `last` bytes
+        start, stop = max(size - int(last), 0), size
+    else:
+        start, stop = int(first), size if last == "" else min(int(last) + 1, size)
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if stop <= start:
+        return None
+    return start, stop
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def ranged_response(
+    request: Request,
+    size: int,
+    etag: str,
+    media_type: str,
+    headers: dict[str, str],
+    body: Callable[[int, int], bytes | AsyncIterator[bytes]],
+) -> Response:
+    """
+    Response serving content whose ETag is known up front, honouring conditional (`If-None-Match`) and
+    range (`Range`, `If-Range`) requests. `body` returns the bytes from start to stop of the content,
+    either at once or as a stream.
+    """
+    headers = headers | {"ETag": etag, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    if_range = request.headers.get("if-range")
+    range_header = request.headers.get("range") if if_range is None or if_range == etag else None
+    try:
+        byte_range = parse_byte_range(range_header, size=size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers=headers | {"Content-Range": f"bytes */{size}"},
+        )
+
+    status_code = HTTPStatus.OK
+    start, stop = 0, size
+    if byte_range is not None:
+        status_code = HTTPStatus.PARTIAL_CONTENT
+        start, stop = byte_range
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    content = body(start, stop)
+    if isinstance(content, bytes):
+        return Response(content=content, status_code=status_code, media_type=media_type, headers=headers)
+    return StreamingResponse(
+        content,
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers | {"Content-Length": str(stop - start)},
+    )
+
+
+def content_response(request: Request, content: bytes, etag: str, media_type: str, headers: dict[str, str]) -> Response:
+    return ranged_response(
+        request,
+        size=len(content),
+        etag=etag,
+        media_type=media_type,
+        headers=headers,
+        body=lambda start, stop: content[start:stop],
+    )
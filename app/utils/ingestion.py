@@ -0,0 +1,177 @@
+import io
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Protocol
+
+import numpy as np
+import pandas as pd
+
+from app.utils.target_index import MAX_KEYS_IN_ERROR, KeyMismatch, TargetIndex
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+NPZ_MEDIA_TYPES = ("application/octet-stream", "application/x-npz")
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+class InvalidSubmissionData(Exception):
+    ...
+
+
+class NullPredictions(Exception):
+    def __init__(self, n_nulls: int) -> None:
+        self.n_nulls = n_nulls
+        super().__init__(f"Found {n_nulls} null values")
+
+
+class SubmissionTooLarge(Exception):
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        super().__init__(f"Submission exceeds the maximum size of {max_bytes} bytes")
+
+
+class UnsupportedFormat(Exception):
+    ...
+
+
+class AsyncReadable(Protocol):
+    async def read(self, size: int = -1) -> bytes:
+        ...  # pragma: no cover
+
+
+async def _iter_line_blocks(file: AsyncReadable, chunk_size: int, max_bytes: int) -> AsyncIterator[bytes]:
+    """Yields blocks of complete lines, each roughly `chunk_size` long"""
+    remainder = b""
+    n_bytes = 0
+    while chunk := await file.read(chunk_size):
+        n_bytes += len(chunk)
+        if n_bytes > max_bytes:
+            raise SubmissionTooLarge(max_bytes=max_bytes)
+
+        last_newline = chunk.rfind(b"\n")
+        if last_newline == -1:
+            remainder += chunk
+            continue
+
+        yield remainder + chunk[: last_newline + 1]
+        remainder = chunk[last_newline + 1 :]
+
+    if remainder:
+        yield remainder
+
+
+def _parse_block(block: bytes) -> tuple[np.ndarray, np.ndarray]:
+    try:
+        df = pd.read_csv(io.BytesIO(block), header=None, usecols=[0, 1], dtype={0: str})
+        values = pd.to_numeric(df[1]).to_numpy(dtype=np.float64)
+    except (ValueError, pd.errors.ParserError) as e:
+        raise InvalidSubmissionData() from e
+    return df[0].to_numpy(dtype=str), values
+
+
+async def read_aligned_predictions(
+    file: AsyncReadable, target: TargetIndex, chunk_size: int, max_bytes: int
+) -> np.ndarray:
+    """
+    Parses a csv submission (header, then key and value as first two columns) block by block
+    and returns its values in the target order.
+
+    Only the current block and arrays as long as the target are kept in memory, whatever the
+    size of the file. Reading stops at the first block with invalid or null values, or as soon
+    as `max_bytes` are exceeded. Keys not in the target are tallied (keeping a sample of them)
+    so the full mismatch can be reported at the end.
+    """
+    aligned = np.empty(len(target), dtype=np.float64)
+    counts = np.zeros(len(target), dtype=np.int64)
+    extra_sample: list[np.ndarray] = []
+    n_extra = 0
+    has_header = False
+
+    async for block in _iter_line_blocks(file, chunk_size=chunk_size, max_bytes=max_bytes):
+        if not has_header:
+            header, _, block = block.partition(b"\n")
+            if header.count(b",") < 1:
+                raise InvalidSubmissionData()
+            has_header = True
+            if not block.strip():
+                continue
+
+        keys, values = _parse_block(block)
+        if nulls := int(np.isnan(values).sum()):
+            raise NullPredictions(n_nulls=nulls)
+
+        positions, found = target.locate(keys)
+        aligned[positions[found]] = values[found]
+        counts += np.bincount(positions[found], minlength=len(target))
+        if n_block_extra := int((~found).sum()):
+            if n_extra < MAX_KEYS_IN_ERROR:
+                extra_sample.append(keys[~found][: MAX_KEYS_IN_ERROR - n_extra])
+            n_extra += n_block_extra
+
+    if not has_header:
+        raise InvalidSubmissionData()
+
+    if n_extra or (counts != 1).any():
+        raise KeyMismatch(
+            missing=target.keys[counts == 0],
+            extra=np.concatenate(extra_sample) if extra_sample else np.array([], dtype=str),
+            duplicated=target.keys[counts > 1],
+            n_extra=n_extra,
+        )
+    return aligned
+
+
+async def read_limited(stream: AsyncIterable[bytes], max_bytes: int) -> bytes:
+    """Reads a whole body stream, giving up as soon as it exceeds `max_bytes`"""
+    body = bytearray()
+    async for chunk in stream:
+        body += chunk
+        if len(body) > max_bytes:
+            raise SubmissionTooLarge(max_bytes=max_bytes)
+    return bytes(body)
+
+
+def _validate_columns(keys: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if keys.ndim != 1 or values.shape != keys.shape:
+        raise InvalidSubmissionData()
+    if keys.dtype.kind not in "USiu" or values.dtype.kind not in "fiu":
+        raise InvalidSubmissionData()
+    if np.isnan(values).any():
+        raise NullPredictions(n_nulls=int(np.isnan(values).sum()))
+    return keys, values
+
+
+def columns_from_npz(content: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the `keys` and `values` arrays of a `.npz` payload (as written by `np.savez`).
+    Pickled (object) arrays are refused, so keys must be a fixed width string or integer array.
+    """
+    try:
+        with np.load(io.BytesIO(content), allow_pickle=False) as npz:
+            keys, values = npz["keys"], npz["values"]
+    except Exception as e:  # a corrupt archive fails in many ways (zipfile, zlib, format errors...)
+        raise InvalidSubmissionData() from e
+    return _validate_columns(keys, values)
+
+
+def columns_from_arrow(content: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """Loads the `keys` and `values` columns of an Arrow IPC stream, requires `pyarrow`"""
+    if pa is None:
+        raise UnsupportedFormat()
+    try:
+        table = pa.ipc.open_stream(content).read_all()
+        keys = table.column("keys").to_numpy().astype(str)
+        values = table.column("values").to_numpy()
+    except (pa.ArrowException, KeyError) as e:
+        raise InvalidSubmissionData() from e
+    return _validate_columns(keys, values)
+
+
+def columns_from_bytes(content: bytes, media_type: str) -> tuple[np.ndarray, np.ndarray]:
+    if media_type in NPZ_MEDIA_TYPES:
+        return columns_from_npz(content)
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        return columns_from_arrow(content)
+    raise UnsupportedFormat()
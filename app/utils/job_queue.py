@@ -0,0 +1,377 @@
+import asyncio
+import contextlib
+import datetime as dt
+import fcntl
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections.abc import Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.models.job import ScoringJob, ScoringJobId, ScoringJobStatus
+from app.models.submission import SubmissionResult
+from app.settings import Settings
+from app.utils.leaderboard import Leaderboards
+from app.utils.repositories import DataRepositoryType
+from app.utils.scoring import UndefinedScore, score_submission
+from app.utils.target_index import TargetIndexCache
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scoring_job (
+    id TEXT PRIMARY KEY,
+    competition_id TEXT NOT NULL,
+    participant_id TEXT NOT NULL,
+    submission_name TEXT NOT NULL,
+    target_digest TEXT NOT NULL,
+    predictions BLOB,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    score REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    leased_until REAL,
+    storing_since TEXT
+);
+CREATE INDEX IF NOT EXISTS scoring_job_status_created_at ON scoring_job (status, created_at);
+"""
+_MIGRATIONS = {"storing_since": "ALTER TABLE scoring_job ADD COLUMN storing_since TEXT"}  # of older queues
+_JOB_COLUMNS = "id, competition_id, participant_id, submission_name, status, attempts, score, error"
+
+
+class PermanentJobError(Exception):
+    """Raised for failures that would happen again if the job was retried"""
+
+
+def _job_from_row(row: sqlite3.Row) -> ScoringJob:
+    values = dict(row)
+    return ScoringJob.model_validate({k: values[k] for k in ScoringJob.model_fields if k in values})
+
+
+class ScoringJobQueue:
+    """
+    Durable queue of submissions waiting to be scored, stored in a local SQLite database (WAL mode)
+    so it survives restarts and can be shared by all the workers of the host.
+
+    Predictions are stored already aligned to the target (as float64 bytes), along with the digest of
+    the target version they were aligned to. A claimed job is leased for `lease_seconds`: if the worker
+    holding it dies, the job is claimed again once the lease expires.
+    """
+
+    def __init__(self, path: Path, max_attempts: int, lease_seconds: float) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(scoring_job)")}
+            for column, migration in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(migration)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    async def enqueue(
+        self,
+        competition_id: str,
+        participant_id: str,
+        submission_name: str,
+        target_digest: str,
+        predicted: np.ndarray,
+    ) -> ScoringJob:
+        job = ScoringJob(
+            id=str(uuid.uuid4()),
+            competition_id=competition_id,
+            participant_id=participant_id,
+            submission_name=submission_name,
+            status=ScoringJobStatus.QUEUED,
+        )
+
+        def _insert() -> None:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO scoring_job (id, competition_id, participant_id, submission_name, target_digest, "
+                    "predictions, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job.id,
+                        competition_id,
+                        participant_id,
+                        submission_name,
+                        target_digest,
+                        np.ascontiguousarray(predicted, dtype=np.float64).tobytes(),
+                        job.status.value,
+                        time.time(),
+                    ),
+                )
+
+        await asyncio.to_thread(_insert)
+        return job
+
+    async def get(self, job_id: ScoringJobId) -> ScoringJob | None:
+        def _select() -> ScoringJob | None:
+            with self._connect() as conn:
+                row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM scoring_job WHERE id = ?", (job_id,)).fetchone()
+            return None if row is None else _job_from_row(row)
+
+        return await asyncio.to_thread(_select)
+
+    async def claim(self) -> tuple[ScoringJob, str, np.ndarray] | None:
+        """Leases the oldest job ready to run, returning it with its target digest and predictions"""
+
+        def _claim() -> tuple[ScoringJob, str, np.ndarray] | None:
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # jobs whose lease expired after their last attempt are given up on
+                    conn.execute(
+                        "UPDATE scoring_job SET status = ?, error = ?, predictions = NULL "
+                        "WHERE status = ? AND leased_until < ? AND attempts >= ?",
+                        (
+                            ScoringJobStatus.FAILED.value,
+                            "Scoring timed out",
+                            ScoringJobStatus.RUNNING.value,
+                            now,
+                            self.max_attempts,
+                        ),
+                    )
+                    row = conn.execute(
+                        f"UPDATE scoring_job SET status = ?, attempts = attempts + 1, leased_until = ? "
+                        f"WHERE id = (SELECT id FROM scoring_job WHERE status = ? OR (status = ? AND leased_until < ?) "
+                        f"ORDER BY created_at LIMIT 1) RETURNING {_JOB_COLUMNS}, target_digest, predictions",
+                        (
+                            ScoringJobStatus.RUNNING.value,
+                            now + self.lease_seconds,
+                            ScoringJobStatus.QUEUED.value,
+                            ScoringJobStatus.RUNNING.value,
+                            now,
+                        ),
+                    ).fetchone()
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+
+            if row is None:
+                return None
+            return _job_from_row(row), row["target_digest"], np.frombuffer(row["predictions"], dtype=np.float64)
+
+        return await asyncio.to_thread(_claim)
+
+    async def mark_storing(self, job_id: ScoringJobId) -> None:
+        """Records that the result of the job is about to be stored, see `storing_since`"""
+        await self._update(
+            "UPDATE scoring_job SET storing_since = ? WHERE id = ?", (dt.datetime.utcnow().isoformat(), job_id)
+        )
+
+    async def storing_since(self, job_id: ScoringJobId) -> dt.datetime | None:
+        """
+        When the last attempt of the job started storing its result, if it got that far: a retried job's result
+        may have been stored since, with the job failing (or its worker dying) before it was completed.
+        """
+
+        def _select() -> str | None:
+            with self._connect() as conn:
+                row = conn.execute("SELECT storing_since FROM scoring_job WHERE id = ?", (job_id,)).fetchone()
+            return None if row is None else row["storing_since"]
+
+        since = await asyncio.to_thread(_select)
+        return None if since is None else dt.datetime.fromisoformat(since)
+
+    async def complete(self, job_id: ScoringJobId, score: float) -> None:
+        await self._update(
+            "UPDATE scoring_job SET status = ?, score = ?, error = NULL, predictions = NULL WHERE id = ?",
+            (ScoringJobStatus.DONE.value, score, job_id),
+        )
+
+    async def fail(self, job_id: ScoringJobId, error: str, retry: bool = True) -> None:
+        """Puts the job back in the queue, unless out of attempts or `retry` is False"""
+        await self._update(
+            "UPDATE scoring_job SET error = ?, "
+            "status = CASE WHEN ? AND attempts < ? THEN ? ELSE ? END, "
+            "predictions = CASE WHEN ? AND attempts < ? THEN predictions ELSE NULL END "
+            "WHERE id = ?",
+            (
+                error,
+                retry,
+                self.max_attempts,
+                ScoringJobStatus.QUEUED.value,
+                ScoringJobStatus.FAILED.value,
+                retry,
+                self.max_attempts,
+                job_id,
+            ),
+        )
+
+    async def _update(self, sql: str, parameters: tuple) -> None:
+        def _execute() -> None:
+            with self._connect() as conn:
+                conn.execute(sql, parameters)
+
+        await asyncio.to_thread(_execute)
+
+
+class ScoringWorkers:
+    """
+    Drains the `ScoringJobQueue`: claims jobs, scores them in a pool of processes (or in a thread
+    if `n_processes` is 0) and stores the results in the data repository.
+    Failed jobs are retried until they run out of attempts, unless the failure is permanent.
+
+    Every app worker (e.g. of gunicorn) has its own, but only the one holding a lock next to the queue
+    file scores jobs, so there are `n_processes` scoring processes per queue (that is, per host) however
+    many workers there are. The others wait for the lock, taking over if that worker exits.
+    """
+
+    _executor: Executor | None
+    _tasks: list["asyncio.Task[None]"]
+
+    def __init__(
+        self,
+        queue: ScoringJobQueue,
+        data_repository: DataRepositoryType,
+        target_indexes: TargetIndexCache,
+        leaderboards: Leaderboards,
+        n_processes: int,
+        poll_seconds: float,
+        lock_poll_seconds: float = 1,
+    ) -> None:
+        self.queue = queue
+        self.data_repository = data_repository
+        self.target_indexes = target_indexes
+        self.leaderboards = leaderboards
+        self.n_processes = n_processes
+        self.poll_seconds = poll_seconds
+        self.lock_poll_seconds = lock_poll_seconds
+        self.lock_path = queue.path.with_suffix(".workers.lock")
+        self._executor = None
+        self._tasks = []
+
+    async def process_next(self) -> bool:
+        """Processes a single job, returns False if there was none to process"""
+        claimed = await self.queue.claim()
+        if claimed is None:
+            return False
+
+        job, target_digest, predicted = claimed
+        try:
+            submission_result = await self._score(job, target_digest=target_digest, predicted=predicted)
+            stored = await self._is_stored(job)
+            if not stored:
+                await self.queue.mark_storing(job.id)
+                await self.data_repository.set_submission_result(submission_result=submission_result)
+        except PermanentJobError as e:
+            await self.queue.fail(job.id, error=str(e), retry=False)
+        except Exception as e:
+            await self.queue.fail(job.id, error=str(e) or type(e).__name__)
+        else:
+            # once stored, the job is done whatever happens next: retrying it would store the result again
+            await self.queue.complete(job.id, score=submission_result.score)
+            if not stored:
+                try:
+                    self.leaderboards.add([submission_result])
+                except Exception:  # the leaderboard is rebuilt from the repository once it's too old anyway
+                    logger.exception("Failed to add the result of scoring job %s to the leaderboard", job.id)
+        return True
+
+    async def _is_stored(self, job: ScoringJob) -> bool:
+        """Whether a previous attempt of the job stored its result, before failing to complete it"""
+        since = None if job.attempts <= 1 else await self.queue.storing_since(job.id)
+        if since is None:
+            return False
+        stored = self.data_repository.iter_submission_results(
+            job.competition_id, participant_id=job.participant_id, since=since
+        )
+        return any([i.submission_name == job.submission_name async for i in stored])
+
+    async def _score(self, job: ScoringJob, target_digest: str, predicted: np.ndarray) -> SubmissionResult:
+        competition = await self.data_repository.get_competition(competition_id=job.competition_id)
+        if competition is None:
+            raise PermanentJobError("Competition not found")
+
+        target = await self.target_indexes.get(competition.evaluation.target_dataset_url)
+        if target.digest != target_digest:
+            raise PermanentJobError("The competition target changed after the submission, please submit again")
+
+        loop = asyncio.get_running_loop()
+        try:
+            score, secondary_scores = await loop.run_in_executor(
+                self._executor, score_submission, predicted, target.values, competition.evaluation
+            )
+        except UndefinedScore as e:
+            raise PermanentJobError(str(e)) from e
+
+        return SubmissionResult(
+            competition_id=job.competition_id,
+            participant_id=job.participant_id,
+            submission_name=job.submission_name,
+            score=score,
+            secondary_scores=secondary_scores,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.process_next()
+            except sqlite3.Error:
+                processed = False
+            if not processed:
+                await asyncio.sleep(self.poll_seconds)
+
+    @property
+    def is_scoring(self) -> bool:
+        """Whether this process holds the lock and scores the jobs"""
+        return len(self._tasks) > 1
+
+    async def _run_holding_lock(self) -> None:
+        fd = await asyncio.to_thread(os.open, self.lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.lock_poll_seconds)
+            if self.n_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.n_processes)
+            self._tasks += [asyncio.create_task(self._run()) for _ in range(max(self.n_processes, 1))]
+            await asyncio.gather(*self._tasks[1:])
+        finally:
+            # the pool is shut down before releasing the lock, not to overlap with the one of the next holder
+            if self._executor is not None:
+                await asyncio.to_thread(self._executor.shutdown, cancel_futures=True)
+                self._executor = None
+            os.close(fd)  # which releases the lock
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run_holding_lock())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def create_scoring_queue(settings: Settings) -> ScoringJobQueue | None:
+    if not settings.SCORING_QUEUE_PATH:
+        return None
+    return ScoringJobQueue(
+        path=Path(settings.SCORING_QUEUE_PATH),
+        max_attempts=settings.SCORING_MAX_ATTEMPTS,
+        lease_seconds=settings.SCORING_LEASE_SECONDS,
+    )
@@ -0,0 +1,274 @@
+import bisect
+import dataclasses
+import functools
+import time
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+import numpy as np
+
+from app.models.competiton import Competition, CompetitionId
+from app.models.evaluation import METRIC_LOGIC_MAP, EvaluationMetric
+from app.models.participant import ParticipantId
+from app.models.submission import SubmissionResult
+from app.repositories.in_memory import SubmissionResultColumns
+from app.utils.fetcher import SingleFlight
+from app.utils.repositories import DataRepositoryType, submission_result_columns
+
+RankKey = tuple[float, int, ParticipantId]
+
+
+class SortedKeyList:
+    """
+    Sorted list split in buckets of bounded size, so that inserting or removing a key costs a binary search
+    plus shifting a single bucket (rather than the whole list), and iterating from an offset skips whole buckets.
+    """
+
+    _buckets: list[list[RankKey]]
+    _maxes: list[RankKey]
+
+    def __init__(self, bucket_size: int = 512) -> None:
+        self.bucket_size = bucket_size
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[RankKey]:
+        for bucket in self._buckets:
+            yield from bucket
+
+    def add(self, key: RankKey) -> None:
+        self._len += 1
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            return
+
+        i = min(bisect.bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        bisect.insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.bucket_size:
+            self._buckets[i : i + 1] = [bucket[: self.bucket_size], bucket[self.bucket_size :]]
+            self._maxes[i : i + 1] = [bucket[self.bucket_size - 1], bucket[-1]]
+
+    def remove(self, key: RankKey) -> None:
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        j = bisect.bisect_left(bucket, key)
+        if bucket[j] != key:
+            raise KeyError(key)
+
+        self._len -= 1
+        del bucket[j]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def index(self, key: RankKey) -> int:
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._buckets) or self._buckets[i][bisect.bisect_left(self._buckets[i], key)] != key:
+            raise ValueError(key)
+        return sum(map(len, self._buckets[:i])) + bisect.bisect_left(self._buckets[i], key)
+
+    def islice(self, start: int, stop: int | None = None) -> Iterator[RankKey]:
+        stop = self._len if stop is None else min(stop, self._len)
+        for bucket in self._buckets:
+            if start >= stop:
+                return
+            if start >= len(bucket):
+                start, stop = start - len(bucket), stop - len(bucket)
+                continue
+            yield from islice(bucket, start, stop)
+            start, stop = 0, stop - len(bucket)
+
+
+@dataclasses.dataclass
+class LeaderboardEntry:
+    participant_id: ParticipantId
+    best_submission_name: str
+    best_submission_score: float
+    best_submission_secondary_scores: dict[EvaluationMetric, float]
+    n_entries: int
+    seq: int  # order of the participant's first submission, breaks ties on the score
+
+
+class CompetitionLeaderboard:
+    """
+    Best submission and number of entries of every participant of a competition, kept ranked as
+    results come in: adding a result only moves the participant it belongs to.
+    Ties on the score are ranked by who submitted first.
+    """
+
+    _entries: dict[ParticipantId, LeaderboardEntry]
+
+    def __init__(self, sort_multiplier: int) -> None:
+        self.sort_multiplier = sort_multiplier
+        self._entries = {}
+        self._ranking = SortedKeyList()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def from_submission_results(
+        cls, sort_multiplier: int, submission_results: Iterable[SubmissionResult]
+    ) -> "CompetitionLeaderboard":
+        leaderboard = cls(sort_multiplier=sort_multiplier)
+        for submission_result in submission_results:
+            leaderboard.add(submission_result)
+        return leaderboard
+
+    @classmethod
+    def from_columns(cls, sort_multiplier: int, columns: SubmissionResultColumns) -> "CompetitionLeaderboard":
+        """
+        Same as `from_submission_results`, working on the score and participant columns directly: only the
+        best result of each participant is read as a `SubmissionResult`.
+        """
+        leaderboard = cls(sort_multiplier=sort_multiplier)
+        codes = columns.participant_codes
+        if not len(codes):
+            return leaderboard
+
+        # rows sorted by participant, then best score first, then first stored (a later result with
+        # the same score doesn't replace the best one)
+        order = np.lexsort((np.arange(len(codes)), -sort_multiplier * columns.scores, codes))
+        sorted_codes = codes[order]
+        best_rows = order[np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])]
+        _, first_rows, n_entries = np.unique(codes, return_index=True, return_counts=True)
+        seqs = np.argsort(np.argsort(first_rows))  # order of the participants' first submission
+
+        for best_row, n, seq in zip(best_rows.tolist(), n_entries.tolist(), seqs.tolist(), strict=True):
+            best = columns.result(best_row)
+            leaderboard._insert(
+                LeaderboardEntry(
+                    participant_id=best.participant_id,
+                    best_submission_name=best.submission_name,
+                    best_submission_score=best.score,
+                    best_submission_secondary_scores=best.secondary_scores,
+                    n_entries=n,
+                    seq=seq,
+                )
+            )
+        return leaderboard
+
+    def _insert(self, entry: LeaderboardEntry) -> None:
+        self._entries[entry.participant_id] = entry
+        self._ranking.add(self._key(entry))
+
+    def _key(self, entry: LeaderboardEntry) -> RankKey:
+        return -self.sort_multiplier * entry.best_submission_score, entry.seq, entry.participant_id
+
+    def add(self, submission_result: SubmissionResult) -> None:
+        entry = self._entries.get(submission_result.participant_id)
+        if entry is None:
+            entry = LeaderboardEntry(
+                participant_id=submission_result.participant_id,
+                best_submission_name=submission_result.submission_name,
+                best_submission_score=submission_result.score,
+                best_submission_secondary_scores=submission_result.secondary_scores,
+                n_entries=1,
+                seq=len(self._entries),
+            )
+            self._insert(entry)
+            return
+
+        entry.n_entries += 1
+        if self.sort_multiplier * submission_result.score > self.sort_multiplier * entry.best_submission_score:
+            self._ranking.remove(self._key(entry))
+            entry.best_submission_name = submission_result.submission_name
+            entry.best_submission_score = submission_result.score
+            entry.best_submission_secondary_scores = submission_result.secondary_scores
+            self._ranking.add(self._key(entry))
+
+    def get(self, participant_id: ParticipantId) -> LeaderboardEntry | None:
+        return self._entries.get(participant_id)
+
+    def position(self, participant_id: ParticipantId) -> int | None:
+        """1-based position of the participant, None if they haven't submitted"""
+        entry = self._entries.get(participant_id)
+        return None if entry is None else self._ranking.index(self._key(entry)) + 1
+
+    def rows(self, offset: int = 0, limit: int | None = None) -> list[tuple[int, LeaderboardEntry]]:
+        """Entries with their 1-based position, best first"""
+        stop = None if limit is None else offset + limit
+        return [
+            (offset + i + 1, self._entries[participant_id])
+            for i, (_, _, participant_id) in enumerate(self._ranking.islice(offset, stop))
+        ]
+
+    def around(self, participant_id: ParticipantId, neighbours: int) -> list[tuple[int, LeaderboardEntry]] | None:
+        """The participant's entry with up to `neighbours` entries above and below, None if they haven't submitted"""
+        position = self.position(participant_id)
+        if position is None:
+            return None
+        offset = max(position - 1 - neighbours, 0)
+        return self.rows(offset=offset, limit=position + neighbours - offset)
+
+
+class Leaderboards:
+    """
+    Materialised leaderboard of every competition, so that showing it doesn't require going
+    through all the submissions.
+
+    A leaderboard is built from the data repository the first time it's needed and then kept up to
+    date with the results stored by this process. It's rebuilt once older than `max_age_seconds`,
+    to also pick up the results stored by other processes.
+    """
+
+    _leaderboards: dict[CompetitionId, tuple[CompetitionLeaderboard, float]]
+    _generations: dict[CompetitionId, int]
+    _single_flight: SingleFlight[CompetitionLeaderboard]
+
+    def __init__(self, data_repository: DataRepositoryType, max_age_seconds: float) -> None:
+        self.data_repository = data_repository
+        self.max_age_seconds = max_age_seconds
+        self._leaderboards = {}
+        self._generations = {}
+        self._single_flight = SingleFlight()
+
+    async def get(self, competition: Competition) -> CompetitionLeaderboard:
+        cached = self._leaderboards.get(competition.id)
+        if cached is not None and time.monotonic() - cached[1] < self.max_age_seconds:
+            return cached[0]
+        return await self._single_flight.run(competition.id, lambda: self._build(competition))
+
+    def built_at(self, competition_id: CompetitionId) -> float | None:
+        """When the leaderboard of the competition was last built from the repository, if it's cached"""
+        cached = self._leaderboards.get(competition_id)
+        return None if cached is None else cached[1]
+
+    async def _build(self, competition: Competition) -> CompetitionLeaderboard:
+        generation = self._generations.get(competition.id, 0)
+        built_at = time.monotonic()
+        sort_multiplier = METRIC_LOGIC_MAP[competition.evaluation.metric].sort_multiplier
+        columns = submission_result_columns(self.data_repository, competition.id)
+        if columns is not None:
+            leaderboard = CompetitionLeaderboard.from_columns(sort_multiplier, columns)
+        else:
+            leaderboard = CompetitionLeaderboard(sort_multiplier=sort_multiplier)
+            async for submission_result in self.data_repository.iter_submission_results(competition.id):
+                leaderboard.add(submission_result)
+        # results added while reading from the repository may or may not be included: only keep
+        # the leaderboard if there were none, otherwise the next request builds it again
+        if self._generations.get(competition.id, 0) == generation:
+            self._leaderboards[competition.id] = (leaderboard, built_at)
+        return leaderboard
+
+    def add(self, submission_results: Iterable[SubmissionResult]) -> None:
+        """Updates the leaderboards with results that have just been stored in the repository"""
+        for submission_result in submission_results:
+            competition_id = submission_result.competition_id
+            self._generations[competition_id] = self._generations.get(competition_id, 0) + 1
+            cached = self._leaderboards.get(competition_id)
+            if cached is not None:
+                cached[0].add(submission_result)
+
+    async def rebuild_all(self) -> None:
+        for competition in await self.data_repository.get_competitions():
+            await self._single_flight.run(competition.id, functools.partial(self._build, competition))
@@ -4,4 +4,5 @@ import pandas as pd
 
 
 def series_from_bytes(b: bytes) -> pd.Series:
-    return pd.read_csv(io.BytesIO(b), index_col=0).iloc[:, 0]
+    # keys are kept as written (e.g. "01" or "1.50"), as the keys of the submissions are
+    return pd.read_csv(io.BytesIO(b), index_col=0, dtype={0: str}).iloc[:, 0]
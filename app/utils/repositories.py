@@ -1,14 +1,20 @@
 import dataclasses
+from pathlib import Path
 from typing import TypeAlias
 
 from azure.data.tables.aio import TableServiceClient
 
-from app.constants import IN_MEMORY
+from app.constants import IN_MEMORY, SQLITE_PREFIX
+from app.models.competiton import CompetitionId
 from app.repositories.azure_storage import AzureStorageDataRepository
-from app.repositories.in_memory import InMemoryDataRepository
+from app.repositories.caching import CachedRepositoryType, CachingDataRepository
+from app.repositories.in_memory import InMemoryDataRepository, SubmissionResultColumns
+from app.repositories.sqlite import SqliteDataRepository
 from app.settings import Settings
 
-DataRepositoryType: TypeAlias = InMemoryDataRepository | AzureStorageDataRepository
+DataRepositoryType: TypeAlias = (
+    InMemoryDataRepository | AzureStorageDataRepository | SqliteDataRepository | CachingDataRepository
+)
 
 
 @dataclasses.dataclass
@@ -17,10 +23,13 @@ class Repositories:
 
 
 def create_repositories(settings: Settings) -> Repositories:
-    data_repository: DataRepositoryType
-
+    data_repository: CachedRepositoryType
     if settings.DATA_REPOSITORY_CONNECTION_STRING == IN_MEMORY:
         data_repository = InMemoryDataRepository()
+    elif settings.DATA_REPOSITORY_CONNECTION_STRING.startswith(SQLITE_PREFIX):
+        data_repository = SqliteDataRepository(
+            path=Path(settings.DATA_REPOSITORY_CONNECTION_STRING[len(SQLITE_PREFIX) :])
+        )
     else:
 
         def aio_table_service_client_factory() -> TableServiceClient:
@@ -28,6 +37,33 @@ def create_repositories(settings: Settings) -> Repositories:
 
         data_repository = AzureStorageDataRepository(
             table_client_service_factory=aio_table_service_client_factory,
+            flush_seconds=settings.SUBMISSION_RESULT_FLUSH_SECONDS,
+            flush_size=settings.SUBMISSION_RESULT_FLUSH_SIZE,
+            wait_for_flush=settings.SUBMISSION_RESULT_WAIT_FOR_FLUSH,
+        )
+
+    if settings.DATA_REPOSITORY_CACHE_MAX_ENTRIES > 0:
+        return Repositories(
+            data_repository=CachingDataRepository(
+                repository=data_repository,
+                max_entries=settings.DATA_REPOSITORY_CACHE_MAX_ENTRIES,
+                competition_ttl_seconds=settings.DATA_REPOSITORY_CACHE_COMPETITION_TTL_SECONDS,
+                participant_ttl_seconds=settings.DATA_REPOSITORY_CACHE_PARTICIPANT_TTL_SECONDS,
+            )
         )
 
     return Repositories(data_repository=data_repository)
+
+
+def submission_result_columns(
+    repository: DataRepositoryType, competition_id: CompetitionId
+) -> SubmissionResultColumns | None:
+    """
+    The submission results of the competition as columns, if the repository keeps them in memory, to be
+    read directly rather than one `SubmissionResult` at a time.
+    """
+    if isinstance(repository, CachingDataRepository):
+        repository = repository.repository
+    if isinstance(repository, InMemoryDataRepository):
+        return repository.submission_result_columns(competition_id)
+    return None
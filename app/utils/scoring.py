@@ -1,7 +1,38 @@
-import pandas as pd
+import math
 
-from app.models.evaluation import EvaluationMetricLogic
+import numpy as np
 
+from app.models.evaluation import METRIC_LOGIC_MAP, EvaluationConfig, EvaluationMetric, MetricInputs
 
-def score_submission(pred: pd.Series, actual: pd.Series, metric: EvaluationMetricLogic) -> float:
-    return metric.func(pred, actual)
+
+class UndefinedScore(Exception):
+    def __init__(self, metric: EvaluationMetric) -> None:
+        self.metric = metric
+        super().__init__(f"The {metric.value} score is not defined for the submitted predictions")
+
+
+def score_submission(
+    pred: np.ndarray, actual: np.ndarray, evaluation: EvaluationConfig
+) -> tuple[float, dict[EvaluationMetric, float]]:
+    """
+    Computes the primary and the secondary scores in a single pass.
+    Secondary scores that are not defined for the data (e.g. mape with zero actuals) are left out.
+    """
+    return score_submissions(preds=pred[np.newaxis, :], actual=actual, evaluation=evaluation)[0]
+
+
+def score_submissions(
+    preds: np.ndarray, actual: np.ndarray, evaluation: EvaluationConfig
+) -> list[tuple[float, dict[EvaluationMetric, float]]]:
+    """Same as `score_submission` for a 2D array with a submission per row, all scored at once"""
+    inputs = MetricInputs(pred=preds, actual=actual)
+    scores = {metric: np.atleast_1d(METRIC_LOGIC_MAP[metric].func(inputs)).tolist() for metric in evaluation.metrics}
+
+    primary_scores = scores.pop(evaluation.metric)
+    if not all(math.isfinite(score) for score in primary_scores):
+        raise UndefinedScore(evaluation.metric)
+
+    return [
+        (score, {metric: values[i] for metric, values in scores.items() if math.isfinite(values[i])})
+        for i, score in enumerate(primary_scores)
+    ]
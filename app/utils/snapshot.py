@@ -0,0 +1,300 @@
+import asyncio
+import dataclasses
+import datetime as dt
+import fcntl
+import gzip
+import json
+import os
+import struct
+from collections.abc import AsyncIterator, Awaitable, Iterable, Iterator
+from pathlib import Path
+from typing import TypeAlias
+
+from app.models.competiton import Competition, CompetitionId
+from app.models.participant import Participant
+from app.constants import IN_MEMORY
+from app.models.submission import SubmissionResult
+from app.settings import Settings
+from app.utils.repositories import DataRepositoryType
+
+# A snapshot is a gzip stream of records, each a kind, the length of its payload and the payload (json).
+# Submission results are stored in batches of rows of the same competition, without repeating the field names,
+# along with when they were stored.
+MAGIC = b"DHSNAP\x01"
+PARTICIPANT = b"P"
+COMPETITION = b"C"
+SUBMISSION_RESULTS = b"R"
+END = b"E"  # tells a complete snapshot from a truncated one
+_HEADER = struct.Struct(">cI")
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CONCURRENCY = 8
+
+StoredSubmissionResult: TypeAlias = tuple[dt.datetime, SubmissionResult]
+
+
+class InvalidSnapshot(Exception):
+    ...
+
+
+@dataclasses.dataclass
+class SnapshotCounts:
+    participants: int = 0
+    competitions: int = 0
+    submission_results: int = 0
+
+
+class SnapshotWriter:
+    """Writes to a temporary file, only moved to `path` once the snapshot is complete"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        self._file = gzip.open(self._tmp_path, "wb")
+        self._file.write(MAGIC)
+
+    def write(self, kind: bytes, payload: bytes) -> None:
+        self._file.write(_HEADER.pack(kind, len(payload)))
+        self._file.write(payload)
+
+    def close(self) -> None:
+        self.write(END, b"")
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def read_snapshot(path: Path) -> Iterator[tuple[bytes, bytes]]:
+    """The (kind, payload) records of the snapshot, raises `InvalidSnapshot` if it's not one or it's truncated"""
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise InvalidSnapshot(f"{path} is not a snapshot")
+        while len(header := f.read(_HEADER.size)) == _HEADER.size:
+            kind, size = _HEADER.unpack(header)
+            if kind == END:
+                return
+            payload = f.read(size)
+            if len(payload) != size:
+                break
+            yield kind, payload
+    raise InvalidSnapshot(f"{path} is truncated")
+
+
+def _next_record(records: Iterator[tuple[bytes, bytes]]) -> tuple[bytes, bytes] | None:
+    return next(records, None)
+
+
+def _encode_submission_results(submission_results: list[StoredSubmissionResult]) -> bytes:
+    rows = [
+        [at.isoformat(), i.participant_id, i.submission_name, i.score, i.secondary_scores]
+        for at, i in submission_results
+    ]
+    return json.dumps({"competition_id": submission_results[0][1].competition_id, "rows": rows}).encode()
+
+
+def _decode_submission_results(payload: bytes) -> list[StoredSubmissionResult]:
+    data = json.loads(payload)
+    return [
+        (
+            dt.datetime.fromisoformat(at),
+            SubmissionResult(
+                competition_id=data["competition_id"],
+                participant_id=participant_id,
+                submission_name=submission_name,
+                score=score,
+                secondary_scores=secondary_scores,
+            ),
+        )
+        for at, participant_id, submission_name, score, secondary_scores in data["rows"]
+    ]
+
+
+async def _batches(
+    submission_results: AsyncIterator[StoredSubmissionResult], batch_size: int
+) -> AsyncIterator[list[StoredSubmissionResult]]:
+    batch = []
+    async for submission_result in submission_results:
+        batch.append(submission_result)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _gather_bounded(awaitables: Iterable[Awaitable[None]], concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(awaitable: Awaitable[None]) -> None:
+        async with semaphore:
+            await awaitable
+
+    await asyncio.gather(*(_run(i) for i in awaitables))
+
+
+class _BatchWriter:
+    """
+    Stores batches of submission results with at most `concurrency` writes in progress (further batches
+    wait for a free slot, which also bounds the memory used). The batches of a competition are
+    written one after the other, in the order they were given, so the results keep their order
+    (as well as when they were stored).
+    """
+
+    _last_writes: dict[CompetitionId, "asyncio.Task[None]"]
+
+    def __init__(self, repository: DataRepositoryType, concurrency: int) -> None:
+        self.repository = repository
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._writes: list[asyncio.Task[None]] = []
+        self._last_writes = {}
+
+    async def write(self, batch: list[StoredSubmissionResult]) -> None:
+        await self._semaphore.acquire()
+        competition_id = batch[0][1].competition_id
+        task = asyncio.create_task(self._write(batch, after=self._last_writes.get(competition_id)))
+        self._last_writes[competition_id] = task
+        self._writes.append(task)
+
+    async def _write(self, batch: list[StoredSubmissionResult], after: "asyncio.Task[None] | None") -> None:
+        try:
+            if after is not None:
+                await after
+            await self.repository.set_submission_results([i for _, i in batch], stored_at=[at for at, _ in batch])
+        finally:
+            self._semaphore.release()
+
+    async def join(self) -> None:
+        await asyncio.gather(*self._writes)
+
+
+async def dump(repository: DataRepositoryType, path: Path, batch_size: int = DEFAULT_BATCH_SIZE) -> SnapshotCounts:
+    """Writes all the data of the repository to a snapshot file"""
+    counts = SnapshotCounts()
+    writer = await asyncio.to_thread(SnapshotWriter, path)
+    try:
+        for participant in await repository.get_participants():
+            await asyncio.to_thread(writer.write, PARTICIPANT, participant.model_dump_json().encode())
+            counts.participants += 1
+        for competition in await repository.get_competitions():
+            await asyncio.to_thread(writer.write, COMPETITION, competition.model_dump_json().encode())
+            counts.competitions += 1
+            async for batch in _batches(repository.iter_stored_submission_results(competition.id), batch_size):
+                await asyncio.to_thread(writer.write, SUBMISSION_RESULTS, _encode_submission_results(batch))
+                counts.submission_results += len(batch)
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    return counts
+
+
+async def restore(repository: DataRepositoryType, path: Path, concurrency: int = DEFAULT_CONCURRENCY) -> SnapshotCounts:
+    """Stores the data of a snapshot file in the repository, which is expected to be empty"""
+    counts = SnapshotCounts()
+    writer = _BatchWriter(repository, concurrency=concurrency)
+    records = read_snapshot(path)
+    while (record := await asyncio.to_thread(_next_record, records)) is not None:
+        kind, payload = record
+        if kind == PARTICIPANT:
+            await repository.set_participant(Participant.model_validate_json(payload))
+            counts.participants += 1
+        elif kind == COMPETITION:
+            await repository.set_competition(Competition.model_validate_json(payload))
+            counts.competitions += 1
+        elif kind == SUBMISSION_RESULTS:
+            batch = _decode_submission_results(payload)
+            await writer.write(batch)
+            counts.submission_results += len(batch)
+    await writer.join()
+    return counts
+
+
+async def migrate(
+    source: DataRepositoryType,
+    destination: DataRepositoryType,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> SnapshotCounts:
+    """
+    Copies all the data of a repository to another (expected to be empty), reading up to `concurrency`
+    competitions at once and writing their results in batches of `batch_size`.
+    """
+    participants = await source.get_participants()
+    competitions = await source.get_competitions()
+    # one at a time, so they are listed in the same order as in the source
+    for participant in participants:
+        await destination.set_participant(participant)
+    for competition in competitions:
+        await destination.set_competition(competition)
+
+    counts = SnapshotCounts(participants=len(participants), competitions=len(competitions))
+    writer = _BatchWriter(destination, concurrency=concurrency)
+
+    async def _copy_submission_results(competition: Competition) -> None:
+        async for batch in _batches(source.iter_stored_submission_results(competition.id), batch_size):
+            await writer.write(batch)
+            counts.submission_results += len(batch)
+
+    await _gather_bounded((_copy_submission_results(i) for i in competitions), concurrency)
+    await writer.join()
+    return counts
+
+
+def _try_lock(path: Path) -> int | None:
+    """File descriptor holding an exclusive lock on `path` (until closed), None if another process holds it"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class RepositorySnapshot:
+    """
+    Keeps the data of an in-memory repository across restarts: every process of the app restores it from the
+    snapshot at `path` when it starts, and the one holding a lock next to it dumps its data there when it stops.
+
+    The processes of an in-memory deployment don't share their data, so it's the data of that single process
+    which is kept: this is meant for deployments of a single worker. Persistent repositories are dumped and
+    restored with `scripts/snapshot.py` instead.
+    """
+
+    _lock_fd: int | None
+
+    def __init__(self, repository: DataRepositoryType, path: Path) -> None:
+        self.repository = repository
+        self.path = path
+        self.lock_path = path.with_suffix(f"{path.suffix}.lock")
+        self._lock_fd = None
+
+    @property
+    def is_dumping(self) -> bool:
+        """Whether this process dumps its data when it stops"""
+        return self._lock_fd is not None
+
+    async def start(self) -> None:
+        if await asyncio.to_thread(self.path.exists):
+            await restore(self.repository, self.path)
+        self._lock_fd = await asyncio.to_thread(_try_lock, self.lock_path)
+
+    async def stop(self) -> None:
+        if self._lock_fd is None:
+            return
+        try:
+            await dump(self.repository, self.path)
+        finally:
+            os.close(self._lock_fd)  # which releases the lock
+            self._lock_fd = None
+
+
+def create_repository_snapshot(settings: Settings, repository: DataRepositoryType) -> RepositorySnapshot | None:
+    if not settings.DATA_REPOSITORY_SNAPSHOT_PATH:
+        return None
+    if settings.DATA_REPOSITORY_CONNECTION_STRING != IN_MEMORY:
+        raise ValueError("DATA_REPOSITORY_SNAPSHOT_PATH is for the in-memory repository, see scripts/snapshot.py")
+    return RepositorySnapshot(repository, path=Path(settings.DATA_REPOSITORY_SNAPSHOT_PATH))
@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import dataclasses
+import gzip
+
+import numpy as np
+import pandas as pd
+
+from app.utils.dataset_cache import CachedDataset, DatasetCache
+from app.utils.fetcher import SingleFlight
+from app.utils.parse_csv import series_from_bytes
+
+MAX_KEYS_IN_ERROR = 10
+
+
+class KeyMismatch(Exception):
+    def __init__(
+        self, missing: np.ndarray, extra: np.ndarray, duplicated: np.ndarray, n_extra: int | None = None
+    ) -> None:
+        self.missing = missing
+        self.extra = extra  # can be a sample of the extra keys, if `n_extra` is given
+        self.duplicated = duplicated
+        self.n_extra = len(extra) if n_extra is None else n_extra
+        super().__init__(str(self))
+
+    def __str__(self) -> str:
+        msg = (
+            "Submission prediction keys don't match the expected ones."
+            f"\nMissing {_format_keys(self.missing)}\nExtra: {_format_keys(self.extra, self.n_extra)}"
+        )
+        if len(self.duplicated):
+            msg += f"\nDuplicated: {_format_keys(self.duplicated)}"
+        return msg
+
+
+def _format_keys(keys: np.ndarray, n_keys: int | None = None) -> str:
+    n_keys = len(keys) if n_keys is None else n_keys
+    shown = set(keys[:MAX_KEYS_IN_ERROR].tolist())
+    if n_keys <= MAX_KEYS_IN_ERROR:
+        return str(shown)
+    return f"{shown} and {n_keys - MAX_KEYS_IN_ERROR} more"
+
+
+@dataclasses.dataclass(frozen=True)
+class TargetIndex:
+    """
+    Target dataset prepared for aligning submissions against it.
+
+    Keys are normalised to strings (as they are in json submissions) and kept both in the
+    original order and sorted, so any submission can be located with a binary search.
+    """
+
+    digest: str  # version of the target dataset the index was built from
+    keys: np.ndarray  # str keys, in the target order
+    values: np.ndarray  # float64 values, in the target order
+    sorted_keys: np.ndarray
+    sorted_positions: np.ndarray  # position in `keys` of each of the `sorted_keys`
+    key_name: str | None = None
+    value_name: str | None = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_series(cls, ser: pd.Series, digest: str) -> "TargetIndex":
+        keys = ser.index.to_numpy().astype(str)
+        sorted_positions = np.argsort(keys, kind="stable")
+        return cls(
+            digest=digest,
+            keys=keys,
+            values=ser.to_numpy(dtype=np.float64),
+            sorted_keys=keys[sorted_positions],
+            sorted_positions=sorted_positions,
+            key_name=ser.index.name,
+            value_name=ser.name,
+        )
+
+    @classmethod
+    def from_dataset(cls, dataset: CachedDataset) -> "TargetIndex":
+        return cls.from_series(series_from_bytes(dataset.content), digest=dataset.digest)
+
+    def locate(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns, for each key, its position in the target and whether it was found at all"""
+        if not len(self):
+            return np.zeros(len(keys), dtype=np.intp), np.zeros(len(keys), dtype=bool)
+
+        sorted_idx = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self) - 1)
+        found = self.sorted_keys[sorted_idx] == keys
+        return self.sorted_positions[sorted_idx], found
+
+    def align(self, keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Reorders the submitted values to match the target order.
+        Raises `KeyMismatch` if any key is missing, unexpected or repeated.
+        """
+        keys = np.asarray(keys).astype(str, copy=False)
+        values = np.asarray(values, dtype=np.float64)
+        if np.array_equal(keys, self.keys):
+            return values
+
+        positions, found = self.locate(keys)
+        counts = np.bincount(positions[found], minlength=len(self))
+        if not found.all() or (counts != 1).any():
+            raise KeyMismatch(missing=self.keys[counts == 0], extra=keys[~found], duplicated=self.keys[counts > 1])
+
+        aligned = np.empty(len(self), dtype=np.float64)
+        aligned[positions] = values
+        return aligned
+
+    def to_template_csv(self) -> str:
+        index = pd.Index(self.keys, name=self.key_name)
+        return pd.Series(index=index, name=self.value_name, dtype=np.float64).to_csv()
+
+
+@dataclasses.dataclass(frozen=True)
+class SubmissionTemplate:
+    """Csv template of the submissions for a target, prepared once to be served as is"""
+
+    digest: str  # version of the target dataset the template was built from
+    content: bytes
+    gzipped: bytes
+
+    @classmethod
+    def from_index(cls, index: TargetIndex) -> "SubmissionTemplate":
+        content = index.to_template_csv().encode()
+        return cls(digest=index.digest, content=content, gzipped=gzip.compress(content, mtime=0))
+
+
+class TargetIndexCache:
+    """
+    Keeps the `TargetIndex`, and the `SubmissionTemplate`, of the latest version of every target dataset.
+
+    Datasets are retrieved (and revalidated) through the `DatasetCache`, the index and the template are
+    only rebuilt when the content of the dataset changes. They can be prepared ahead of the first request
+    for them with `prepare`.
+    """
+
+    _indexes: dict[str, TargetIndex]
+    _templates: dict[str, SubmissionTemplate]
+    _single_flight: SingleFlight[TargetIndex]
+    _preparing: set["asyncio.Task[None]"]
+
+    def __init__(self, dataset_cache: DatasetCache) -> None:
+        self.dataset_cache = dataset_cache
+        self._indexes = {}
+        self._templates = {}
+        self._single_flight = SingleFlight()
+        self._preparing = set()
+
+    async def get(self, url: str) -> TargetIndex:
+        dataset = await self.dataset_cache.get(url)
+        index = self._indexes.get(url)
+        if index is not None and index.digest == dataset.digest:
+            return index
+        return await self._single_flight.run((url, dataset.digest), lambda: self._build(dataset))
+
+    async def get_template(self, url: str) -> SubmissionTemplate:
+        index = await self.get(url)
+        template = self._templates.get(url)
+        if template is None or template.digest != index.digest:  # the dataset changed since
+            template = self._templates[url] = await asyncio.to_thread(SubmissionTemplate.from_index, index)
+        return template
+
+    async def _build(self, dataset: CachedDataset) -> TargetIndex:
+        index, template = await asyncio.to_thread(self._build_sync, dataset)
+        self._templates[dataset.url] = template
+        self._indexes[dataset.url] = index
+        return index
+
+    @staticmethod
+    def _build_sync(dataset: CachedDataset) -> tuple[TargetIndex, SubmissionTemplate]:
+        index = TargetIndex.from_dataset(dataset)
+        return index, SubmissionTemplate.from_index(index)
+
+    def prepare(self, url: str) -> None:
+        """Builds the index and the template of the target in the background"""
+        task = asyncio.create_task(self._prepare(url))
+        self._preparing.add(task)
+        task.add_done_callback(self._preparing.discard)
+
+    async def _prepare(self, url: str) -> None:
+        # if it fails, the target is retrieved again on the first request for it
+        with contextlib.suppress(Exception):
+            await self.get(url)
+
+    async def close(self) -> None:
+        for task in self._preparing:
+            task.cancel()
+        await asyncio.gather(*self._preparing, return_exceptions=True)
@@ -0,0 +1,56 @@
+from collections.abc import Awaitable, Callable, Hashable
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache
+from markupsafe import Markup
+
+from app.models.cache import CacheStats
+from app.settings import Settings
+from app.utils.fetcher import SingleFlight
+
+
+def create_bytecode_cache(settings: Settings) -> FileSystemBytecodeCache:
+    """Compiled templates are kept on disk, so that worker processes (and restarts) don't compile them again"""
+    if not settings.TEMPLATES_BYTECODE_CACHE_DIR:
+        return FileSystemBytecodeCache()  # in a temporary directory of the user
+
+    cache_dir = Path(settings.TEMPLATES_BYTECODE_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return FileSystemBytecodeCache(directory=str(cache_dir))
+
+
+def precompile_templates(env: Environment) -> None:
+    """Loads all the templates, so that none is compiled while serving a request"""
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+
+
+class FragmentCache:
+    """
+    Rendered HTML fragments, each kept along with the version of the data it was rendered from:
+    it's rendered again as soon as it's asked for with a different version, and only the latest
+    version of each fragment is kept. Concurrent renders of the same version share a single one.
+    """
+
+    _fragments: dict[Hashable, tuple[str, Markup]]  # key -> (version, fragment)
+    _single_flight: SingleFlight[Markup]
+
+    def __init__(self) -> None:
+        self.stats = CacheStats()
+        self._fragments = {}
+        self._single_flight = SingleFlight()
+
+    async def get(self, key: Hashable, version: str, render: Callable[[], Awaitable[str]]) -> Markup:
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] == version:
+            self.stats.hits += 1
+            return cached[1]
+
+        self.stats.misses += 1
+        return await self._single_flight.run((key, version), lambda: self._render(key, version, render))
+
+    async def _render(self, key: Hashable, version: str, render: Callable[[], Awaitable[str]]) -> Markup:
+        fragment = Markup(await render())
+        self._fragments[key] = (version, fragment)
+        self.stats.entries = len(self._fragments)
+        return fragment
@@ -1,5 +1,6 @@
 import multiprocessing
 
+# a single one of the workers runs the SCORING_WORKERS scoring processes of the queue, see `ScoringWorkers`
 workers = multiprocessing.cpu_count()
 bind = "0.0.0.0:80"
 worker_class = "uvicorn.workers.UvicornWorker"
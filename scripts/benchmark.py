@@ -0,0 +1,206 @@
+"""
+Benchmarks the stages of the submission hot path on synthetic data of growing size: parsing the target csv,
+indexing it, aligning a submission to it, scoring it, building a leaderboard from the stored submission results
+(as it's rebuilt) and adding the results to a leaderboard one by one (as they are scored).
+
+Reports the latency (best of `--repeat` runs) and the peak memory of every stage and size. Results can be
+saved as a baseline, and later runs compared against it: the run fails if a stage got slower or uses more
+memory than the baseline by more than `--threshold` (a fraction, 0.25 = 25%).
+
+    python scripts/benchmark.py --save baseline.json
+    python scripts/benchmark.py --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import dataclasses
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.models.evaluation import METRIC_LOGIC_MAP, EvaluationConfig, EvaluationMetric, MetricInputs
+from app.models.submission import SubmissionResult
+from app.repositories.in_memory import InMemoryDataRepository
+from app.utils.leaderboard import CompetitionLeaderboard
+from app.utils.parse_csv import series_from_bytes
+from app.utils.scoring import score_submission
+from app.utils.target_index import TargetIndex
+
+TARGET_ROWS = [10**3, 10**4, 10**5, 10**6, 10**7]
+LEADERBOARD_SUBMISSIONS = [10, 10**2, 10**3, 10**4, 10**5, 10**6]
+SUBMISSIONS_PER_PARTICIPANT = 5
+SEED = 42
+
+
+@dataclasses.dataclass
+class Measurement:
+    stage: str
+    size: int
+    seconds: float
+    peak_bytes: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.stage}[{self.size}]"
+
+
+def measure(stage: str, size: int, func: Callable[[], object], repeat: int) -> Measurement:
+    """Best latency over `repeat` runs, and peak memory of a separate traced run (tracing slows it down)"""
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Measurement(stage=stage, size=size, seconds=min(seconds), peak_bytes=peak_bytes)
+
+
+def target_stages(n_rows: int, repeat: int) -> Iterator[Measurement]:
+    rng = np.random.default_rng(SEED)
+    ser = pd.Series(rng.normal(size=n_rows), index=pd.Index(np.arange(n_rows), name="key"), name="value")
+    content = ser.to_csv().encode()
+    index = TargetIndex.from_series(series_from_bytes(content), digest="benchmark")
+    # submissions come in any order, the alignment has to look every key up
+    order = rng.permutation(n_rows)
+    keys, values = index.keys[order], index.values[order] + rng.normal(size=n_rows)
+    predicted = index.align(keys=keys, values=values)
+    evaluation = EvaluationConfig(
+        metric=EvaluationMetric.RMSE,
+        secondary_metrics=[EvaluationMetric.MAE],
+        feature_dataset_url="https://X.example.com",
+        target_dataset_url="https://y.example.com",
+    )
+
+    yield measure("series_from_bytes", n_rows, lambda: series_from_bytes(content), repeat)
+    yield measure("target_index", n_rows, lambda: TargetIndex.from_series(ser, digest="benchmark"), repeat)
+    yield measure("align", n_rows, lambda: index.align(keys=keys, values=values), repeat)
+    yield measure(
+        "rmse",
+        n_rows,
+        lambda: METRIC_LOGIC_MAP[EvaluationMetric.RMSE].func(MetricInputs(pred=predicted, actual=index.values)),
+        repeat,
+    )
+    yield measure(
+        "score_submission",
+        n_rows,
+        lambda: score_submission(pred=predicted, actual=index.values, evaluation=evaluation),
+        repeat,
+    )
+
+
+def leaderboard_stages(n_submissions: int, repeat: int) -> Iterator[Measurement]:
+    rng = np.random.default_rng(SEED)
+    n_participants = max(n_submissions // SUBMISSIONS_PER_PARTICIPANT, 1)
+    submission_results = [
+        SubmissionResult(
+            competition_id="benchmark",
+            participant_id=f"participant_{participant}",
+            submission_name=f"submission_{i}",
+            score=score,
+        )
+        for i, (participant, score) in enumerate(
+            zip(
+                rng.integers(n_participants, size=n_submissions).tolist(),
+                rng.random(size=n_submissions).tolist(),
+                strict=True,
+            )
+        )
+    ]
+    # leaderboards are rebuilt from the columns the in-memory repository keeps the results in
+    repository = InMemoryDataRepository()
+    asyncio.run(repository.set_submission_results(submission_results))
+    columns = repository.submission_result_columns("benchmark")
+    assert columns is not None
+    sort_multiplier = METRIC_LOGIC_MAP[EvaluationMetric.RMSE].sort_multiplier
+    leaderboard = CompetitionLeaderboard.from_columns(sort_multiplier, columns)
+
+    yield measure(
+        "build_leaderboard",
+        n_submissions,
+        lambda: CompetitionLeaderboard.from_columns(sort_multiplier, columns),
+        repeat,
+    )
+    yield measure(
+        "add_to_leaderboard",
+        n_submissions,
+        lambda: CompetitionLeaderboard.from_submission_results(sort_multiplier, submission_results),
+        repeat,
+    )
+    yield measure("leaderboard_page", n_submissions, lambda: leaderboard.rows(offset=0, limit=100), repeat)
+
+
+def compare(
+    measurements: list[Measurement], baseline: dict[str, dict], threshold: float, min_delta_seconds: float
+) -> list[str]:
+    """
+    Descriptions of the measurements worse than their baseline by more than `threshold`.
+    Latencies also have to be worse by more than `min_delta_seconds`, the shortest ones being mostly noise.
+    """
+    regressions = []
+    for measurement in measurements:
+        base = baseline.get(measurement.key)
+        if base is None:
+            continue
+        for field, min_delta in (("seconds", min_delta_seconds), ("peak_bytes", 0)):
+            current, previous = getattr(measurement, field), base[field]
+            if current > previous * (1 + threshold) and current - previous > min_delta:
+                regressions.append(f"{measurement.key} {field}: {previous:.6g} -> {current:.6g}")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-target-rows", type=int, default=TARGET_ROWS[-1])
+    parser.add_argument("--max-submissions", type=int, default=LEADERBOARD_SUBMISSIONS[-1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", type=Path, help="where to save the results, e.g. as a new baseline")
+    parser.add_argument("--baseline", type=Path, help="results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-delta-seconds", type=float, default=0.001)
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    measurements = []
+    runs = [(target_stages, n) for n in TARGET_ROWS if n <= args.max_target_rows] + [
+        (leaderboard_stages, n) for n in LEADERBOARD_SUBMISSIONS if n <= args.max_submissions
+    ]
+    print(f"{'stage':<40}{'seconds':>14}{'peak MiB':>12}")
+    for stages, size in runs:
+        for measurement in stages(size, repeat=args.repeat):
+            measurements.append(measurement)
+            print(f"{measurement.key:<40}{measurement.seconds:>14.6f}{measurement.peak_bytes / 1024**2:>12.2f}")
+
+    if args.save is not None:
+        results = {i.key: {"seconds": i.seconds, "peak_bytes": i.peak_bytes} for i in measurements}
+        args.save.write_text(json.dumps(results, indent=2))
+
+    if args.baseline is not None:
+        regressions = compare(
+            measurements,
+            json.loads(args.baseline.read_text()),
+            threshold=args.threshold,
+            min_delta_seconds=args.min_delta_seconds,
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
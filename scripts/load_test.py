@@ -0,0 +1,216 @@
+"""
+Load test: simulates participants submitting to the sample competition of `send_sample_data.py` and polling
+its pages, leaderboard and submission template, at a target rate of requests per second.
+
+The competition datasets are served by a local stand-in server. The app is started with the chosen backend
+(the azurite one needs `docker compose up -d`), unless `--api-root` points to one already running, which
+needs `send_sample_data.admin_id` among its ADMIN_PARTICIPANT_IDS.
+Reports the throughput, the latency percentiles and the error rate of every route.
+
+    python scripts/load_test.py --backend in-memory --participants 50 --rate 200 --duration 30
+"""
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import os
+import random
+import subprocess
+import sys
+import time
+from collections.abc import AsyncIterator, Callable, Coroutine
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+from send_sample_data import admin_id, competition
+
+import app.routes.paths as paths
+from app.constants import IN_MEMORY
+from app.models.competiton import Competition
+from app.models.submission import Submission
+
+ROOT_DIR = Path(__file__).parents[1]
+AZURITE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "TableEndpoint=http://127.0.0.1:10002/devstoreaccount1;"
+)
+BACKENDS = {"in-memory": IN_MEMORY, "azurite": AZURITE_CONNECTION_STRING}
+HEADER_KEY = "x-ms-client-principal-name"
+
+
+@dataclasses.dataclass
+class RouteStats:
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    errors: int = 0
+
+
+class LoadTest:
+    def __init__(self, session: aiohttp.ClientSession, api_root: str, competition_id: str, keys: list[str]) -> None:
+        self.session = session
+        self.api_root = api_root
+        self.competition_id = competition_id
+        self.keys = keys
+        self.stats: dict[str, RouteStats] = {}
+        self._n_submissions = 0
+
+    async def _request(self, route: str, participant_id: str, method: str = "GET", **kwargs: object) -> None:
+        url = self.api_root + route.format(competition_id=self.competition_id)
+        stats = self.stats.setdefault(f"{method} {route}", RouteStats())
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, headers={HEADER_KEY: participant_id}, **kwargs) as r:
+                await r.read()
+                failed = r.status >= 400
+        except aiohttp.ClientError:
+            failed = True
+        stats.latencies.append(time.perf_counter() - start)
+        stats.errors += failed
+
+    async def submit(self, participant_id: str) -> None:
+        self._n_submissions += 1
+        submission = Submission(
+            name=f"submission {self._n_submissions}",
+            competition_id=self.competition_id,
+            participant_id=participant_id,
+            predictions={key: random.random() for key in self.keys},
+        )
+        await self._request(paths.API_SUBMISSION_SET, participant_id, method="POST", json=submission.model_dump())
+
+    async def view_competition(self, participant_id: str) -> None:
+        await self._request(paths.WEB_COMPETITION_GET, participant_id)
+
+    async def view_leaderboard(self, participant_id: str) -> None:
+        await self._request(paths.API_LEADERBOARD_GET, participant_id)
+
+    async def get_template(self, participant_id: str) -> None:
+        await self._request(paths.API_SUBMISSION_TEMPLATE_GET, participant_id)
+
+    async def run(self, participant_ids: list[str], rate: float, duration: float, submit_share: float) -> float:
+        """
+        Starts requests at `rate` per second (open loop: they don't wait for the previous ones to complete)
+        for `duration` seconds, `submit_share` of them being submissions. Returns how long it took.
+        """
+        polls: list[Callable[[str], Coroutine[None, None, None]]] = [
+            self.view_competition,
+            self.view_leaderboard,
+            self.get_template,
+        ]
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            await asyncio.sleep(max(start + i / rate - time.perf_counter(), 0))
+            action = self.submit if random.random() < submit_share else random.choice(polls)
+            tasks.append(asyncio.create_task(action(random.choice(participant_ids))))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> str:
+        lines = [f"{'route':<60}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>10}"]
+        for route, stats in sorted(self.stats.items()):
+            p50, p95, p99 = np.percentile(stats.latencies, [50, 95, 99]) * 1000
+            n_requests = len(stats.latencies)
+            lines.append(
+                f"{route:<60}{n_requests:>10}{n_requests / elapsed:>10.1f}"
+                f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{stats.errors / n_requests:>10.1%}"
+            )
+        return "\n".join(lines)
+
+
+def _csv_handler(content: str) -> Callable[[web.Request], Coroutine[None, None, web.Response]]:
+    async def handler(_: web.Request) -> web.Response:
+        return web.Response(text=content, content_type="text/csv")
+
+    return handler
+
+
+@contextlib.asynccontextmanager
+async def serve_datasets(port: int, keys: list[str]) -> AsyncIterator[str]:
+    """Stand-in for the origin of the competition datasets, returns its root url"""
+    features = "key,x\n" + "".join(f"{key},{random.random()}\n" for key in keys)
+    target = "key,y\n" + "".join(f"{key},{random.random()}\n" for key in keys)
+    datasets = web.Application()
+    datasets.router.add_get("/features.csv", _csv_handler(features))
+    datasets.router.add_get("/target.csv", _csv_handler(target))
+    runner = web.AppRunner(datasets)
+    await runner.setup()
+    await web.TCPSite(runner, "localhost", port).start()
+    try:
+        yield f"http://localhost:{port}"
+    finally:
+        await runner.cleanup()
+
+
+@contextlib.asynccontextmanager
+async def serve_app(session: aiohttp.ClientSession, backend: str, port: int) -> AsyncIterator[str]:
+    """Starts the app with the given backend, returns its root url once it's up"""
+    env = os.environ | {"DATA_REPOSITORY_CONNECTION_STRING": BACKENDS[backend], "ADMIN_PARTICIPANT_IDS": admin_id}
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env)
+    api_root = f"http://localhost:{port}"
+    try:
+        for _ in range(100):
+            with contextlib.suppress(aiohttp.ClientError):
+                async with session.get(api_root + paths.API_COMPETITIONS_LIST) as r:
+                    if r.ok:
+                        break
+            await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("The app didn't start")
+        yield api_root
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def create_competition(session: aiohttp.ClientSession, api_root: str, datasets_root: str) -> Competition:
+    evaluation = competition.evaluation.model_copy(
+        update={
+            "feature_dataset_url": f"{datasets_root}/features.csv",
+            "target_dataset_url": f"{datasets_root}/target.csv",
+        }
+    )
+    inbound = competition.model_copy(update={"evaluation": evaluation})
+    async with session.post(
+        api_root + paths.API_COMPETITION_SET, json=inbound.model_dump(), headers={HEADER_KEY: admin_id}
+    ) as r:
+        r.raise_for_status()
+        return Competition.model_validate(await r.json())
+
+
+async def main(args: argparse.Namespace) -> None:
+    keys = [f"k{i}" for i in range(args.target_rows)]
+    participant_ids = [f"load.participant.{i}@example.com" for i in range(args.participants)]
+    connector = aiohttp.TCPConnector(limit=args.max_connections)
+    async with contextlib.AsyncExitStack() as stack:
+        session = await stack.enter_async_context(aiohttp.ClientSession(connector=connector))
+        datasets_root = await stack.enter_async_context(serve_datasets(args.datasets_port, keys))
+        api_root = args.api_root or await stack.enter_async_context(serve_app(session, args.backend, args.port))
+
+        load_test_competition = await create_competition(session, api_root, datasets_root)
+        load_test = LoadTest(session, api_root, competition_id=load_test_competition.id, keys=keys)
+        elapsed = await load_test.run(
+            participant_ids, rate=args.rate, duration=args.duration, submit_share=args.submit_share
+        )
+        print(load_test.report(elapsed))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="in-memory")
+    parser.add_argument("--api-root", help="url of an app already running, rather than starting one")
+    parser.add_argument("--port", type=int, default=8010, help="where to start the app")
+    parser.add_argument("--datasets-port", type=int, default=8011)
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=100, help="requests started per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--submit-share", type=float, default=0.1, help="fraction of the requests that submit")
+    parser.add_argument("--target-rows", type=int, default=1000)
+    parser.add_argument("--max-connections", type=int, default=100)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
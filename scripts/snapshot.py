@@ -0,0 +1,81 @@
+"""
+Dumps a data repository to a snapshot file, restores one into a repository, or copies a repository to another.
+Repositories are given by their connection string (see `DATA_REPOSITORY_CONNECTION_STRING`). The data of the
+in-memory repository only lives in the processes of the app, so it's the persistent ones (sqlite, azure) that can
+be dumped and restored. Run it as a single process, not from the app's workers.
+An in-memory deployment keeps its data in a snapshot file of its own (see `DATA_REPOSITORY_SNAPSHOT_PATH`), which
+can be restored into a persistent repository to move the event there.
+
+    python scripts/snapshot.py dump <connection string> <path>
+    python scripts/snapshot.py restore <path> <connection string>
+    python scripts/snapshot.py migrate <source connection string> <destination connection string>
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from app.settings import Settings
+from app.utils import snapshot
+from app.utils.repositories import DataRepositoryType, create_repositories
+
+
+def _repository(connection_string: str) -> DataRepositoryType:
+    settings = Settings(DATA_REPOSITORY_CONNECTION_STRING=connection_string)
+    return create_repositories(settings=settings).data_repository
+
+
+async def _ensure_empty(repository: DataRepositoryType) -> None:
+    if await repository.get_competitions():
+        sys.exit("The destination repository already has data")
+
+
+async def main(args: argparse.Namespace) -> snapshot.SnapshotCounts:
+    if args.command == "dump":
+        source = _repository(args.source)
+        try:
+            return await snapshot.dump(source, Path(args.path), batch_size=args.batch_size)
+        finally:
+            await source.close()
+
+    destination = _repository(args.destination)
+    try:
+        await _ensure_empty(destination)
+        if args.command == "restore":
+            return await snapshot.restore(destination, Path(args.path), concurrency=args.concurrency)
+
+        source = _repository(args.source)
+        try:
+            return await snapshot.migrate(source, destination, batch_size=args.batch_size, concurrency=args.concurrency)
+        finally:
+            await source.close()
+    finally:
+        await destination.close()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=snapshot.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=snapshot.DEFAULT_CONCURRENCY)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump = commands.add_parser("dump")
+    dump.add_argument("source")
+    dump.add_argument("path")
+
+    restore = commands.add_parser("restore")
+    restore.add_argument("path")
+    restore.add_argument("destination")
+
+    migrate = commands.add_parser("migrate")
+    migrate.add_argument("source")
+    migrate.add_argument("destination")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    counts = asyncio.run(main(parse_args()))
+    print(
+        f"{counts.participants} participants, {counts.competitions} competitions, "
+        f"{counts.submission_results} submission results"
+    )
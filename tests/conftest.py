@@ -1,20 +1,27 @@
 import contextlib
+from collections.abc import AsyncIterator, Iterator
 from pathlib import Path
 
 import pytest
+from aioresponses import aioresponses
 from azure.core.exceptions import HttpResponseError
 from fastapi import FastAPI
 from httpx import AsyncClient
 
 from app.app import app
-from app.constants import IN_MEMORY
+from app.constants import IN_MEMORY, SQLITE_PREFIX
 from app.models.competiton import Competition
 from app.models.participant import ParticipantId
 from app.repositories.azure_storage import TableNames, TableServiceClientFactoryType
 from app.routes import paths as p
 from app.security.azure_webapp_header import BasicHeaderSecurity
 from app.settings import Settings
+from app.utils.dataset_cache import create_dataset_cache
+from app.utils.fetcher import create_dataset_fetcher
+from app.utils.leaderboard import Leaderboards
 from app.utils.repositories import Repositories, create_repositories
+from app.utils.target_index import TargetIndexCache
+from app.utils.templates import FragmentCache
 
 TEST_DATA_FLD = Path(__file__).parent / "data"
 AZURITE_CONNECTION_STRING = (
@@ -44,6 +51,7 @@ def sample_competition_dict():
         ],
         "evaluation": {
             "metric": "rmse",
+            "secondary_metrics": [],
             "feature_dataset_url": "https://X_eval.example-site.com",
             "target_dataset_url": "https://y_eval.example-site.com",
         },
@@ -65,12 +73,33 @@ def basic_security_handler() -> BasicHeaderSecurity:
 
 
 @pytest.fixture
-def client(basic_security_handler) -> AsyncTestClient:
+def mock_http() -> Iterator[aioresponses]:
+    with aioresponses() as m:
+        yield m
+
+
+@pytest.fixture
+async def client(basic_security_handler) -> AsyncIterator[AsyncTestClient]:
+    settings = Settings(SUBMISSION_TEMPLATE_PREPARE=False)  # tests don't reach the targets unless mocked
+    app.state.settings = settings
     app.state.repos = create_repositories(settings=Settings(DATA_REPOSITORY_CONNECTION_STRING=IN_MEMORY))
+    app.state.repository_snapshot = None
     app.state.security_handler = basic_security_handler
+    app.state.dataset_fetcher = create_dataset_fetcher(settings=settings)
+    app.state.dataset_cache = create_dataset_cache(settings=settings, fetcher=app.state.dataset_fetcher)
+    app.state.dataset_mirror = None
+    app.state.target_indexes = TargetIndexCache(app.state.dataset_cache)
+    app.state.leaderboards = Leaderboards(
+        data_repository=app.state.repos.data_repository, max_age_seconds=settings.LEADERBOARD_MAX_AGE_SECONDS
+    )
+    app.state.fragments = FragmentCache()
+    app.state.scoring_queue = None
+    app.state.scoring_workers = None
     _client = AsyncTestClient(app=app, base_url="http://test")
     _client.app = app
-    return _client
+    yield _client
+    await app.state.target_indexes.close()
+    await app.state.dataset_fetcher.close()
 
 
 @pytest.fixture
@@ -82,17 +111,27 @@ async def sample_competition(client, sample_competition_dict) -> Competition:
     return Competition.model_validate(r.json()[0])
 
 
-@pytest.fixture(params=["in-memory", "azure-storage"])
-async def repositories(request) -> Repositories:
+@pytest.fixture(params=["in-memory", "azure-storage", "cached-in-memory", "sqlite"])
+async def repositories(request, tmp_path) -> AsyncIterator[Repositories]:
     repos: Repositories
     if request.param == "azure-storage":
         repos = create_repositories(settings=Settings(DATA_REPOSITORY_CONNECTION_STRING=AZURITE_CONNECTION_STRING))
         await delete_table(repos.data_repository._table_service_client_factory, TableNames.PARTICIPANT)
         await delete_table(repos.data_repository._table_service_client_factory, TableNames.COMPETITION)
         await delete_table(repos.data_repository._table_service_client_factory, TableNames.SUBMISSION_RESULT)
+        await delete_table(repos.data_repository._table_service_client_factory, TableNames.VERSION)
+    elif request.param == "sqlite":
+        repos = create_repositories(
+            settings=Settings(DATA_REPOSITORY_CONNECTION_STRING=f"{SQLITE_PREFIX}{tmp_path / 'data.sqlite'}")
+        )
+    elif request.param == "cached-in-memory":
+        repos = create_repositories(
+            settings=Settings(DATA_REPOSITORY_CONNECTION_STRING=IN_MEMORY, DATA_REPOSITORY_CACHE_MAX_ENTRIES=10)
+        )
     else:
         repos = create_repositories(settings=Settings(DATA_REPOSITORY_CONNECTION_STRING=IN_MEMORY))
-    return repos
+    yield repos
+    await repos.data_repository.close()
 
 
 async def delete_table(table_service_client_factory: TableServiceClientFactoryType, table_name: str) -> None:
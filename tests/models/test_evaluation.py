@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from app.models.evaluation import METRIC_LOGIC_MAP, EvaluationConfig, EvaluationMetric, MetricInputs
+from app.utils.scoring import UndefinedScore, score_submission
+
+REGRESSION_ACTUAL = np.array([1.0, 2.0, 4.0, 5.0])
+REGRESSION_PRED = np.array([2.0, 2.0, 3.0, 5.0])
+CLASSIFICATION_ACTUAL = np.array([0, 0, 1, 1, 1])
+CLASSIFICATION_PRED = np.array([0.1, 0.6, 0.35, 0.8, 0.9])
+
+
+@pytest.mark.parametrize(
+    "metric, pred, actual, expected",
+    [
+        (EvaluationMetric.RMSE, REGRESSION_PRED, REGRESSION_ACTUAL, 0.5**0.5),
+        (EvaluationMetric.MAE, REGRESSION_PRED, REGRESSION_ACTUAL, 0.5),
+        (EvaluationMetric.MAPE, REGRESSION_PRED, REGRESSION_ACTUAL, (1 + 0.25) / 4),
+        (EvaluationMetric.R2, REGRESSION_PRED, REGRESSION_ACTUAL, 1 - 2 / 10),
+        (
+            EvaluationMetric.LOG_LOSS,
+            CLASSIFICATION_PRED,
+            CLASSIFICATION_ACTUAL,
+            -np.mean(np.log([0.9, 0.4, 0.35, 0.8, 0.9])),
+        ),
+        (EvaluationMetric.ACCURACY, CLASSIFICATION_PRED, CLASSIFICATION_ACTUAL, 3 / 5),
+        (EvaluationMetric.F1, CLASSIFICATION_PRED, CLASSIFICATION_ACTUAL, 2 * 2 / (2 * 2 + 1 + 1)),
+        (EvaluationMetric.ROC_AUC, CLASSIFICATION_PRED, CLASSIFICATION_ACTUAL, 5 / 6),
+        (EvaluationMetric.ROC_AUC, np.array([0.5, 0.5, 0.5, 0.9]), np.array([0, 1, 0, 1]), 0.75),
+    ],
+)
+def test_metric_values(metric, pred, actual, expected):
+    actual_score = METRIC_LOGIC_MAP[metric].func(MetricInputs(pred=pred, actual=actual))
+    assert actual_score == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("metric", list(EvaluationMetric))
+def test_metrics_score_each_row_of_2d_predictions(metric):
+    rng = np.random.default_rng(0)
+    actual = rng.integers(0, 2, size=50).astype(float)
+    preds = rng.uniform(0.01, 0.99, size=(3, 50))
+
+    batch_scores = METRIC_LOGIC_MAP[metric].func(MetricInputs(pred=preds, actual=actual))
+    single_scores = [METRIC_LOGIC_MAP[metric].func(MetricInputs(pred=row, actual=actual)) for row in preds]
+
+    np.testing.assert_allclose(batch_scores, single_scores)
+
+
+def test_score_submission_returns_primary_and_finite_secondary_scores():
+    evaluation = EvaluationConfig(
+        metric=EvaluationMetric.RMSE,
+        secondary_metrics=[EvaluationMetric.MAE, EvaluationMetric.MAPE, EvaluationMetric.RMSE],
+        feature_dataset_url="",
+        target_dataset_url="",
+    )
+    score, secondary_scores = score_submission(
+        pred=np.array([1.0, 3.0]), actual=np.array([0.0, 2.0]), evaluation=evaluation
+    )
+    assert score == 1.0
+    assert secondary_scores == {EvaluationMetric.MAE: 1.0}
+
+
+def test_score_submission_raises_if_primary_score_is_undefined():
+    evaluation = EvaluationConfig(metric=EvaluationMetric.R2, feature_dataset_url="", target_dataset_url="")
+    with pytest.raises(UndefinedScore):
+        score_submission(pred=np.array([1.0, 3.0]), actual=np.array([2.0, 2.0]), evaluation=evaluation)
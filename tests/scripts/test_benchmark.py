@@ -0,0 +1,27 @@
+from scripts.benchmark import Measurement, compare
+
+BASELINE = {
+    "align[1000]": {"seconds": 0.010, "peak_bytes": 1000},
+    "rmse[1000]": {"seconds": 0.0001, "peak_bytes": 1000},
+}
+
+
+def test_compare_reports_what_got_worse_than_the_threshold():
+    measurements = [
+        Measurement(stage="align", size=1000, seconds=0.015, peak_bytes=1200),
+        Measurement(stage="rmse", size=1000, seconds=0.0001, peak_bytes=1300),
+        Measurement(stage="new_stage", size=1000, seconds=1, peak_bytes=10**9),  # not in the baseline
+    ]
+    assert compare(measurements, BASELINE, threshold=0.25, min_delta_seconds=0) == [
+        "align[1000] seconds: 0.01 -> 0.015",
+        "rmse[1000] peak_bytes: 1000 -> 1300",
+    ]
+    assert compare(measurements, BASELINE, threshold=0.5, min_delta_seconds=0) == []
+
+
+def test_compare_ignores_latencies_worse_by_less_than_the_min_delta():
+    measurements = [Measurement(stage="rmse", size=1000, seconds=0.0003, peak_bytes=1000)]
+    assert compare(measurements, BASELINE, threshold=0.25, min_delta_seconds=0.001) == []
+    assert compare(measurements, BASELINE, threshold=0.25, min_delta_seconds=0.0001) == [
+        "rmse[1000] seconds: 0.0001 -> 0.0003"
+    ]
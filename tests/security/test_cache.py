@@ -0,0 +1,38 @@
+import datetime as dt
+
+from app.models.participant import Participant, ParticipantId
+from app.security.cache import ParticipantCache
+
+
+def make_participant(participant_id: ParticipantId) -> Participant:
+    return Participant(id=participant_id, name=participant_id.title(), last_active=dt.datetime.utcnow())
+
+
+async def test_resolves_only_missing_participants_in_one_call():
+    calls = []
+
+    async def resolve(participant_ids: list[ParticipantId]) -> dict[ParticipantId, Participant]:
+        calls.append(participant_ids)
+        return {i: make_participant(i) for i in participant_ids}
+
+    cache = ParticipantCache(max_entries=2, ttl_seconds=60)
+    first = await cache.get_many(["a", "b", "a"], resolve=resolve)
+    second = await cache.get_many(["b", "c"], resolve=resolve)
+    third = await cache.get_many(["a", "c"], resolve=resolve)
+
+    assert calls == [["a", "b"], ["c"], ["a"]]  # "a" was evicted to make room for "c"
+    assert second["b"] is first["b"]
+    assert set(third) == {"a", "c"}
+
+
+async def test_expired_participants_are_resolved_again():
+    calls = []
+
+    async def resolve(participant_ids: list[ParticipantId]) -> dict[ParticipantId, Participant]:
+        calls.append(participant_ids)
+        return {i: make_participant(i) for i in participant_ids}
+
+    cache = ParticipantCache(max_entries=10, ttl_seconds=0)
+    await cache.get_many(["a"], resolve=resolve)
+    await cache.get_many(["a"], resolve=resolve)
+    assert calls == [["a"], ["a"]]
@@ -1,11 +1,21 @@
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import sqlite3
 from http import HTTPStatus
 
+import numpy as np
 import pytest
-import responses
+from yarl import URL
 
 import app.routes.paths as p
 from app.models.competiton import Competition, CompetitionInbound
-from app.models.submission import Submission
+from app.models.submission import BatchSubmission, BatchSubmissionEntry, Submission, SubmissionResult
+from app.settings import Settings
+from app.utils.dataset_mirror import DatasetMirror
+from app.utils.job_queue import ScoringJobQueue, ScoringWorkers
 from tests.conftest import ADMIN_ID, SAMPLE_ACTUAL_SER_CSV, SAMPLE_PARTICIPANT_ID, SAMPLE_UUID, make_header
 
 
@@ -45,6 +55,56 @@ async def test_list_competition_returns_sorted_by_name(client, sample_competitio
     assert [i["name"] for i in content] == [f"Comp{i}" for i in [1, 2, 3, 4, 5]]
 
 
+async def test_conditional_get_of_competitions(client, sample_competition_dict, monkeypatch):
+    r = await client.get(p.API_COMPETITIONS_LIST)
+    etag = r.headers["etag"]
+    r = await client.get(p.API_COMPETITIONS_LIST, headers={"if-none-match": etag})
+    assert r.status_code == HTTPStatus.NOT_MODIFIED
+    assert r.headers["etag"] == etag
+    assert r.content == b""
+
+    # a new build may render the same data differently
+    with monkeypatch.context() as m:
+        m.setattr(client.app.state, "build_fingerprint", "new build")
+        r = await client.get(p.API_COMPETITIONS_LIST, headers={"if-none-match": etag})
+        assert r.status_code == HTTPStatus.OK
+
+    r = await client.post(p.API_COMPETITION_SET, json=sample_competition_dict, headers=make_header(ADMIN_ID))
+    assert r.status_code == HTTPStatus.OK
+    r = await client.get(p.API_COMPETITIONS_LIST, headers={"if-none-match": etag})
+    assert r.status_code == HTTPStatus.OK
+    assert len(r.json()) == 1
+    assert r.headers["etag"] != etag
+
+
+async def test_conditional_get_of_pages(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    path = p.WEB_COMPETITION_GET.format(competition_id=sample_competition.id)
+    r = await client.get(path, headers=make_header(SAMPLE_PARTICIPANT_ID))
+    assert r.status_code == HTTPStatus.OK
+    etag = r.headers["etag"]
+
+    r = await client.get(path, headers=make_header(SAMPLE_PARTICIPANT_ID) | {"if-none-match": f'W/{etag}, "other"'})
+    assert r.status_code == HTTPStatus.NOT_MODIFIED
+    # pages depend on who is looking at them
+    r = await client.get(path, headers=make_header(ADMIN_ID) | {"if-none-match": etag})
+    assert r.status_code == HTTPStatus.OK
+
+    submission = Submission(
+        name="sample",
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        predictions={"a": 2, "b": 3},
+    )
+    r = await client.post(
+        p.API_SUBMISSION_SET, json=submission.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.NO_CONTENT
+    r = await client.get(path, headers=make_header(SAMPLE_PARTICIPANT_ID) | {"if-none-match": etag})
+    assert r.status_code == HTTPStatus.OK
+    assert "sample" in r.text
+
+
 async def test_404_if_nonexistent_competition(client):
     response = await client.get(p.API_COMPETITION_GET.format(competition_id="nope"))
     assert response.status_code == HTTPStatus.NOT_FOUND
@@ -72,13 +132,8 @@ async def test_normally_no_id_collisions(client, sample_competition_dict):
         assert r.status_code == HTTPStatus.OK
 
 
-@responses.activate
-async def test_set_submission_and_get_results(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_set_submission_and_get_results(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
 
     sample_submission = Submission(
         name="sample",
@@ -99,18 +154,14 @@ async def test_set_submission_and_get_results(client, sample_competition: Compet
             "competition_id": sample_competition.id,
             "participant_id": sample_submission.participant_id,
             "score": 1.0,
+            "secondary_scores": {},
             "submission_name": sample_submission.name,
         }
     ]
 
 
-@responses.activate
-async def test_raise_on_set_invalid_submission(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_raise_on_set_invalid_submission(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
 
     sample_submission = Submission(
         name="sample",
@@ -126,3 +177,427 @@ async def test_raise_on_set_invalid_submission(client, sample_competition: Compe
     assert (
         r.json()["detail"] == "Submission prediction keys don't match the expected ones.\nMissing {'a'}\nExtra: {'w'}"
     )
+
+
+async def test_set_asynchronous_submission(client, mock_http, sample_competition: Competition, tmp_path):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    queue = ScoringJobQueue(path=tmp_path / "queue.sqlite", max_attempts=3, lease_seconds=60)
+    client.app.state.scoring_queue = queue
+    workers = ScoringWorkers(
+        queue=queue,
+        data_repository=client.app.state.repos.data_repository,
+        target_indexes=client.app.state.target_indexes,
+        leaderboards=client.app.state.leaderboards,
+        n_processes=0,
+        poll_seconds=0,
+    )
+    sample_submission = Submission(
+        name="sample",
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        predictions={"a": 2, "b": 3},
+    )
+
+    r = await client.post(
+        p.API_SUBMISSION_SET,
+        params={"asynchronous": True},
+        json=sample_submission.model_dump(),
+        headers=make_header(SAMPLE_PARTICIPANT_ID),
+    )
+    assert r.status_code == HTTPStatus.ACCEPTED
+    job_url = p.API_SUBMISSION_JOB_GET.format(job_id=r.json()["id"])
+    assert r.json()["status"] == "queued"
+
+    r = await client.get(job_url, headers=make_header(SAMPLE_PARTICIPANT_ID))
+    assert r.json()["status"] == "queued"
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert r.json() == []
+
+    assert await workers.process_next()
+    assert not await workers.process_next()
+
+    r = await client.get(job_url, headers=make_header(SAMPLE_PARTICIPANT_ID))
+    assert (r.json()["status"], r.json()["score"]) == ("done", 1.0)
+    r = await client.get(job_url, headers=make_header(ADMIN_ID))
+    assert r.status_code == HTTPStatus.NOT_FOUND
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert [(i["submission_name"], i["score"]) for i in r.json()] == [("sample", 1.0)]
+
+
+async def test_retried_scoring_job_stores_its_result_once(
+    client, mock_http, sample_competition: Competition, tmp_path, monkeypatch
+):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    queue = ScoringJobQueue(path=tmp_path / "queue.sqlite", max_attempts=3, lease_seconds=0)
+    client.app.state.scoring_queue = queue
+    workers = ScoringWorkers(
+        queue=queue,
+        data_repository=client.app.state.repos.data_repository,
+        target_indexes=client.app.state.target_indexes,
+        leaderboards=client.app.state.leaderboards,
+        n_processes=0,
+        poll_seconds=0,
+    )
+    sample_submission = Submission(
+        name="sample",
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        predictions={"a": 2, "b": 3},
+    )
+    r = await client.post(
+        p.API_SUBMISSION_SET,
+        params={"asynchronous": True},
+        json=sample_submission.model_dump(),
+        headers=make_header(SAMPLE_PARTICIPANT_ID),
+    )
+    job_url = p.API_SUBMISSION_JOB_GET.format(job_id=r.json()["id"])
+
+    async def locked(*args: object, **kwargs: object) -> None:
+        raise sqlite3.OperationalError("database is locked")
+
+    # the result is stored, but the job fails to be completed: its lease expires and it's claimed again
+    with monkeypatch.context() as m:
+        m.setattr(queue, "complete", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            await workers.process_next()
+    assert await workers.process_next()
+
+    r = await client.get(job_url, headers=make_header(SAMPLE_PARTICIPANT_ID))
+    assert (r.json()["status"], r.json()["attempts"], r.json()["score"]) == ("done", 2, 1.0)
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert [(i["submission_name"], i["score"]) for i in r.json()] == [("sample", 1.0)]
+
+
+async def test_asynchronous_submission_requires_a_queue(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    sample_submission = Submission(
+        name="sample",
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        predictions={"a": 2, "b": 3},
+    )
+
+    r = await client.post(
+        p.API_SUBMISSION_SET,
+        params={"asynchronous": True},
+        json=sample_submission.model_dump(),
+        headers=make_header(SAMPLE_PARTICIPANT_ID),
+    )
+    assert r.status_code == HTTPStatus.BAD_REQUEST
+
+
+async def test_target_dataset_is_downloaded_once(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+
+    for name in ["first", "second"]:
+        sample_submission = Submission(
+            name=name,
+            competition_id=sample_competition.id,
+            participant_id=SAMPLE_PARTICIPANT_ID,
+            predictions={"a": 2, "b": 3},
+        )
+        r = await client.post(
+            p.API_SUBMISSION_SET, json=sample_submission.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+        )
+        assert r.status_code == HTTPStatus.NO_CONTENT
+
+    assert len(mock_http.requests[("GET", URL(sample_competition.evaluation.target_dataset_url))]) == 1
+    r = await client.get(p.API_CACHE_STATS_GET)
+    assert r.status_code == HTTPStatus.OK
+    assert r.json()["dataset"] == {
+        "hits": 1,
+        "misses": 1,
+        "revalidations": 0,
+        "evictions": 0,
+        "entries": 1,
+        "size_bytes": len(SAMPLE_ACTUAL_SER_CSV),
+        "hit_rate": 0.5,
+    }
+
+
+async def test_submission_keys_can_be_in_any_order(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+
+    sample_submission = Submission(
+        name="sample",
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        predictions={"b": 3, "a": 2},
+    )
+
+    r = await client.post(
+        p.API_SUBMISSION_SET, json=sample_submission.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.NO_CONTENT
+
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert [i["score"] for i in r.json()] == [1.0]
+
+
+def make_npz(**arrays: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+async def test_submission_template_is_prepared_and_served_as_is(client, mock_http, sample_competition_dict):
+    url = sample_competition_dict["evaluation"]["target_dataset_url"]
+    mock_http.get(url, body=SAMPLE_ACTUAL_SER_CSV)  # only downloaded once, when the competition is created
+    client.app.state.settings = Settings(SUBMISSION_TEMPLATE_PREPARE=True)
+    r = await client.post(p.API_COMPETITION_SET, json=sample_competition_dict, headers=make_header(ADMIN_ID))
+    competition_id = r.json()["id"]
+    await asyncio.gather(*client.app.state.target_indexes._preparing)
+
+    path = p.API_SUBMISSION_TEMPLATE_GET.format(competition_id=competition_id)
+    r = await client.get(path, headers={"accept-encoding": "identity"})
+    assert r.status_code == HTTPStatus.OK
+    content = r.content
+    assert r.headers["content-length"] == str(len(content))
+    assert "content-encoding" not in r.headers
+
+    r = await client.get(path, headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.content == content  # decompressed by the client
+
+    r = await client.get(path, headers={"accept-encoding": "identity", "range": "bytes=2-5"})
+    assert r.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert r.content == content[2:6]
+    assert r.headers["content-range"] == f"bytes 2-5/{len(content)}"
+
+    r = await client.get(path, headers={"accept-encoding": "identity", "range": f"bytes={len(content)}-"})
+    assert r.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+    r = await client.get(path, headers={"accept-encoding": "identity", "if-none-match": r.headers["etag"]})
+    assert r.status_code == HTTPStatus.NOT_MODIFIED
+
+
+async def test_competition_datasets_are_served_from_the_mirror(client, mock_http, sample_competition_dict, tmp_path):
+    url = sample_competition_dict["data"][0]["url"]
+    content = b"x,y\n" + b"1,2\n" * 100
+    mock_http.get(url, body=content)
+    r = await client.get(p.API_COMPETITION_DATASET_GET.format(competition_id="nope"), params={"url": url})
+    assert r.status_code == HTTPStatus.NOT_FOUND
+
+    client.app.state.dataset_mirror = DatasetMirror(
+        client.app.state.dataset_fetcher, mirror_dir=tmp_path, max_downloads=1, max_transfers=1, chunk_bytes=16
+    )
+    r = await client.post(p.API_COMPETITION_SET, json=sample_competition_dict, headers=make_header(ADMIN_ID))
+    path = p.API_COMPETITION_DATASET_GET.format(competition_id=r.json()["id"])
+    target_url = sample_competition_dict["evaluation"]["target_dataset_url"]
+    r = await client.get(path, params={"url": target_url})
+    assert r.status_code == HTTPStatus.NOT_FOUND
+
+    # the other datasets are still being mirrored, they are downloaded from their origin
+    other_url = sample_competition_dict["data"][1]["url"]
+    r = await client.get(path, params={"url": other_url}, follow_redirects=False)
+    assert r.status_code == HTTPStatus.TEMPORARY_REDIRECT
+    assert r.headers["location"] == other_url
+
+    await asyncio.gather(*client.app.state.dataset_mirror._mirroring.values())
+    r = await client.get(path, params={"url": url})
+    assert r.status_code == HTTPStatus.OK
+    assert r.content == content
+    assert r.headers["content-length"] == str(len(content))
+    expected_digest = base64.b64encode(hashlib.sha256(content).digest()).decode()
+    assert r.headers["repr-digest"] == f"sha-256=:{expected_digest}:"
+
+    r = await client.get(path, params={"url": url}, headers={"range": "bytes=4-", "if-range": r.headers["etag"]})
+    assert r.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert r.content == content[4:]
+
+    # the only transfer slot is taken: refused up front, until it's given back
+    assert client.app.state.dataset_mirror.reserve_transfer()
+    r = await client.get(path, params={"url": url})
+    assert r.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert r.headers["retry-after"] == "5"
+    client.app.state.dataset_mirror.release_transfer()
+    r = await client.get(path, params={"url": url})
+    assert r.status_code == HTTPStatus.OK
+
+
+async def test_set_binary_submission(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    params = {"name": "binary", "competition_id": sample_competition.id, "participant_id": SAMPLE_PARTICIPANT_ID}
+
+    r = await client.post(
+        p.API_SUBMISSION_BINARY_SET,
+        params=params,
+        content=make_npz(keys=np.array(["b", "a"]), values=np.array([3, 2], dtype=np.float32)),
+        headers=make_header(SAMPLE_PARTICIPANT_ID) | {"content-type": "application/x-npz"},
+    )
+    assert r.status_code == HTTPStatus.NO_CONTENT
+
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert [(i["submission_name"], i["score"]) for i in r.json()] == [("binary", 1.0)]
+
+
+@pytest.mark.parametrize(
+    "content, content_type, status_code",
+    [
+        (
+            make_npz(keys=np.array(["a", "b"]), values=np.array([1.0, 2.0])),
+            "text/csv",
+            HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+        ),
+        (b"not a npz", "application/x-npz", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b"PK\x03\x04garbage", "application/x-npz", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (make_npz(keys=np.array(["a", "b"])), "application/x-npz", HTTPStatus.UNPROCESSABLE_ENTITY),
+        (
+            make_npz(keys=np.array(["a", "b"]), values=np.array([1.0])),
+            "application/x-npz",
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+        ),
+        (
+            make_npz(keys=np.array(["a", "b"]), values=np.array([1.0, np.nan])),
+            "application/x-npz",
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+        ),
+        (make_npz(keys=np.array(["a", "c"]), values=np.array([1.0, 2.0])), "application/x-npz", HTTPStatus.BAD_REQUEST),
+    ],
+)
+async def test_raise_on_invalid_binary_submission(
+    client, mock_http, sample_competition: Competition, content, content_type, status_code
+):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    params = {"name": "binary", "competition_id": sample_competition.id, "participant_id": SAMPLE_PARTICIPANT_ID}
+
+    r = await client.post(
+        p.API_SUBMISSION_BINARY_SET,
+        params=params,
+        content=content,
+        headers=make_header(SAMPLE_PARTICIPANT_ID) | {"content-type": content_type},
+    )
+    assert r.status_code == status_code
+
+
+async def test_submission_results_include_secondary_scores(client, mock_http, sample_competition_dict):
+    sample_competition_dict["evaluation"]["secondary_metrics"] = ["mae", "r2"]
+    r = await client.post(p.API_COMPETITION_SET, json=sample_competition_dict, headers=make_header(ADMIN_ID))
+    competition = Competition.model_validate(r.json())
+    mock_http.get(competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+
+    sample_submission = Submission(
+        name="sample", competition_id=competition.id, participant_id=SAMPLE_PARTICIPANT_ID, predictions={"a": 2, "b": 3}
+    )
+    r = await client.post(
+        p.API_SUBMISSION_SET, json=sample_submission.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.NO_CONTENT
+
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=competition.id))
+    assert [(i["score"], i["secondary_scores"]) for i in r.json()] == [(1.0, {"mae": 1.0, "r2": -3.0})]
+
+    r = await client.get(p.WEB_COMPETITION_GET.format(competition_id=competition.id))
+    assert "Secondary metrics: mae, r2" in r.text
+    assert "<td>-3.000</td>" in r.text
+
+
+async def test_set_batch_submission(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    batch = BatchSubmission(
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        submissions=[
+            BatchSubmissionEntry(name="first", predictions={"a": 2, "b": 3}),
+            BatchSubmissionEntry(name="second", predictions={"b": 2, "a": 1}),
+        ],
+    )
+
+    r = await client.post(
+        p.API_SUBMISSION_BATCH_SET, json=batch.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.OK
+    assert [(i["submission_name"], i["score"]) for i in r.json()] == [("first", 1.0), ("second", 0.0)]
+
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert [(i["submission_name"], i["score"]) for i in r.json()] == [("first", 1.0), ("second", 0.0)]
+
+
+async def test_export_submission_results(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    batch = BatchSubmission(
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        submissions=[BatchSubmissionEntry(name=f"s{i}", predictions={"a": i, "b": 3}) for i in range(5)],
+    )
+    r = await client.post(
+        p.API_SUBMISSION_BATCH_SET, json=batch.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.OK
+    path = p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id)
+    expected = (await client.get(path)).json()
+
+    r = await client.get(path, params={"format": "ndjson"})
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert r.text.splitlines() == [SubmissionResult.model_validate(i).model_dump_json() for i in expected]
+    assert "etag" in r.headers
+
+    r = await client.get(path, params={"format": "csv"})
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [(i["submission_name"], float(i["score"])) for i in rows] == [
+        (i["submission_name"], i["score"]) for i in expected
+    ]
+
+    pages, cursor = [], None
+    while True:
+        r = await client.get(path, params={"limit": 2} | ({"cursor": cursor} if cursor else {}))
+        pages.append(r.json())
+        cursor = r.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert [len(i) for i in pages] == [2, 2, 1]
+    assert sum(pages, []) == expected
+
+    r = await client.get(path, params={"cursor": "not a cursor"})
+    assert r.status_code == HTTPStatus.BAD_REQUEST
+
+
+async def test_batch_submission_is_rejected_as_a_whole(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    batch = BatchSubmission(
+        competition_id=sample_competition.id,
+        participant_id=SAMPLE_PARTICIPANT_ID,
+        submissions=[
+            BatchSubmissionEntry(name="ok", predictions={"a": 2, "b": 3}),
+            BatchSubmissionEntry(name="wrong", predictions={"a": 1}),
+        ],
+    )
+
+    r = await client.post(
+        p.API_SUBMISSION_BATCH_SET, json=batch.model_dump(), headers=make_header(SAMPLE_PARTICIPANT_ID)
+    )
+    assert r.status_code == HTTPStatus.BAD_REQUEST
+    assert r.json()["detail"].startswith("Submission 'wrong': Submission prediction keys don't match")
+
+    r = await client.get(p.API_SUBMISSION_RESULT_LIST.format(competition_id=sample_competition.id))
+    assert r.json() == []
+
+
+async def test_get_leaderboard_pages(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    for participant_id, pred in [("first.one@", 1), ("second.one@", 2), ("third.one@", 0)]:
+        submission = Submission(
+            name="sample",
+            competition_id=sample_competition.id,
+            participant_id=participant_id,
+            predictions={"a": pred, "b": 2},
+        )
+        r = await client.post(p.API_SUBMISSION_SET, json=submission.model_dump(), headers=make_header(participant_id))
+        assert r.status_code == HTTPStatus.NO_CONTENT
+
+    url = p.API_LEADERBOARD_GET.format(competition_id=sample_competition.id)
+    r = await client.get(url, params={"limit": 2})
+    assert r.status_code == HTTPStatus.OK
+    assert r.json()["n_participants"] == 3
+    assert [(i["position"], i["participant_name"]) for i in r.json()["rows"]] == [(1, "First One"), (2, "Second One")]
+
+    r = await client.get(url, params={"limit": 2, "offset": 2})
+    assert [(i["position"], i["participant_name"]) for i in r.json()["rows"]] == [(3, "Third One")]
+
+    url = p.API_LEADERBOARD_PARTICIPANT_GET.format(competition_id=sample_competition.id, participant_id="third.one@")
+    r = await client.get(url, params={"neighbours": 1})
+    assert [(i["position"], i["participant_name"]) for i in r.json()["rows"]] == [(2, "Second One"), (3, "Third One")]
+
+    url = p.API_LEADERBOARD_PARTICIPANT_GET.format(competition_id=sample_competition.id, participant_id="no.one@")
+    r = await client.get(url)
+    assert r.status_code == HTTPStatus.NOT_FOUND
@@ -1,12 +1,28 @@
+import asyncio
 import datetime as dt
+import uuid
 
+import numpy as np
 import pytest
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 
 from app.models.competiton import Competition
+from app.models.evaluation import EvaluationMetric
 from app.models.participant import Participant
 from app.models.submission import SubmissionResult
-from app.repositories.common import CompetitionExists
-from app.utils.repositories import Repositories
+from app.repositories.azure_storage import (
+    MAX_WRITE_ATTEMPTS,
+    AzureStorageDataRepository,
+    TableNames,
+    participant_row_key,
+    submission_row_key,
+)
+from app.repositories.caching import CachingDataRepository
+from app.repositories.common import INITIAL_VERSION, CompetitionExists, InvalidContinuationToken
+from app.repositories.in_memory import InMemoryDataRepository, Interner, SubmissionResultColumns
+from app.settings import Settings
+from app.utils.repositories import Repositories, create_repositories
+from tests.conftest import AZURITE_CONNECTION_STRING
 
 
 @pytest.mark.integration
@@ -42,6 +58,16 @@ async def test_get_set_participant(repositories: Repositories):
     assert await repo.get_participant(participant.id) == participant
 
 
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_repository_can_be_used_after_close(repositories: Repositories):
+    participant = Participant(id="1", name="bob", last_active=dt.datetime.utcnow())
+    repo = repositories.data_repository
+    await repo.set_participant(participant)
+    await repo.close()
+    assert await repo.get_participant(participant.id) == participant
+
+
 @pytest.mark.integration
 @pytest.mark.asyncio
 async def test_set_list_submission_results(repositories: Repositories):
@@ -55,3 +81,290 @@ async def test_set_list_submission_results(repositories: Repositories):
     assert await repo.get_submission_results(submission_result.competition_id) == []
     await repo.set_submission_result(submission_result)
     assert await repo.get_submission_results(submission_result.competition_id) == [submission_result]
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_set_many_submission_results(repositories: Repositories):
+    submission_results = [
+        SubmissionResult(
+            competition_id=f"competition_{i % 2}",
+            participant_id="participant_id",
+            submission_name=f"submission_{i}",
+            score=i,
+        )
+        for i in range(150)
+    ]
+    repo = repositories.data_repository
+    await repo.set_submission_results(submission_results)
+    for competition_id in ["competition_0", "competition_1"]:
+        expected = [i for i in submission_results if i.competition_id == competition_id]
+        assert await repo.get_submission_results(competition_id) == expected
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+@pytest.mark.parametrize("wait_for_flush", [True, False])
+async def test_write_behind_submission_results(wait_for_flush: bool):
+    settings = Settings(
+        DATA_REPOSITORY_CONNECTION_STRING=AZURITE_CONNECTION_STRING,
+        SUBMISSION_RESULT_FLUSH_SECONDS=0.1,
+        SUBMISSION_RESULT_FLUSH_SIZE=10,
+        SUBMISSION_RESULT_WAIT_FOR_FLUSH=wait_for_flush,
+    )
+    repo = create_repositories(settings=settings).data_repository
+    competition_id = f"write_behind_{uuid.uuid4().hex}"
+    submission_results = [
+        SubmissionResult(
+            competition_id=competition_id, participant_id="participant_id", submission_name=f"s_{i}", score=i
+        )
+        for i in range(25)
+    ]
+
+    await asyncio.gather(*(repo.set_submission_result(i) for i in submission_results))
+    assert await repo.get_submission_results(competition_id) == submission_results
+    await repo.close()
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_versions_change_with_the_data(repositories: Repositories, sample_competition: Competition):
+    repo = repositories.data_repository
+    competitions_version = await repo.get_version()
+    submission_results_version = await repo.get_version(sample_competition.id)
+
+    await repo.set_submission_result(
+        SubmissionResult(competition_id=sample_competition.id, participant_id="p", submission_name="s", score=1)
+    )
+    assert await repo.get_version() == competitions_version
+    assert await repo.get_version(sample_competition.id) != submission_results_version
+    assert await repo.get_version("other") == submission_results_version  # never written
+
+    await repo.set_competition(sample_competition.model_copy(update={"id": str(uuid.uuid4())}))
+    assert await repo.get_version() != competitions_version
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_get_submission_results_pages(repositories: Repositories):
+    competition_id = f"paging_{uuid.uuid4().hex}"
+    submission_results = [
+        SubmissionResult(
+            competition_id=competition_id, participant_id=f"participant_{i % 3}", submission_name=f"s_{i}", score=i
+        )
+        for i in range(12)
+    ]
+    repo = repositories.data_repository
+    before = dt.datetime.utcnow()
+    for submission_result in submission_results:
+        await repo.set_submission_result(submission_result)
+
+    pages = []
+    token = None
+    while True:
+        page = await repo.get_submission_results_page(competition_id, page_size=5, continuation_token=token)
+        pages.append(page.results)
+        token = page.continuation_token
+        if token is None:
+            break
+    assert [len(i) for i in pages if i] == [5, 5, 2]
+    assert [i for page in pages for i in page] == submission_results
+
+    participant_page = await repo.get_submission_results_page(competition_id, participant_id="participant_1")
+    assert participant_page.results == submission_results[1::3]
+    assert participant_page.continuation_token is None
+
+    assert [i async for i in repo.iter_submission_results(competition_id, since=before)] == submission_results
+    assert [i async for i in repo.iter_submission_results(competition_id, until=before)] == []
+
+    with pytest.raises(InvalidContinuationToken):
+        await repo.get_submission_results_page(competition_id, continuation_token="not a token")
+
+
+@pytest.fixture
+def caching_repository() -> CachingDataRepository:
+    return CachingDataRepository(
+        repository=InMemoryDataRepository(), max_entries=2, competition_ttl_seconds=60, participant_ttl_seconds=0
+    )
+
+
+async def test_caching_repository_reads_through(caching_repository, sample_competition_dict):
+    competition = Competition.model_validate(sample_competition_dict)
+    assert await caching_repository.get_competition(competition.id) is None
+    assert await caching_repository.get_competitions() == []
+
+    await caching_repository.set_competition(competition)
+    assert await caching_repository.get_competition(competition.id) == competition
+    assert await caching_repository.get_competitions() == [competition]
+    assert await caching_repository.get_competitions() == [competition]
+
+    stats = caching_repository.stats
+    assert (stats.hits, stats.misses) == (2, 3)
+
+
+async def test_caching_repository_invalidates_competitions_on_new_version(caching_repository, sample_competition_dict):
+    competition = Competition.model_validate(sample_competition_dict)
+    await caching_repository.get_version()
+    assert await caching_repository.get_competitions() == []
+
+    # stored by another process
+    await caching_repository.repository.set_competition(competition)
+    assert await caching_repository.get_competitions() == []
+    await caching_repository.get_version()
+    assert await caching_repository.get_competitions() == [competition]
+
+
+async def test_caching_repository_evicts_and_expires(caching_repository):
+    participants = [Participant(id=str(i), name="bob", last_active=dt.datetime.utcnow()) for i in range(3)]
+    for participant in participants:
+        await caching_repository.set_participant(participant)
+    assert (caching_repository.stats.entries, caching_repository.stats.evictions) == (2, 1)
+
+    # participants expire immediately, they are read again from the wrapped repository
+    assert await caching_repository.get_participant("0") == participants[0]
+    assert await caching_repository.get_participant("0") == participants[0]
+    assert (caching_repository.stats.hits, caching_repository.stats.misses) == (0, 2)
+
+
+def test_submission_result_columns():
+    columns = SubmissionResultColumns(
+        competition_id="c", participant_ids=Interner(), submission_names=Interner(), capacity=2
+    )
+    at = dt.datetime(2024, 1, 1)
+    submission_results = [
+        SubmissionResult(
+            competition_id="c",
+            participant_id=f"participant_{i % 2}",
+            submission_name="same name",
+            score=i,
+            secondary_scores={EvaluationMetric.MAE: i / 2} if i % 3 else {},
+        )
+        for i in range(5)
+    ]
+    for i, submission_result in enumerate(submission_results):
+        columns.append(submission_result, at=at + dt.timedelta(seconds=i))
+
+    assert [columns.result(i) for i in range(len(columns))] == submission_results
+    assert columns.records(1, 4) == [i.model_dump(mode="json") for i in submission_results[1:4]]
+    np.testing.assert_array_equal(columns.scores, [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(columns.rows(participant_id="participant_1"), [1, 3])
+    np.testing.assert_array_equal(columns.rows(since=at + dt.timedelta(seconds=2)), [2, 3, 4])
+    np.testing.assert_array_equal(columns.rows(participant_id="participant_0", until=at + dt.timedelta(seconds=2)), [0])
+    assert len(columns.rows(participant_id="unknown")) == 0
+
+
+async def test_in_memory_unknown_competition_is_not_stored():
+    repo = InMemoryDataRepository()
+    assert await repo.get_submission_results("unknown") == []
+    assert (await repo.get_submission_results_page("unknown")).results == []
+    assert repo.submission_result_columns("unknown") is None
+
+
+def test_submission_row_keys_of_a_batch_sort_in_order():
+    at = dt.datetime(2024, 1, 1)
+    keys = [submission_row_key(at, seq=i) for i in range(150)]
+    assert sorted(keys) == keys
+    assert submission_row_key(at + dt.timedelta(microseconds=1)) > keys[-1]
+
+
+def test_participant_row_keys_are_prefix_free_and_legal():
+    prefix = participant_row_key("a", "")
+    assert not participant_row_key("a|b", "key").startswith(prefix)
+    assert participant_row_key("a", "key").startswith(prefix)
+    assert not any(c in participant_row_key("some/one#?@example.com", "key") for c in "/\\#?")
+
+
+class FailingTableClient:
+    """Fails the transactions including a result named "bad", or all of them with `status_code` if given"""
+
+    def __init__(self, status_code: int | None = None) -> None:
+        self.status_code = status_code
+        self.entities: list[dict] = []
+        self.versions: list[dict] = []
+
+    async def submit_transaction(self, operations: list[tuple[str, dict]]) -> None:
+        entities = [entity for _, entity in operations]
+        if self.status_code is not None or any('"bad"' in i["Data"] for i in entities):
+            error = HttpResponseError("failed")
+            error.status_code = self.status_code or 400
+            raise error
+        self.entities.extend(entities)
+
+    async def upsert_entity(self, entity: dict) -> None:
+        self.versions.append(entity)
+
+    async def get_entity(self, partition_key: str, row_key: str) -> dict:
+        for entity in reversed(self.versions):
+            if (entity["PartitionKey"], entity["RowKey"]) == (partition_key, row_key):
+                return entity
+        raise ResourceNotFoundError()
+
+
+def write_behind_repository(table_client: FailingTableClient) -> AzureStorageDataRepository:
+    repo = AzureStorageDataRepository(lambda: None, flush_seconds=60, wait_for_flush=False)  # type: ignore
+    repo._tables = {TableNames.SUBMISSION_RESULT: table_client, TableNames.VERSION: table_client}  # type: ignore
+    return repo
+
+
+async def test_write_behind_drops_results_failing_for_good_on_their_own(caplog):
+    table_client = FailingTableClient()
+    repo = write_behind_repository(table_client)
+    for name in ["good", "bad", "also good"]:
+        await repo.set_submission_result(
+            SubmissionResult(competition_id="c", participant_id="p", submission_name=name, score=0)
+        )
+
+    await repo.flush()
+    assert len(table_client.entities) == 4  # the result and its participant index entry, for both good ones
+    assert repo._pending == []
+    assert "Gave up writing a submission result after 1 attempts" in caplog.text
+    await repo.close()
+
+
+async def test_write_behind_retries_transient_failures_a_limited_number_of_times(caplog):
+    repo = write_behind_repository(FailingTableClient(status_code=503))
+    await repo.set_submission_result(
+        SubmissionResult(competition_id="c", participant_id="p", submission_name="s", score=0)
+    )
+
+    for _ in range(MAX_WRITE_ATTEMPTS - 1):
+        await repo.flush()
+        assert len(repo._pending) == 1
+    await repo.flush()
+    assert repo._pending == []
+    assert f"after {MAX_WRITE_ATTEMPTS} attempts" in caplog.text
+    await repo.close()
+
+
+async def test_write_behind_drains_only_the_competition_read():
+    table_client = FailingTableClient()
+    repo = write_behind_repository(table_client)
+    for competition_id in ["c", "c", "other"]:
+        await repo.set_submission_result(
+            SubmissionResult(competition_id=competition_id, participant_id="p", submission_name="s", score=0)
+        )
+
+    await repo._drain_competition("unrelated")
+    assert (table_client.entities, len(repo._pending)) == ([], 3)
+
+    await repo._drain_competition("c")
+    assert {i["PartitionKey"] for i in table_client.entities} == {"c"}
+    assert [i["RowKey"] for i in table_client.versions] == ["c"]
+    assert len(repo._pending) == 1 and repo._flush_timer is not None  # "other" is still written later
+    await repo.close()
+    assert len(table_client.entities) == 6
+
+
+async def test_write_behind_version_is_bumped_by_the_flush_not_read():
+    table_client = FailingTableClient()
+    repo = write_behind_repository(table_client)
+    await repo.set_submission_result(
+        SubmissionResult(competition_id="c", participant_id="p", submission_name="s", score=0)
+    )
+
+    assert await repo.get_version("c") == INITIAL_VERSION
+    assert (table_client.entities, table_client.versions) == ([], [])  # a conditional request writes nothing
+
+    await repo.flush()
+    assert await repo.get_version("c") == table_client.versions[-1]["Version"] != INITIAL_VERSION
+    await repo.close()
@@ -2,11 +2,11 @@ import io
 from http import HTTPStatus
 
 import pandas as pd
-import responses
 
 import app.routes.paths as p
 from app.models.competiton import Competition, CompetitionInbound
 from app.models.submission import Submission
+from app.settings import Settings
 from app.utils.parse_csv import series_from_bytes
 from tests.conftest import ADMIN_ID, SAMPLE_ACTUAL_SER_CSV, SAMPLE_PARTICIPANT_ID, make_header
 
@@ -75,13 +75,8 @@ async def test_browse_competition_page(client, sample_competition: Competition):
     assert sample_competition.evaluation.target_dataset_url not in response.text
 
 
-@responses.activate
-async def test_raise_on_submissions_with_wrong_keys(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_raise_on_submissions_with_wrong_keys(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
     err_msg = "Submission prediction keys don't match the expected ones.\nMissing {'b'}\nExtra: {'d'}"
 
     response = await client.post(
@@ -94,13 +89,8 @@ async def test_raise_on_submissions_with_wrong_keys(client, sample_competition:
     assert response.json()["detail"] == err_msg
 
 
-@responses.activate
-async def test_raise_on_submissions_of_invalid_data(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_raise_on_submissions_of_invalid_data(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
     err_msg = "Could not load and parse the data. Check it is formatted according to the submission template."
 
     response = await client.post(
@@ -113,13 +103,8 @@ async def test_raise_on_submissions_of_invalid_data(client, sample_competition:
     assert response.json()["detail"] == err_msg
 
 
-@responses.activate
-async def test_raise_on_submissions_null_data(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_raise_on_submissions_null_data(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
     err_msg = "Found 1 null values in the submitted data. Please fill the NaN with whichever logic you think is fit."
 
     response = await client.post(
@@ -132,13 +117,8 @@ async def test_raise_on_submissions_null_data(client, sample_competition: Compet
     assert response.json()["detail"] == err_msg
 
 
-@responses.activate
-async def test_submissions_to_leaderboard(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
-        )
-    )
+async def test_submissions_to_leaderboard(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
     participant1_id = "ann.bee@c.d"
     participant2_id = "chris.doo@c.d"
 
@@ -186,13 +166,37 @@ async def test_submissions_to_leaderboard(client, sample_competition: Competitio
     assert actual == expected
 
 
-@responses.activate
-async def test_cannot_submit_for_other_partecipants(client, sample_competition: Competition):
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV
+async def test_leaderboard_page_shows_own_row_below_the_top(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    client.app.state.settings = Settings(LEADERBOARD_PAGE_SIZE=1)
+    for participant_id, predictions in [("ann.bee@c.d", b"C1,C2\na,1\nb,2"), ("chris.doo@c.d", b"C1,C2\na,2\nb,3")]:
+        response = await client.post(
+            p.WEB_COMPETITION_SUBMIT.format(competition_id=sample_competition.id),
+            data={"name": "first"},
+            files={"predictions": ("P.csv", predictions)},
+            headers=make_header(participant_id),
         )
+        assert response.status_code == HTTPStatus.OK
+
+    response = await client.get(
+        p.WEB_COMPETITION_GET.format(competition_id=sample_competition.id), headers=make_header("chris.doo@c.d")
+    )
+    assert [i["Name"] for i in pd.read_html(io.StringIO(response.text))[0].to_dict(orient="records")] == [
+        "Ann Bee",
+        "Chris Doo",
+    ]
+
+    response = await client.get(
+        p.WEB_COMPETITION_GET.format(competition_id=sample_competition.id), headers=make_header("ann.bee@c.d")
     )
+    assert [i["Name"] for i in pd.read_html(io.StringIO(response.text))[0].to_dict(orient="records")] == ["Ann Bee"]
+    assert "2 participants in total" in response.text
+    # the top of the leaderboard was only rendered again after each submission
+    assert client.app.state.fragments.stats.misses == 3
+
+
+async def test_cannot_submit_for_other_partecipants(client, mock_http, sample_competition: Competition):
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
 
     r = await client.post(
         p.API_SUBMISSION_SET,
@@ -208,16 +212,11 @@ async def test_cannot_submit_for_other_partecipants(client, sample_competition:
     assert r.json()["detail"] == "Participant can not submit for other participants"
 
 
-@responses.activate
-async def test_can_get_submit_template(client, sample_competition: Competition):
+async def test_can_get_submit_template(client, mock_http, sample_competition: Competition):
     sample_actual_ser = pd.Series([1, 2], name="val", index=["a", "b"]).rename_axis("idx")
     expected_template_ser = sample_actual_ser.mask([True] * len(sample_actual_ser))
 
-    responses.add(
-        responses.Response(
-            method="GET", url=sample_competition.evaluation.target_dataset_url, body=sample_actual_ser.to_csv()
-        )
-    )
+    mock_http.get(sample_competition.evaluation.target_dataset_url, body=sample_actual_ser.to_csv(), repeat=True)
 
     response = await client.get(p.API_SUBMISSION_TEMPLATE_GET.format(competition_id=sample_competition.id))
     response.raise_for_status()
@@ -0,0 +1,88 @@
+import pytest
+from aioresponses import CallbackResult
+from yarl import URL
+
+from app.utils.dataset_cache import DatasetCache
+from app.utils.fetcher import DatasetFetcher
+from tests.conftest import SAMPLE_ACTUAL_SER_CSV
+
+TARGET_URL = "https://y_eval.example-site.com"
+
+
+@pytest.fixture
+async def fetcher():
+    async with DatasetFetcher(max_connections=10, max_connections_per_host=2, timeout_seconds=5) as _fetcher:
+        yield _fetcher
+
+
+def n_calls(mock_http, url: str = TARGET_URL) -> int:
+    return len(mock_http.requests.get(("GET", URL(url)), []))
+
+
+async def test_serves_fresh_entries_from_memory(mock_http, fetcher):
+    mock_http.get(TARGET_URL, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    cache = DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=60)
+
+    first = await cache.get(TARGET_URL)
+    second = await cache.get(TARGET_URL)
+
+    assert first.content == second.content == SAMPLE_ACTUAL_SER_CSV.encode()
+    assert n_calls(mock_http) == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+async def test_revalidates_stale_entries_with_etag(mock_http, fetcher):
+    def revalidate(url, headers, **kwargs) -> CallbackResult:
+        assert headers == {"If-None-Match": '"v1"'}
+        return CallbackResult(status=304)
+
+    mock_http.get(TARGET_URL, body=SAMPLE_ACTUAL_SER_CSV, headers={"ETag": '"v1"'})
+    mock_http.get(TARGET_URL, callback=revalidate)
+    cache = DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=0)
+
+    first = await cache.get(TARGET_URL)
+    second = await cache.get(TARGET_URL)
+
+    assert second.content == first.content
+    assert second.digest == first.digest
+    assert n_calls(mock_http) == 2
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.revalidations) == (1, 1, 1)
+
+
+async def test_downloads_again_if_changed_on_revalidation(mock_http, fetcher):
+    mock_http.get(TARGET_URL, body="idx,val\na,1", headers={"ETag": '"v1"'})
+    mock_http.get(TARGET_URL, body="idx,val\na,2", headers={"ETag": '"v2"'})
+    cache = DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=0)
+
+    first = await cache.get(TARGET_URL)
+    second = await cache.get(TARGET_URL)
+
+    assert second.content == b"idx,val\na,2"
+    assert second.etag == '"v2"'
+    assert second.digest != first.digest
+    assert cache.stats.misses == 2
+
+
+async def test_evicts_least_recently_used_over_byte_limit(mock_http, fetcher):
+    for i in range(3):
+        mock_http.get(f"{TARGET_URL}/{i}", body=b"x" * 10)
+    cache = DatasetCache(fetcher=fetcher, max_bytes=25, ttl_seconds=60)
+
+    for i in range(3):
+        await cache.get(f"{TARGET_URL}/{i}")
+
+    assert cache.stats.evictions == 1
+    assert cache.stats.entries == 2
+    assert cache.stats.size_bytes == 20
+
+
+async def test_disk_tier_survives_new_cache_instance(mock_http, fetcher, tmp_path):
+    mock_http.get(TARGET_URL, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    await DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=60, cache_dir=tmp_path).get(TARGET_URL)
+
+    cache = DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=60, cache_dir=tmp_path)
+    entry = await cache.get(TARGET_URL)
+
+    assert entry.content == SAMPLE_ACTUAL_SER_CSV.encode()
+    assert n_calls(mock_http) == 1
+    assert cache.stats.hits == 1
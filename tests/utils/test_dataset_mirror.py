@@ -0,0 +1,56 @@
+import asyncio
+import hashlib
+
+from app.utils.dataset_mirror import DatasetMirror
+from app.utils.fetcher import DatasetFetcher
+
+DATASET_URL = "https://X_test.example-site.com"
+CONTENT = b"0123456789" * 10
+
+
+async def test_dataset_is_mirrored_to_disk_and_read_in_parts(mock_http, tmp_path):
+    mock_http.get(DATASET_URL, body=CONTENT)
+    async with DatasetFetcher(max_connections=1, max_connections_per_host=1, timeout_seconds=1) as fetcher:
+        mirror = DatasetMirror(fetcher, mirror_dir=tmp_path, max_downloads=1, max_transfers=1, chunk_bytes=7)
+        assert await mirror.get(DATASET_URL) is None
+
+        mirror.mirror([DATASET_URL, DATASET_URL])
+        await asyncio.gather(*mirror._mirroring.values())
+        dataset = await mirror.get(DATASET_URL)
+        assert dataset is not None
+        assert (dataset.size, dataset.sha256) == (len(CONTENT), hashlib.sha256(CONTENT).hexdigest())
+        assert b"".join([i async for i in mirror.read(dataset, start=5, stop=25)]) == CONTENT[5:25]
+
+        # found on disk by other processes, or after a restart
+        other_mirror = DatasetMirror(fetcher, mirror_dir=tmp_path, max_downloads=1, max_transfers=1, chunk_bytes=7)
+        assert await other_mirror.get(DATASET_URL) == dataset
+        assert sorted(i.suffix for i in tmp_path.iterdir()) == [".data", ".json", ".lock"]
+
+
+async def test_dataset_failing_to_be_mirrored_is_not_visible(mock_http, tmp_path, caplog):
+    mock_http.get(DATASET_URL, status=500)
+    async with DatasetFetcher(max_connections=1, max_connections_per_host=1, timeout_seconds=1) as fetcher:
+        mirror = DatasetMirror(fetcher, mirror_dir=tmp_path, max_downloads=1, max_transfers=1, chunk_bytes=7)
+        mirror.mirror([DATASET_URL])
+        await asyncio.gather(*mirror._mirroring.values())
+        assert await mirror.get(DATASET_URL) is None
+        assert [i.suffix for i in tmp_path.iterdir()] == [".lock"]
+        assert f"Failed to mirror {DATASET_URL}" in caplog.text
+
+
+async def test_dataset_is_downloaded_once_by_processes_sharing_the_mirror(mock_http, tmp_path):
+    mock_http.get(DATASET_URL, body=CONTENT, repeat=True)
+    async with DatasetFetcher(max_connections=2, max_connections_per_host=2, timeout_seconds=1) as fetcher:
+        mirrors = [
+            DatasetMirror(
+                fetcher, mirror_dir=tmp_path, max_downloads=1, max_transfers=1, chunk_bytes=7, lock_poll_seconds=0.01
+            )
+            for _ in range(2)
+        ]
+        for mirror in mirrors:
+            mirror.mirror([DATASET_URL])
+        await asyncio.gather(*(task for mirror in mirrors for task in mirror._mirroring.values()))
+        datasets = [await mirror.get(DATASET_URL) for mirror in mirrors]
+        assert datasets[0] is not None
+        assert datasets[0] == datasets[1]
+        assert sum(len(i) for i in mock_http.requests.values()) == 1
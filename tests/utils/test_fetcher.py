@@ -0,0 +1,68 @@
+import asyncio
+
+import aiohttp
+import pytest
+from yarl import URL
+
+from app.utils.dataset_cache import DatasetCache
+from app.utils.fetcher import DatasetFetcher, SingleFlight
+from tests.conftest import SAMPLE_ACTUAL_SER_CSV
+
+TARGET_URL = "https://y_eval.example-site.com"
+
+
+async def test_single_flight_coalesces_concurrent_calls():
+    n_executions = 0
+
+    async def work() -> int:
+        nonlocal n_executions
+        n_executions += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    single_flight: SingleFlight[int] = SingleFlight()
+    results = await asyncio.gather(*[single_flight.run("key", work) for _ in range(10)])
+
+    assert results == [42] * 10
+    assert n_executions == 1
+
+    assert await single_flight.run("key", work) == 42
+    assert n_executions == 2
+
+
+async def test_single_flight_shares_exceptions():
+    async def work() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    single_flight: SingleFlight[int] = SingleFlight()
+    results = await asyncio.gather(*[single_flight.run("key", work) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_concurrent_cache_misses_download_once(mock_http):
+    mock_http.get(TARGET_URL, body=SAMPLE_ACTUAL_SER_CSV, repeat=True)
+    async with DatasetFetcher(max_connections=10, max_connections_per_host=2, timeout_seconds=5) as fetcher:
+        cache = DatasetCache(fetcher=fetcher, max_bytes=1024, ttl_seconds=60)
+        entries = await asyncio.gather(*[cache.get(TARGET_URL) for _ in range(20)])
+
+    assert {e.digest for e in entries} == {entries[0].digest}
+    assert len(mock_http.requests[("GET", URL(TARGET_URL))]) == 1
+    assert cache.stats.misses == 1
+
+
+async def test_fetch_raises_on_error_status(mock_http):
+    mock_http.get(TARGET_URL, status=404)
+    async with DatasetFetcher(max_connections=10, max_connections_per_host=2, timeout_seconds=5) as fetcher:
+        with pytest.raises(aiohttp.ClientResponseError):
+            await fetcher.fetch(TARGET_URL)
+
+
+async def test_fetch_respects_deadline(mock_http):
+    async def slow_response(url, **kwargs) -> None:
+        await asyncio.sleep(1)
+
+    mock_http.get(TARGET_URL, callback=slow_response)
+    async with DatasetFetcher(max_connections=10, max_connections_per_host=2, timeout_seconds=0.05) as fetcher:
+        with pytest.raises(TimeoutError):
+            await fetcher.fetch(TARGET_URL)
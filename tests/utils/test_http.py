@@ -0,0 +1,53 @@
+import pytest
+
+from app.utils.http import RangeNotSatisfiable, accepts_gzip, build_fingerprint, etag_matches, parse_byte_range
+
+
+@pytest.mark.parametrize(
+    "range_header, expected",
+    [
+        (None, None),
+        ("bytes=0-3", (0, 4)),
+        ("bytes=5-", (5, 10)),
+        ("bytes=-3", (7, 10)),
+        ("bytes=-30", (0, 10)),
+        ("bytes=8-30", (8, 10)),
+        ("bytes=4-2", None),
+        ("bytes=0-1,4-5", None),
+        ("lines=0-1", None),
+    ],
+)
+def test_parse_byte_range(range_header, expected):
+    assert parse_byte_range(range_header, size=10) == expected
+
+
+def test_unsatisfiable_byte_range():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range("bytes=10-", size=10)
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, *;q=0.5")
+    assert not accepts_gzip("gzip;q=0, deflate")
+    assert not accepts_gzip(None)
+
+
+def test_etag_matches():
+    assert etag_matches('W/"a", "b"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+
+def test_build_fingerprint(tmp_path):
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "home.html").write_text("<p>hello</p>")
+    (tmp_path / "__pycache__").mkdir()
+    fingerprint = build_fingerprint(tmp_path)
+
+    (tmp_path / "__pycache__" / "main.cpython-311.pyc").write_bytes(b"compiled")
+    assert build_fingerprint(tmp_path) == fingerprint
+
+    (tmp_path / "templates" / "home.html").write_text("<p>hello!</p>")
+    assert build_fingerprint(tmp_path) != fingerprint
@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import UploadFile
+
+from app.utils.ingestion import (
+    ARROW_STREAM_MEDIA_TYPE,
+    InvalidSubmissionData,
+    NullPredictions,
+    SubmissionTooLarge,
+    columns_from_bytes,
+    columns_from_npz,
+    read_aligned_predictions,
+)
+from app.utils.parse_csv import series_from_bytes
+from app.utils.target_index import KeyMismatch, TargetIndex
+
+N_ROWS = 1000
+
+
+@pytest.fixture
+def target() -> TargetIndex:
+    keys = [f"k{i}" for i in range(N_ROWS)]
+    return TargetIndex.from_series(pd.Series(np.arange(N_ROWS, dtype=float), index=keys), digest="v1")
+
+
+def make_upload(rows: list[tuple[str, str]], header: str = "id,value") -> UploadFile:
+    content = "\n".join([header, *[f"{k},{v}" for k, v in rows]]).encode()
+    return UploadFile(file=io.BytesIO(content))
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1024**2])
+async def test_reads_shuffled_rows_in_target_order(target, chunk_size):
+    order = np.random.default_rng(0).permutation(N_ROWS)
+    upload = make_upload([(f"k{i}", str(i * 2)) for i in order])
+
+    actual = await read_aligned_predictions(upload, target=target, chunk_size=chunk_size, max_bytes=1024**2)
+
+    np.testing.assert_array_equal(actual, np.arange(N_ROWS) * 2.0)
+
+
+async def test_keys_are_matched_as_written_in_the_target():
+    target = TargetIndex.from_series(series_from_bytes(b"key,y\n01,1\n1.50,2\n2,3\n"), digest="v1")
+    upload = make_upload([("2", "30"), ("1.50", "20"), ("01", "10")])
+
+    actual = await read_aligned_predictions(upload, target=target, chunk_size=1024, max_bytes=1024**2)
+
+    np.testing.assert_array_equal(actual, [10.0, 20.0, 30.0])
+    with pytest.raises(KeyMismatch):
+        await read_aligned_predictions(
+            make_upload([("1", "10"), ("1.5", "20"), ("2", "30")]), target=target, chunk_size=1024, max_bytes=1024**2
+        )
+
+
+async def test_stops_at_size_limit(target):
+    upload = make_upload([(f"k{i}", "1") for i in range(N_ROWS)])
+    with pytest.raises(SubmissionTooLarge):
+        await read_aligned_predictions(upload, target=target, chunk_size=64, max_bytes=100)
+
+    assert upload.file.tell() < 200
+
+
+async def test_stops_at_first_block_with_nulls(target):
+    rows = [(f"k{i}", "" if i == 5 else "1") for i in range(N_ROWS)]
+    upload = make_upload(rows)
+    with pytest.raises(NullPredictions) as e:
+        await read_aligned_predictions(upload, target=target, chunk_size=64, max_bytes=1024**2)
+
+    assert e.value.n_nulls == 1
+    assert upload.file.tell() < 200
+
+
+@pytest.mark.parametrize("content", [b"", b"not a csv", b"id,value\nk1,abc"])
+async def test_raises_on_invalid_data(target, content):
+    with pytest.raises(InvalidSubmissionData):
+        await read_aligned_predictions(
+            UploadFile(file=io.BytesIO(content)), target=target, chunk_size=64, max_bytes=1024**2
+        )
+
+
+async def test_reports_all_key_mismatches(target):
+    rows = [(f"k{i}", "1") for i in range(N_ROWS - 1)] + [(f"x{i}", "1") for i in range(20)] + [("k0", "1")]
+    with pytest.raises(KeyMismatch) as e:
+        await read_aligned_predictions(make_upload(rows), target=target, chunk_size=64, max_bytes=1024**2)
+
+    assert e.value.missing.tolist() == [f"k{N_ROWS - 1}"]
+    assert e.value.duplicated.tolist() == ["k0"]
+    assert e.value.n_extra == 20
+    assert len(e.value.extra) == 10
+
+
+@pytest.mark.parametrize("corrupt", [lambda c: c[: len(c) // 2], lambda c: c[:60] + bytes(len(c) - 60)])
+def test_corrupt_npz_is_invalid_submission_data(corrupt):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, keys=np.array(["a", "b"] * 100), values=np.arange(200.0))
+    for content in (b"PK\x03\x04garbage", corrupt(buffer.getvalue())):
+        with pytest.raises(InvalidSubmissionData):
+            columns_from_npz(content)
+
+
+def test_columns_from_arrow_stream():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({"keys": ["a", "b"], "values": np.array([1.0, 2.0])})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    keys, values = columns_from_bytes(sink.getvalue().to_pybytes(), media_type=ARROW_STREAM_MEDIA_TYPE)
+
+    assert keys.tolist() == ["a", "b"]
+    assert values.tolist() == [1.0, 2.0]
@@ -0,0 +1,123 @@
+import asyncio
+import datetime as dt
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.models.job import ScoringJobStatus
+from app.repositories.in_memory import InMemoryDataRepository
+from app.utils.job_queue import _SCHEMA, ScoringJobQueue, ScoringWorkers
+
+JOB_KWARGS = {"competition_id": "c", "participant_id": "p", "submission_name": "s", "target_digest": "d"}
+
+
+@pytest.fixture
+def queue(tmp_path) -> ScoringJobQueue:
+    return ScoringJobQueue(path=tmp_path / "queue.sqlite", max_attempts=2, lease_seconds=60)
+
+
+async def test_claims_jobs_in_order_with_their_predictions(queue):
+    first = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0, 2.0]))
+    second = await queue.enqueue(**JOB_KWARGS, predicted=np.array([3.0]))
+
+    claimed = await queue.claim()
+    assert claimed is not None
+    job, digest, predicted = claimed
+    assert (job.id, job.status, job.attempts, digest) == (first.id, ScoringJobStatus.RUNNING, 1, "d")
+    np.testing.assert_array_equal(predicted, [1.0, 2.0])
+
+    claimed = await queue.claim()
+    assert claimed is not None and claimed[0].id == second.id
+    assert await queue.claim() is None
+
+
+async def test_complete_job(queue):
+    job = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0]))
+    await queue.claim()
+    await queue.complete(job.id, score=0.5)
+
+    done = await queue.get(job.id)
+    assert done is not None
+    assert (done.status, done.score) == (ScoringJobStatus.DONE, 0.5)
+
+
+async def test_failed_jobs_are_retried_until_out_of_attempts(queue):
+    job = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0]))
+
+    await queue.claim()
+    await queue.fail(job.id, error="boom")
+    retried = await queue.get(job.id)
+    assert retried is not None and retried.status == ScoringJobStatus.QUEUED
+
+    await queue.claim()
+    await queue.fail(job.id, error="boom")
+    failed = await queue.get(job.id)
+    assert failed is not None
+    assert (failed.status, failed.attempts, failed.error) == (ScoringJobStatus.FAILED, 2, "boom")
+    assert await queue.claim() is None
+
+
+async def test_permanent_failures_are_not_retried(queue):
+    job = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0]))
+    await queue.claim()
+    await queue.fail(job.id, error="nope", retry=False)
+
+    failed = await queue.get(job.id)
+    assert failed is not None and failed.status == ScoringJobStatus.FAILED
+    assert await queue.claim() is None
+
+
+async def test_jobs_with_expired_lease_are_claimed_again(tmp_path):
+    queue = ScoringJobQueue(path=tmp_path / "queue.sqlite", max_attempts=2, lease_seconds=-1)
+    job = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0]))
+
+    await queue.claim()
+    claimed = await queue.claim()
+    assert claimed is not None
+    assert (claimed[0].id, claimed[0].attempts) == (job.id, 2)
+
+    assert await queue.claim() is None
+    timed_out = await queue.get(job.id)
+    assert timed_out is not None and timed_out.status == ScoringJobStatus.FAILED
+
+
+async def test_storing_since_of_a_queue_created_before_it_was_recorded(tmp_path):
+    path = tmp_path / "queue.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(_SCHEMA.replace(",\n    storing_since TEXT", ""))
+    queue = ScoringJobQueue(path=path, max_attempts=2, lease_seconds=60)
+    job = await queue.enqueue(**JOB_KWARGS, predicted=np.array([1.0]))
+    assert await queue.storing_since(job.id) is None
+
+    before = dt.datetime.utcnow()
+    await queue.mark_storing(job.id)
+    since = await queue.storing_since(job.id)
+    assert since is not None and before <= since <= dt.datetime.utcnow()
+
+
+async def test_a_single_process_scores_the_jobs(queue):
+    def _workers() -> ScoringWorkers:
+        # stand-ins for the workers of two app processes, on the same queue
+        return ScoringWorkers(
+            queue=queue,
+            data_repository=InMemoryDataRepository(),
+            target_indexes=None,  # type: ignore
+            leaderboards=None,  # type: ignore
+            n_processes=0,
+            poll_seconds=60,
+            lock_poll_seconds=0.01,
+        )
+
+    first, second = _workers(), _workers()
+    first.start()
+    await asyncio.sleep(0.05)
+    second.start()
+    await asyncio.sleep(0.05)
+    assert (first.is_scoring, second.is_scoring) == (True, False)
+
+    # the other one takes over once the first one stops
+    await first.stop()
+    await asyncio.sleep(0.05)
+    assert (first.is_scoring, second.is_scoring) == (False, True)
+    await second.stop()
@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from app.models.competiton import Competition
+from app.models.submission import SubmissionResult
+from app.repositories.in_memory import InMemoryDataRepository
+from app.utils.leaderboard import CompetitionLeaderboard, Leaderboards, SortedKeyList
+
+
+def make_result(participant_id: str, score: float, name: str = "s", competition_id: str = "c") -> SubmissionResult:
+    return SubmissionResult(
+        competition_id=competition_id, participant_id=participant_id, submission_name=name, score=score
+    )
+
+
+def test_sorted_key_list_matches_sorted():
+    rng = random.Random(0)
+    keys = SortedKeyList(bucket_size=4)
+    expected: list = []
+    for i in range(300):
+        key = (rng.random(), i, str(i))
+        keys.add(key)
+        expected.append(key)
+        if i % 3 == 0:
+            removed = expected.pop(rng.randrange(len(expected)))
+            keys.remove(removed)
+
+    expected.sort()
+    assert list(keys) == expected
+    assert len(keys) == len(expected)
+    assert list(keys.islice(17, 45)) == expected[17:45]
+    assert list(keys.islice(190)) == expected[190:]
+    assert [keys.index(k) for k in expected[::25]] == list(range(0, len(expected), 25))
+
+
+@pytest.mark.parametrize("sort_multiplier", [-1, 1])
+async def test_leaderboard_from_columns_matches_from_submission_results(sort_multiplier):
+    rng = random.Random(0)
+    repo = InMemoryDataRepository()
+    results = [
+        SubmissionResult(
+            competition_id="c",
+            participant_id=f"p{rng.randrange(20)}",
+            submission_name=f"s{i}",
+            score=rng.randrange(10),  # plenty of ties
+            secondary_scores={"mae": i} if i % 2 else {},
+        )
+        for i in range(300)
+    ]
+    await repo.set_submission_results(results)
+    columns = repo.submission_result_columns("c")
+    assert columns is not None
+
+    expected = CompetitionLeaderboard.from_submission_results(sort_multiplier, results)
+    leaderboard = CompetitionLeaderboard.from_columns(sort_multiplier, columns)
+    assert leaderboard.rows() == expected.rows()
+
+    # and it keeps being updated the same way
+    for leaderboard_ in (leaderboard, expected):
+        leaderboard_.add(make_result("new", score=5))
+        leaderboard_.add(make_result("p1", score=-sort_multiplier * 100))
+    assert leaderboard.rows() == expected.rows()
+
+
+def test_leaderboard_keeps_best_score_and_entries():
+    leaderboard = CompetitionLeaderboard.from_submission_results(
+        sort_multiplier=-1,
+        submission_results=[
+            make_result("p1", 3.0, name="first"),
+            make_result("p2", 2.0),
+            make_result("p1", 1.0, name="second"),
+            make_result("p1", 5.0, name="third"),
+            make_result("p3", 2.0),
+        ],
+    )
+
+    rows = [(position, e.participant_id, e.best_submission_name, e.n_entries) for position, e in leaderboard.rows()]
+    assert rows == [(1, "p1", "second", 3), (2, "p2", "s", 1), (3, "p3", "s", 1)]
+    assert leaderboard.position("p3") == 3
+    assert leaderboard.position("unknown") is None
+    assert [e.participant_id for _, e in leaderboard.rows(offset=1, limit=1)] == ["p2"]
+    assert [position for position, _ in leaderboard.around("p2", neighbours=1)] == [1, 2, 3]
+    assert [position for position, _ in leaderboard.around("p1", neighbours=1)] == [1, 2]
+    assert leaderboard.around("unknown", neighbours=1) is None
+
+
+def test_higher_is_better_leaderboard():
+    leaderboard = CompetitionLeaderboard.from_submission_results(
+        sort_multiplier=1, submission_results=[make_result("p1", 0.5), make_result("p2", 0.9)]
+    )
+    assert [e.participant_id for _, e in leaderboard.rows()] == ["p2", "p1"]
+
+
+@pytest.fixture
+async def repo_and_competition(sample_competition_dict) -> tuple[InMemoryDataRepository, Competition]:
+    repo = InMemoryDataRepository()
+    competition = Competition.model_validate(sample_competition_dict)
+    await repo.set_competition(competition)
+    return repo, competition
+
+
+async def test_leaderboards_are_built_from_the_repository_and_updated(repo_and_competition):
+    repo, competition = repo_and_competition
+    await repo.set_submission_result(make_result("p1", 2.0, competition_id=competition.id))
+    leaderboards = Leaderboards(data_repository=repo, max_age_seconds=60)
+    await leaderboards.rebuild_all()
+
+    new_result = make_result("p2", 1.0, competition_id=competition.id)
+    await repo.set_submission_result(new_result)
+    leaderboards.add([new_result])
+
+    leaderboard = await leaderboards.get(competition)
+    assert [e.participant_id for _, e in leaderboard.rows()] == ["p2", "p1"]
+    assert await leaderboards.get(competition) is leaderboard
+
+
+async def test_leaderboards_are_rebuilt_when_too_old(repo_and_competition):
+    repo, competition = repo_and_competition
+    leaderboards = Leaderboards(data_repository=repo, max_age_seconds=0)
+    assert not len(await leaderboards.get(competition))
+
+    # e.g. stored by another process
+    await repo.set_submission_result(make_result("p1", 2.0, competition_id=competition.id))
+    assert len(await leaderboards.get(competition)) == 1
@@ -0,0 +1,126 @@
+import datetime as dt
+import gzip
+
+import pytest
+
+from app.constants import SQLITE_PREFIX
+from app.models.competiton import Competition
+from app.models.evaluation import EvaluationMetric
+from app.models.participant import Participant
+from app.models.submission import SubmissionResult
+from app.repositories.in_memory import InMemoryDataRepository
+from app.settings import Settings
+from app.utils import snapshot
+from app.utils.repositories import DataRepositoryType, create_repositories
+
+
+async def _fill(repository: DataRepositoryType, sample_competition_dict: dict) -> None:
+    await repository.set_participant(Participant(id="1", name="bob", last_active=dt.datetime(2024, 1, 1)))
+    for i in range(3):
+        competition = Competition.model_validate({**sample_competition_dict, "id": f"competition_{i}"})
+        await repository.set_competition(competition)
+        await repository.set_submission_results(
+            [
+                SubmissionResult(
+                    competition_id=competition.id,
+                    participant_id=f"participant_{j % 4}",
+                    submission_name=f"s_{j}",
+                    score=j,
+                    secondary_scores={EvaluationMetric.MAE: j / 2} if j % 2 else {},
+                )
+                for j in range(i * 10)
+            ]
+        )
+
+
+async def _assert_same_data(repository: DataRepositoryType, other: DataRepositoryType) -> None:
+    assert await repository.get_participants() == await other.get_participants()
+    assert await repository.get_competitions() == await other.get_competitions()
+    for competition in await repository.get_competitions():
+        results = [i async for i in repository.iter_stored_submission_results(competition.id)]
+        assert [i async for i in other.iter_stored_submission_results(competition.id)] == results
+
+
+async def test_dump_restore_round_trip(tmp_path, sample_competition_dict):
+    repository = InMemoryDataRepository()
+    await _fill(repository, sample_competition_dict)
+    path = tmp_path / "data.snapshot"
+
+    counts = await snapshot.dump(repository, path, batch_size=4)
+    assert counts == snapshot.SnapshotCounts(participants=1, competitions=3, submission_results=30)
+    assert [i.name for i in tmp_path.iterdir()] == [path.name]
+
+    restored_at = dt.datetime.utcnow()
+    restored = InMemoryDataRepository()
+    assert await snapshot.restore(restored, path, concurrency=2) == counts
+    await _assert_same_data(repository, restored)
+
+    # the time filters still apply to when the results were originally stored
+    before_restore = [i async for i in restored.iter_submission_results("competition_1", until=restored_at)]
+    assert before_restore == await repository.get_submission_results("competition_1")
+
+
+async def test_truncated_snapshot_is_rejected(tmp_path, sample_competition_dict):
+    repository = InMemoryDataRepository()
+    await _fill(repository, sample_competition_dict)
+    path = tmp_path / "data.snapshot"
+    await snapshot.dump(repository, path)
+
+    content = gzip.decompress(path.read_bytes())
+    path.write_bytes(gzip.compress(content[:-10]))
+    with pytest.raises(snapshot.InvalidSnapshot):
+        await snapshot.restore(InMemoryDataRepository(), path)
+
+    path.write_bytes(gzip.compress(b"not a snapshot"))
+    with pytest.raises(snapshot.InvalidSnapshot):
+        await snapshot.restore(InMemoryDataRepository(), path)
+
+
+async def test_migrate_between_backends(tmp_path, sample_competition_dict):
+    source = InMemoryDataRepository()
+    await _fill(source, sample_competition_dict)
+    settings = Settings(DATA_REPOSITORY_CONNECTION_STRING=f"{SQLITE_PREFIX}{tmp_path / 'data.sqlite'}")
+    destination = create_repositories(settings=settings).data_repository
+
+    counts = await snapshot.migrate(source, destination, batch_size=3, concurrency=2)
+    assert counts == snapshot.SnapshotCounts(participants=1, competitions=3, submission_results=30)
+    await _assert_same_data(source, destination)
+    await destination.close()
+
+
+async def test_repository_snapshot_is_dumped_by_a_single_process(tmp_path, sample_competition_dict):
+    path = tmp_path / "data.snapshot"
+    # stand-ins for the repositories of two processes of the app
+    first = snapshot.RepositorySnapshot(InMemoryDataRepository(), path)
+    second = snapshot.RepositorySnapshot(InMemoryDataRepository(), path)
+    await first.start()
+    await second.start()
+    assert (first.is_dumping, second.is_dumping) == (True, False)
+
+    await _fill(first.repository, sample_competition_dict)
+    await second.repository.set_participant(Participant(id="2", name="alice", last_active=dt.datetime(2024, 1, 1)))
+    await second.stop()
+    assert not path.exists()
+    await first.stop()
+
+    # restored when the app starts again
+    restarted = snapshot.RepositorySnapshot(InMemoryDataRepository(), path)
+    await restarted.start()
+    assert restarted.is_dumping
+    await _assert_same_data(first.repository, restarted.repository)
+    await restarted.stop()
+
+
+async def test_repository_snapshot_is_only_for_the_in_memory_repository(tmp_path):
+    settings = Settings(DATA_REPOSITORY_SNAPSHOT_PATH=str(tmp_path / "data.snapshot"))
+    repository = create_repositories(settings=settings).data_repository
+    assert snapshot.create_repository_snapshot(settings, repository) is not None
+
+    settings = Settings(
+        DATA_REPOSITORY_SNAPSHOT_PATH=str(tmp_path / "data.snapshot"),
+        DATA_REPOSITORY_CONNECTION_STRING=f"{SQLITE_PREFIX}{tmp_path / 'data.sqlite'}",
+    )
+    repository = create_repositories(settings=settings).data_repository
+    with pytest.raises(ValueError):
+        snapshot.create_repository_snapshot(settings, repository)
+    await repository.close()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.target_index import KeyMismatch, TargetIndex
+
+
+@pytest.fixture
+def target() -> TargetIndex:
+    ser = pd.Series([1.0, 2.0, 3.0], index=pd.Index(["c", "a", "b"], name="idx"), name="val")
+    return TargetIndex.from_series(ser, digest="v1")
+
+
+def test_align_same_order(target):
+    actual = target.align(keys=np.array(["c", "a", "b"]), values=np.array([10, 20, 30]))
+    np.testing.assert_array_equal(actual, [10.0, 20.0, 30.0])
+
+
+def test_align_reorders_to_target_order(target):
+    actual = target.align(keys=np.array(["a", "b", "c"]), values=np.array([20, 30, 10]))
+    np.testing.assert_array_equal(actual, [10.0, 20.0, 30.0])
+
+
+def test_align_normalises_keys_to_strings():
+    target = TargetIndex.from_series(pd.Series([1.0, 2.0], index=[10, 20]), digest="v1")
+    actual = target.align(keys=np.array(["20", "10"]), values=np.array([2.0, 1.0]))
+    np.testing.assert_array_equal(actual, [1.0, 2.0])
+
+
+@pytest.mark.parametrize(
+    "keys, missing, extra, duplicated",
+    [
+        (["a", "b"], ["c"], [], []),
+        (["a", "b", "c", "d"], [], ["d"], []),
+        (["a", "b", "b"], ["c"], [], ["b"]),
+        (["x", "y", "z"], ["c", "a", "b"], ["x", "y", "z"], []),
+    ],
+)
+def test_align_raises_on_key_mismatch(target, keys, missing, extra, duplicated):
+    with pytest.raises(KeyMismatch) as e:
+        target.align(keys=np.array(keys), values=np.ones(len(keys)))
+
+    assert e.value.missing.tolist() == missing
+    assert e.value.extra.tolist() == extra
+    assert e.value.duplicated.tolist() == duplicated
+
+
+def test_key_mismatch_message_is_truncated():
+    e = KeyMismatch(missing=np.array([str(i) for i in range(25)]), extra=np.array([]), duplicated=np.array([]))
+    assert str(e).splitlines()[1].endswith("and 15 more")
+    assert str(e).splitlines()[2] == "Extra: set()"
+
+
+def test_template_csv(target):
+    assert target.to_template_csv() == "idx,val\nc,\na,\nb,\n"
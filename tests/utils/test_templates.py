@@ -0,0 +1,31 @@
+import asyncio
+
+from jinja2 import DictLoader, Environment, FileSystemBytecodeCache
+
+from app.utils.templates import FragmentCache, precompile_templates
+
+
+async def test_fragment_cache_renders_once_per_version():
+    n_renders = 0
+
+    async def render() -> str:
+        nonlocal n_renders
+        n_renders += 1
+        await asyncio.sleep(0.01)
+        return f"<td>{n_renders}</td>"
+
+    fragments = FragmentCache()
+    assert await asyncio.gather(*[fragments.get("key", "v1", render) for _ in range(5)]) == ["<td>1</td>"] * 5
+    assert await fragments.get("key", "v1", render) == "<td>1</td>"
+    assert await fragments.get("key", "v2", render) == "<td>2</td>"
+    assert (fragments.stats.hits, fragments.stats.entries) == (1, 1)
+
+
+def test_precompiled_templates_are_stored_in_the_bytecode_cache(tmp_path):
+    env = Environment(
+        loader=DictLoader({"page.html": "{{ 1 + 1 }}", "style.css": ""}),
+        bytecode_cache=FileSystemBytecodeCache(directory=str(tmp_path)),
+    )
+    precompile_templates(env)
+    assert len(list(tmp_path.iterdir())) == 1
+    assert env.get_template("page.html").render() == "2"